@@ -0,0 +1,311 @@
+"""
+mca_area_extraction.py
+
+Surface extraction over arbitrary bounding boxes that can span many
+``r.<rx>.<rz>.mca`` region files.
+
+Chunks are grouped per region file and decoded in batches on a process
+pool; results come back in chunk order and are pasted into one mosaic
+heightmap / block-id grid. Chunks that are not generated (or whose region
+file does not exist) are listed in ``SurfaceMosaic.missing`` instead of
+raising.
+
+Mosaic arrays follow mca_chunk_decoder: indexed [x - origin_x, z - origin_z],
+with ``block_ids == 0`` ("air") and ``heightmap == NO_SURFACE`` where no
+block was found.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+from typing import List, NamedTuple, Optional, Tuple
+
+import anvil
+import numpy as np
+
+from mca_chunk_cache import RegionSurfaceCache
+from mca_chunk_decoder import (AIR_BLOCKS, NO_SURFACE, decode_chunk_surface,
+                               decode_chunk_voxels)
+
+# Chunks per worker task; one region row keeps the pickling overhead low
+BATCH_SIZE = 32
+
+
+class SurfaceMosaic(NamedTuple):
+    """Surface of a rectangular area stitched from many chunks."""
+    heightmap: np.ndarray     # (size_x, size_z) int16
+    block_ids: np.ndarray     # (size_x, size_z) uint16, into `palette`
+    palette: Tuple[str, ...]
+    origin: Tuple[int, int]   # world (x, z) of element [0, 0]
+    missing: Tuple[Tuple[int, int], ...]  # (chunk_x, chunk_z) not found
+
+
+class VoxelMosaic(NamedTuple):
+    """All blocks of a rectangular area stitched from many chunks."""
+    voxels: np.ndarray        # (size_x, size_z, height) uint16, into `palette`
+    palette: Tuple[str, ...]
+    origin: Tuple[int, int]   # world (x, z) of column [0, 0]
+    y_min: int                # world y of voxels[:, :, 0]
+    missing: Tuple[Tuple[int, int], ...]
+
+
+def region_file(region_dir: Path, chunk_x: int, chunk_z: int) -> Path:
+    """Path of the region file holding the given (global) chunk."""
+    return Path(region_dir) / f"r.{chunk_x >> 5}.{chunk_z >> 5}.mca"
+
+
+@lru_cache(maxsize=4)
+def _load_region(path: str, mtime_ns: int, size: int) -> anvil.Region:
+    return anvil.Region.from_file(path)
+
+
+def _open_region(path: str) -> Optional[anvil.Region]:
+    # Cached per worker process so a batch does not re-read the file;
+    # keyed on mtime and size so a rewritten region file is read again
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return _load_region(path, stat.st_mtime_ns, stat.st_size)
+
+
+def _decode_batch(task):
+    """Worker: decode a list of chunks that live in one region file."""
+    path, chunks = task
+    region = _open_region(path)
+    results = []
+    for chunk_x, chunk_z in chunks:
+        surface = None
+        if region is not None:
+            surface = decode_chunk_surface(region, chunk_x, chunk_z)
+        results.append((chunk_x, chunk_z, surface))
+    return results
+
+
+def _decode_voxel_batch(task):
+    """Worker: decode full voxel columns of chunks in one region file."""
+    path, chunks = task
+    region = _open_region(path)
+    results = []
+    for chunk_x, chunk_z in chunks:
+        nbt_data = region.chunk_data(chunk_x, chunk_z) if region is not None else None
+        decoded = decode_chunk_voxels(nbt_data) if nbt_data is not None else None
+        results.append((chunk_x, chunk_z, decoded))
+    return results
+
+
+def _run_batches(worker, tasks, processes):
+    """Yields worker(task) for every task, in task order, using a process
+    pool unless a single process is enough."""
+    if processes is None:
+        processes = os.cpu_count() or 1
+    processes = min(processes, len(tasks))
+    if processes <= 1:
+        yield from map(worker, tasks)
+        return
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        yield from executor.map(worker, tasks)
+
+
+def _make_tasks(region_dir: Path, chunk_min, chunk_max):
+    """Chunk batches in (chunk_x, chunk_z) order, never crossing regions."""
+    tasks = []
+    for chunk_x in range(chunk_min[0], chunk_max[0] + 1):
+        current_path, batch = None, []
+        for chunk_z in range(chunk_min[1], chunk_max[1] + 1):
+            path = str(region_file(region_dir, chunk_x, chunk_z))
+            if batch and (path != current_path or len(batch) >= BATCH_SIZE):
+                tasks.append((current_path, batch))
+                batch = []
+            current_path = path
+            batch.append((chunk_x, chunk_z))
+        if batch:
+            tasks.append((current_path, batch))
+    return tasks
+
+
+def _fresh_from_cache(tasks, caches):
+    """Splits tasks into cached surfaces and the chunks still to decode."""
+    cached, stale_tasks = [], []
+    for path, chunks in tasks:
+        cache = caches.get(path)
+        if cache is None:
+            stale_tasks.append((path, chunks))
+            continue
+        stale = []
+        for chunk_x, chunk_z in chunks:
+            if not cache.exists(chunk_x, chunk_z) or cache.is_fresh(chunk_x, chunk_z):
+                cached.append((chunk_x, chunk_z, cache.get(chunk_x, chunk_z)))
+            else:
+                stale.append((chunk_x, chunk_z))
+        if stale:
+            stale_tasks.append((path, stale))
+    return cached, stale_tasks
+
+
+def extract_chunk_area(region_dir: Path,
+                       chunk_min: Tuple[int, int],
+                       chunk_max: Tuple[int, int],
+                       processes: Optional[int] = None,
+                       cache_dir: Optional[Path] = None) -> SurfaceMosaic:
+    """
+    Extracts the surface of every chunk in the inclusive chunk-coordinate
+    box [chunk_min, chunk_max] from the region files in `region_dir`.
+
+    Parameters:
+        region_dir: Directory containing the r.<rx>.<rz>.mca files.
+        chunk_min, chunk_max: (chunk_x, chunk_z) corners, inclusive.
+        processes: Worker processes; None uses all cores, 1 decodes inline.
+        cache_dir: If given, decoded chunks are cached there (see
+            mca_chunk_cache) and only chunks whose region header entry
+            changed are decoded again.
+    """
+    region_dir = Path(region_dir)
+    if chunk_max[0] < chunk_min[0] or chunk_max[1] < chunk_min[1]:
+        raise ValueError(f"Empty chunk box: {chunk_min} .. {chunk_max}")
+
+    size_x = (chunk_max[0] - chunk_min[0] + 1) * 16
+    size_z = (chunk_max[1] - chunk_min[1] + 1) * 16
+    heightmap = np.full((size_x, size_z), NO_SURFACE, dtype=np.int16)
+    block_ids = np.zeros((size_x, size_z), dtype=np.uint16)
+    palette, palette_ids, missing = ["air"], {"air": 0}, []
+    luts = {}
+
+    def paste(chunk_x, chunk_z, surface):
+        if surface is None:
+            missing.append((chunk_x, chunk_z))
+            return
+        # Remap the chunk palette onto the mosaic palette
+        lut = luts.get(surface.palette)
+        if lut is None:
+            lut = np.empty(len(surface.palette), dtype=np.uint16)
+            for i, name in enumerate(surface.palette):
+                if name not in palette_ids:
+                    palette_ids[name] = len(palette)
+                    palette.append(name)
+                lut[i] = palette_ids[name]
+            luts[surface.palette] = lut
+        x0 = (chunk_x - chunk_min[0]) * 16
+        z0 = (chunk_z - chunk_min[1]) * 16
+        heightmap[x0:x0 + 16, z0:z0 + 16] = surface.heightmap
+        block_ids[x0:x0 + 16, z0:z0 + 16] = lut[surface.block_ids]
+
+    tasks = _make_tasks(region_dir, chunk_min, chunk_max)
+    caches = {}
+    if cache_dir is not None:
+        for path, _ in tasks:
+            if path not in caches and os.path.exists(path):
+                caches[path] = RegionSurfaceCache(cache_dir, Path(path))
+        cached, tasks = _fresh_from_cache(tasks, caches)
+        for chunk_x, chunk_z, surface in cached:
+            paste(chunk_x, chunk_z, surface)
+
+    try:
+        batches = _run_batches(_decode_batch, tasks, processes)
+        for (path, _), batch in zip(tasks, batches):
+            for chunk_x, chunk_z, surface in batch:
+                paste(chunk_x, chunk_z, surface)
+                if path in caches:
+                    caches[path].put(chunk_x, chunk_z, surface)
+    finally:
+        for cache in caches.values():
+            cache.save()
+
+    missing.sort()
+    return SurfaceMosaic(heightmap, block_ids, tuple(palette),
+                         (chunk_min[0] * 16, chunk_min[1] * 16), tuple(missing))
+
+
+def extract_world_area(region_dir: Path,
+                       world_min: Tuple[int, int],
+                       world_max: Tuple[int, int],
+                       processes: Optional[int] = None,
+                       cache_dir: Optional[Path] = None) -> SurfaceMosaic:
+    """
+    Same as extract_chunk_area, but for an inclusive box in world block
+    coordinates (x, z). The mosaic is cropped to exactly that box.
+    """
+    chunk_min = (world_min[0] >> 4, world_min[1] >> 4)
+    chunk_max = (world_max[0] >> 4, world_max[1] >> 4)
+    mosaic = extract_chunk_area(region_dir, chunk_min, chunk_max, processes,
+                                cache_dir)
+    dx = world_min[0] - mosaic.origin[0]
+    dz = world_min[1] - mosaic.origin[1]
+    crop = (slice(dx, dx + world_max[0] - world_min[0] + 1),
+            slice(dz, dz + world_max[1] - world_min[1] + 1))
+    return mosaic._replace(heightmap=mosaic.heightmap[crop],
+                           block_ids=mosaic.block_ids[crop],
+                           origin=tuple(world_min))
+
+
+def extract_chunk_voxels(region_dir: Path,
+                         chunk_min: Tuple[int, int],
+                         chunk_max: Tuple[int, int],
+                         processes: Optional[int] = None) -> VoxelMosaic:
+    """
+    Decodes every block of the inclusive chunk box [chunk_min, chunk_max]
+    into one voxel array indexed [x - origin_x, z - origin_z, y - y_min],
+    cropped vertically to the range that contains blocks.
+    """
+    region_dir = Path(region_dir)
+    if chunk_max[0] < chunk_min[0] or chunk_max[1] < chunk_min[1]:
+        raise ValueError(f"Empty chunk box: {chunk_min} .. {chunk_max}")
+
+    tasks = _make_tasks(region_dir, chunk_min, chunk_max)
+    decoded, missing = [], []
+    for batch in _run_batches(_decode_voxel_batch, tasks, processes):
+        for chunk_x, chunk_z, chunk in batch:
+            if chunk is None:
+                missing.append((chunk_x, chunk_z))
+            elif chunk[0].shape[0]:
+                decoded.append((chunk_x, chunk_z, chunk))
+
+    size_x = (chunk_max[0] - chunk_min[0] + 1) * 16
+    size_z = (chunk_max[1] - chunk_min[1] + 1) * 16
+    origin = (chunk_min[0] * 16, chunk_min[1] * 16)
+    if not decoded:
+        return VoxelMosaic(np.zeros((size_x, size_z, 0), dtype=np.uint16),
+                           ("air",), origin, 0, tuple(missing))
+
+    y_min = min(y0 for _, _, (_, _, y0) in decoded)
+    y_max = max(y0 + v.shape[0] for _, _, (v, _, y0) in decoded)
+    voxels = np.zeros((size_x, size_z, y_max - y_min), dtype=np.uint16)
+    palette, palette_ids = ["air"], {"air": 0}
+    for chunk_x, chunk_z, (chunk_voxels, chunk_palette, chunk_y0) in decoded:
+        lut = np.empty(len(chunk_palette), dtype=np.uint16)
+        for i, name in enumerate(chunk_palette):
+            if name not in palette_ids:
+                palette_ids[name] = len(palette)
+                palette.append(name)
+            lut[i] = palette_ids[name]
+        x0 = (chunk_x - chunk_min[0]) * 16
+        z0 = (chunk_z - chunk_min[1]) * 16
+        y0 = chunk_y0 - y_min
+        # chunk voxels are [y, z, x]
+        voxels[x0:x0 + 16, z0:z0 + 16, y0:y0 + chunk_voxels.shape[0]] = \
+            lut[chunk_voxels].transpose(2, 1, 0)
+
+    # Drop the all-air layers (any air variant) above the highest block
+    is_air = np.fromiter((name in AIR_BLOCKS for name in palette),
+                         dtype=bool, count=len(palette))
+    filled = np.flatnonzero((~is_air[voxels]).any(axis=(0, 1)))
+    top = int(filled[-1]) + 1 if filled.size else 0
+    missing.sort()
+    return VoxelMosaic(voxels[:, :, :top], tuple(palette), origin, y_min,
+                       tuple(missing))
+
+
+def mosaic_to_blocks(mosaic: SurfaceMosaic) -> List[tuple]:
+    """
+    Converts a mosaic to the list of (world_x, y, world_z, block_id)
+    tuples consumed by MCAArena, skipping empty columns.
+    """
+    local_x, local_z = np.nonzero(mosaic.block_ids)
+    heights = mosaic.heightmap[local_x, local_z]
+    ids = mosaic.block_ids[local_x, local_z]
+    x0, z0 = mosaic.origin
+    return [
+        (x0 + int(x), int(y), z0 + int(z), mosaic.palette[i])
+        for x, y, z, i in zip(local_x, heights, local_z, ids)
+    ]
@@ -0,0 +1,83 @@
+"""
+mca_block_materials.py
+
+Block-type → MJCF material lookup for Minecraft arenas.
+
+Colours (and optional textures) per block type live in one mapping file,
+block_materials.json by default:
+
+    {
+      "fallback": "other",
+      "materials": {
+        "grass": {"match": ["grass"], "rgba": [0.3, 0.6, 0.3, 1]},
+        "other": {"rgba": [0.5, 0.5, 0.5, 1]}
+      }
+    }
+
+A block type gets the first material (in file order) with one of its
+`match` substrings, else the fallback. Every other key of an entry is set
+on the MJCF `material` element; an optional `texture` dict becomes a
+`texture` asset of the same name.
+"""
+
+import json
+from pathlib import Path
+from typing import Dict, Iterable
+
+DEFAULT_MATERIALS_PATH = Path(__file__).with_name("block_materials.json")
+
+
+class BlockMaterials:
+    """
+    Material definitions from a mapping file, with block-type resolution
+    memoized so each distinct type is matched only once.
+    """
+    def __init__(self, materials: Dict[str, dict], fallback: str):
+        if fallback not in materials:
+            raise ValueError(f"Fallback material {fallback!r} is not defined")
+        self.materials = materials
+        self.fallback = fallback
+        self._resolved = {}
+
+    @classmethod
+    def from_file(cls, path: Path = DEFAULT_MATERIALS_PATH) -> "BlockMaterials":
+        with open(path) as f:
+            spec = json.load(f)
+        return cls(spec["materials"], spec["fallback"])
+
+    @property
+    def cache_params(self) -> dict:
+        """The definitions, for mjcf_model_cache keys."""
+        return {"materials": self.materials, "fallback": self.fallback}
+
+    def resolve(self, block_type: str) -> str:
+        """Name of the material used for `block_type`."""
+        name = self._resolved.get(block_type)
+        if name is None:
+            name = next((key for key, spec in self.materials.items()
+                         if any(s in block_type for s in spec.get("match", ()))),
+                        self.fallback)
+            self._resolved[block_type] = name
+        return name
+
+    def add_assets(self, root_element, names: Iterable[str]):
+        """Adds the `material` (and `texture`) assets for `names`."""
+        for name in names:
+            spec = dict(self.materials[name])
+            spec.pop("match", None)
+            texture = spec.pop("texture", None)
+            if texture is not None:
+                root_element.asset.add("texture", name=name, **texture)
+                spec["texture"] = name
+            root_element.asset.add("material", name=name, **spec)
+
+    def add_classes(self, root_element, names: Iterable[str], size):
+        """
+        Adds the assets for `names` and one default class per material
+        (box type, material and the given half-size), named like it.
+        """
+        names = sorted(set(names))
+        self.add_assets(root_element, names)
+        for name in names:
+            root_element.default.add("default", dclass=name).geom.set_attributes(
+                type="box", material=name, size=size)
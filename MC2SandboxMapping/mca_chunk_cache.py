@@ -0,0 +1,151 @@
+"""
+mca_chunk_cache.py
+
+Persistent on-disk cache of decoded chunk surfaces, one entry per region.
+
+Anvil region files start with two 4 KiB tables: the location (sector
+offset and count) and the last-modification timestamp of each of the
+1024 chunks. A cached chunk is reused only while both entries are
+unchanged, so a rebuild decodes just the chunks that were rewritten, and
+only the 8 KiB header is read for the others.
+
+Layout per region (in a subdirectory of the cache dir keyed by the
+region file's absolute path):
+
+    surfaces.npy   structured (1024,) array, memory-mapped on load
+    palette.json   block ids that `block_ids` index into (append-only)
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from mca_chunk_decoder import NO_SURFACE, ChunkSurface
+
+CACHE_VERSION = 1
+
+_RECORD = np.dtype([
+    ("location", ">i4"),          # header location entry when cached
+    ("timestamp", ">i4"),         # header timestamp when cached
+    ("valid", "u1"),
+    ("heightmap", "<i2", (16, 16)),
+    ("block_ids", "<u2", (16, 16)),
+])
+
+
+def read_region_header(region_path: Path):
+    """Returns the (location, timestamp) tables of a region file as
+    (1024,) int arrays indexed by chunk_x % 32 + (chunk_z % 32) * 32."""
+    with open(region_path, "rb") as f:
+        header = f.read(8192)
+    if len(header) < 8192:
+        header = header.ljust(8192, b"\0")
+    locations = np.frombuffer(header[:4096], dtype=">i4").astype(np.int64)
+    timestamps = np.frombuffer(header[4096:], dtype=">i4").astype(np.int64)
+    return locations, timestamps
+
+
+def chunk_index(chunk_x: int, chunk_z: int) -> int:
+    """Index of a chunk in its region's header tables."""
+    return chunk_x % 32 + (chunk_z % 32) * 32
+
+
+def _atomic_write(path: Path, write):
+    tmp = path.with_name(path.name + f".tmp{os.getpid()}")
+    with open(tmp, "wb") as f:
+        write(f)
+    os.replace(tmp, path)
+
+
+class RegionSurfaceCache:
+    """
+    Cached ChunkSurfaces of one region file.
+
+    Use is_fresh/get for lookups, put for newly decoded chunks and save to
+    persist. Chunks the header marks as never generated are reported as
+    missing without touching the cache.
+    """
+    def __init__(self, cache_dir: Path, region_path: Path):
+        self.region_path = Path(region_path)
+        key = hashlib.sha1(str(self.region_path.resolve()).encode()).hexdigest()[:12]
+        self.dir = Path(cache_dir) / f"{self.region_path.stem}-{key}"
+        self.locations, self.timestamps = read_region_header(self.region_path)
+        self.dirty = False
+        self._load()
+
+    def _load(self):
+        self.palette, self.palette_ids = ["air"], {"air": 0}
+        self.records = np.zeros(1024, dtype=_RECORD)
+        try:
+            meta = json.loads((self.dir / "palette.json").read_text())
+            records = np.load(self.dir / "surfaces.npy", mmap_mode="r")
+        except (OSError, ValueError):
+            return
+        if (meta.get("version") != CACHE_VERSION or records.dtype != _RECORD
+                or records.shape != (1024,)):
+            return
+        palette = meta["palette"]
+        if records["valid"].any() and records["block_ids"][records["valid"] == 1].max() >= len(palette):
+            return  # interrupted write; start over
+        self.palette = list(palette)
+        self.palette_ids = {name: i for i, name in enumerate(self.palette)}
+        self.records = records
+
+    def exists(self, chunk_x: int, chunk_z: int) -> bool:
+        """False if the region header says the chunk was never generated."""
+        return self.locations[chunk_index(chunk_x, chunk_z)] != 0
+
+    def is_fresh(self, chunk_x: int, chunk_z: int) -> bool:
+        i = chunk_index(chunk_x, chunk_z)
+        record = self.records[i]
+        return bool(record["valid"]
+                    and record["location"] == self.locations[i]
+                    and record["timestamp"] == self.timestamps[i])
+
+    def get(self, chunk_x: int, chunk_z: int) -> Optional[ChunkSurface]:
+        """Cached surface of a fresh chunk, or None if it does not exist."""
+        if not self.exists(chunk_x, chunk_z):
+            return None
+        record = self.records[chunk_index(chunk_x, chunk_z)]
+        return ChunkSurface(np.array(record["heightmap"]),
+                            np.array(record["block_ids"]),
+                            tuple(self.palette))
+
+    def put(self, chunk_x: int, chunk_z: int, surface: Optional[ChunkSurface]):
+        """Stores a freshly decoded surface (None = chunk not found)."""
+        if not self.dirty:
+            self.records = np.array(self.records)   # detach from the memmap
+            self.dirty = True
+        i = chunk_index(chunk_x, chunk_z)
+        record = self.records[i]
+        record["location"] = self.locations[i]
+        record["timestamp"] = self.timestamps[i]
+        if surface is None:
+            record["valid"] = 0
+            return
+        lut = np.empty(len(surface.palette), dtype=np.uint16)
+        for n, name in enumerate(surface.palette):
+            if name not in self.palette_ids:
+                self.palette_ids[name] = len(self.palette)
+                self.palette.append(name)
+            lut[n] = self.palette_ids[name]
+        record["heightmap"] = np.where(surface.block_ids > 0, surface.heightmap, NO_SURFACE)
+        record["block_ids"] = lut[surface.block_ids]
+        record["valid"] = 1
+
+    def save(self):
+        """Writes the cache if anything changed. The palette only grows and
+        is written first, so an interrupted save never mislabels blocks."""
+        if not self.dirty:
+            return
+        self.dir.mkdir(parents=True, exist_ok=True)
+        meta = json.dumps({"version": CACHE_VERSION,
+                           "region": str(self.region_path.resolve()),
+                           "palette": self.palette})
+        _atomic_write(self.dir / "palette.json", lambda f: f.write(meta.encode()))
+        _atomic_write(self.dir / "surfaces.npy", lambda f: np.save(f, self.records))
+        self.dirty = False
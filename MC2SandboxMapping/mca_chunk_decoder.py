@@ -0,0 +1,237 @@
+"""
+mca_chunk_decoder.py
+
+Vectorized NumPy decoding of Minecraft Anvil chunks.
+
+Instead of calling ``chunk.get_block`` once per voxel, each section's
+palette and packed block-state longs are unpacked straight into a
+``uint16`` voxel array, and the top non-air block of every column is
+found with a single argmax over the reversed non-air mask.
+
+Array conventions:
+    voxels      (height, 16, 16) indexed [y - y_min, local_z, local_x]
+    heightmap   (16, 16) int16 indexed [local_x, local_z]
+    block_ids   (16, 16) uint16 indexed [local_x, local_z], into `palette`
+
+Palette id 0 is always "air", so columns without any solid block have
+``block_ids == 0`` (and ``heightmap == NO_SURFACE``).
+"""
+
+from typing import NamedTuple, Optional, Tuple
+
+import anvil
+import numpy as np
+
+# Block ids (without namespace) that count as empty space
+AIR_BLOCKS = frozenset({"air", "cave_air", "void_air"})
+
+# Heightmap value for columns that contain no solid block
+NO_SURFACE = np.iinfo(np.int16).min
+
+# In 20w17a and newer a block state never straddles two longs
+_VERSION_20w17a = 2529
+# "The Flattening": numeric ids replaced by namespaced palettes
+_VERSION_17w47a = 1451
+
+_U64_MASK = (1 << 64) - 1
+
+
+class ChunkSurface(NamedTuple):
+    """Top non-air block of each column of one chunk."""
+    heightmap: np.ndarray   # (16, 16) int16, [local_x, local_z]
+    block_ids: np.ndarray   # (16, 16) uint16, [local_x, local_z]
+    palette: Tuple[str, ...]
+
+
+def _as_uint64(values) -> np.ndarray:
+    """Convert an NBT long array (signed or unsigned ints) to uint64."""
+    arr = np.asarray(values)
+    if arr.dtype == np.int64:
+        return arr.view(np.uint64)
+    if arr.dtype == np.uint64:
+        return arr
+    # Mixed signed/unsigned values end up as dtype=object
+    return np.array([v & _U64_MASK for v in values], dtype=np.uint64)
+
+
+def unpack_block_states(longs, bits: int, count: int = 4096,
+                        stretches: bool = False) -> np.ndarray:
+    """
+    Unpacks `count` palette indices of `bits` bits each from an array of
+    64-bit longs. If `stretches` is True (pre-20w17a) the indices form one
+    continuous bit stream; otherwise each long holds 64 // bits indices
+    and the leftover high bits are padding.
+    """
+    words = _as_uint64(longs)
+    if stretches:
+        # Little-endian bit stream: bit i of the stream is bit i % 64 of
+        # long i // 64.
+        stream = np.unpackbits(words.astype("<u8").view(np.uint8),
+                               bitorder="little")
+        stream = stream[:count * bits].reshape(count, bits)
+        weights = (1 << np.arange(bits, dtype=np.uint16)).astype(np.uint16)
+        return stream.astype(np.uint16) @ weights
+
+    per_long = 64 // bits
+    shifts = np.arange(per_long, dtype=np.uint64) * np.uint64(bits)
+    mask = np.uint64((1 << bits) - 1)
+    indices = (words[:, None] >> shifts[None, :]) & mask
+    return indices.reshape(-1)[:count].astype(np.uint16)
+
+
+def _nibbles(byte_array) -> np.ndarray:
+    """Splits a 2048-byte nibble array into 4096 values (low nibble first)."""
+    raw = np.frombuffer(bytes(b & 0xFF for b in byte_array), dtype=np.uint8)
+    out = np.empty(raw.size * 2, dtype=np.uint8)
+    out[0::2] = raw & 0x0F
+    out[1::2] = raw >> 4
+    return out
+
+
+def _legacy_name(key: int) -> str:
+    """Block id for a pre-flattening (numeric id << 4 | data) key."""
+    block_id, data = key >> 4, key & 0x0F
+    for d in (data, 0):
+        try:
+            return anvil.Block.from_numeric_id(block_id, d).id
+        except KeyError:
+            continue
+    return f"legacy_{block_id}"
+
+
+class _PaletteBuilder:
+    """Merges per-section palettes into one chunk palette (air first)."""
+    def __init__(self):
+        self.names = ["air"]
+        self.ids = {"air": 0}
+
+    def lookup(self, names) -> np.ndarray:
+        lut = np.empty(len(names), dtype=np.uint16)
+        for i, name in enumerate(names):
+            idx = self.ids.get(name)
+            if idx is None:
+                idx = self.ids[name] = len(self.names)
+                self.names.append(name)
+            lut[i] = idx
+        return lut
+
+
+def _strip_namespace(name: str) -> str:
+    return name.split(":", 1)[-1]
+
+
+def decode_chunk_voxels(nbt_data) -> Tuple[np.ndarray, Tuple[str, ...], int]:
+    """
+    Decodes a chunk's NBT data (as returned by ``Region.chunk_data``) into
+    a dense voxel array.
+
+    Returns ``(voxels, palette, y_min)`` where `voxels` is a uint16 array
+    of shape (height, 16, 16) indexed [y - y_min, z, x] holding indices
+    into `palette` (a tuple of block ids without namespace).
+    """
+    version = nbt_data["DataVersion"].value if "DataVersion" in nbt_data else 0
+    # 1.18+ chunks dropped the "Level" wrapper and renamed the section keys
+    level = nbt_data["Level"] if "Level" in nbt_data else nbt_data
+    sections_key = "Sections" if "Sections" in level else "sections"
+    sections = level[sections_key] if sections_key in level else []
+
+    palette = _PaletteBuilder()
+    decoded = {}
+    for section in sections:
+        section_y = section["Y"].value
+        if version < _VERSION_17w47a:
+            if "Blocks" not in section:
+                continue
+            keys = np.frombuffer(
+                bytes(b & 0xFF for b in section["Blocks"].value),
+                dtype=np.uint8).astype(np.uint16)
+            if "Add" in section:
+                keys |= _nibbles(section["Add"].value).astype(np.uint16) << 8
+            keys = (keys.astype(np.uint32) << 4) | _nibbles(section["Data"].value)
+            uniq, inverse = np.unique(keys, return_inverse=True)
+            lut = palette.lookup([_legacy_name(int(k)) for k in uniq])
+            decoded[section_y] = lut[inverse.reshape(-1)]
+            continue
+
+        if "block_states" in section:
+            states = section["block_states"]
+            section_palette = states["palette"]
+            longs = states["data"].value if "data" in states else None
+        elif "Palette" in section:
+            section_palette = section["Palette"]
+            longs = section["BlockStates"].value if "BlockStates" in section else None
+        else:
+            continue
+
+        names = [_strip_namespace(tag["Name"].value) for tag in section_palette]
+        lut = palette.lookup(names)
+        if longs is None or len(names) == 1:
+            indices = np.zeros(4096, dtype=np.uint16)
+        else:
+            bits = max((len(names) - 1).bit_length(), 4)
+            indices = unpack_block_states(
+                longs, bits, stretches=version < _VERSION_20w17a)
+        decoded[section_y] = lut[indices]
+
+    if not decoded:
+        return np.zeros((0, 16, 16), dtype=np.uint16), tuple(palette.names), 0
+
+    low, high = min(decoded), max(decoded)
+    voxels = np.zeros(((high - low + 1) * 16, 16, 16), dtype=np.uint16)
+    for section_y, blocks in decoded.items():
+        start = (section_y - low) * 16
+        voxels[start:start + 16] = blocks.reshape(16, 16, 16)
+    return voxels, tuple(palette.names), low * 16
+
+
+def surface_from_voxels(voxels: np.ndarray, palette, y_min: int = 0) -> ChunkSurface:
+    """
+    Finds the topmost non-air block of every column of `voxels` with one
+    vectorized pass (argmax over the reversed non-air mask).
+    """
+    is_air = np.fromiter((name in AIR_BLOCKS for name in palette),
+                         dtype=bool, count=len(palette))
+    if voxels.shape[0] == 0:
+        return ChunkSurface(np.full((16, 16), NO_SURFACE, dtype=np.int16),
+                            np.zeros((16, 16), dtype=np.uint16),
+                            tuple(palette))
+
+    solid = ~is_air[voxels]                       # (H, 16, 16) [y, z, x]
+    from_top = solid[::-1].argmax(axis=0)         # first solid from the top
+    has_block = solid.any(axis=0)
+    top = voxels.shape[0] - 1 - from_top
+
+    zz, xx = np.indices((16, 16))
+    block_ids = np.where(has_block, voxels[top, zz, xx], 0)
+    heightmap = np.where(has_block, top + y_min, NO_SURFACE)
+    return ChunkSurface(heightmap.T.astype(np.int16),
+                        block_ids.T.astype(np.uint16),
+                        tuple(palette))
+
+
+def decode_chunk_surface(region: anvil.Region, chunk_x: int,
+                         chunk_z: int) -> Optional[ChunkSurface]:
+    """
+    Decodes the surface of one chunk of an open region, or returns None if
+    the chunk has not been generated. `chunk_x`/`chunk_z` may be global
+    chunk coordinates; only their position within the region is used.
+    """
+    nbt_data = region.chunk_data(chunk_x, chunk_z)
+    if nbt_data is None:
+        return None
+    voxels, palette, y_min = decode_chunk_voxels(nbt_data)
+    return surface_from_voxels(voxels, palette, y_min)
+
+
+def surface_to_blocks(surface: ChunkSurface, chunk_x: int, chunk_z: int):
+    """
+    Converts a ChunkSurface to the list of (world_x, y, world_z, block_id)
+    tuples used by MCAArena, ordered x-major like the original column scan.
+    """
+    local_x, local_z = np.nonzero(surface.block_ids)
+    heights = surface.heightmap[local_x, local_z]
+    ids = surface.block_ids[local_x, local_z]
+    return [
+        (chunk_x * 16 + int(x), int(y), chunk_z * 16 + int(z), surface.palette[i])
+        for x, y, z, i in zip(local_x, heights, local_z, ids)
+    ]
@@ -0,0 +1,92 @@
+"""
+mca_greedy_merge.py
+
+Greedy meshing of a 2D label grid into the fewest axis-aligned rectangles.
+
+Used by MCAArena to replace one box geom per surface column with one box
+per rectangle of neighbouring columns that share block type and height.
+"""
+
+from typing import List, Tuple
+
+import numpy as np
+
+
+def greedy_rectangles(labels: np.ndarray) -> List[Tuple[int, int, int, int, int]]:
+    """
+    Covers every cell of `labels` (a 2D integer array, negative = empty)
+    with rectangles of a single label.
+
+    Scans rows in order; each unvisited cell starts a rectangle that is
+    grown along axis 1 as far as the label continues, then along axis 0
+    while the whole span still matches.
+
+    Returns:
+        List of (i0, j0, i1, j1, label) with exclusive ends, so the
+        rectangle covers labels[i0:i1, j0:j1].
+    """
+    labels = np.asarray(labels)
+    n_rows, n_cols = labels.shape
+    visited = labels < 0
+    rects = []
+    for i in range(n_rows):
+        free = np.flatnonzero(~visited[i]).tolist()
+        if not free:
+            continue
+        row = labels[i].tolist()
+        done = visited[i].tolist()
+        j_next = 0
+        for j in free:
+            if j < j_next:
+                continue
+            label = row[j]
+            j1 = j + 1
+            while j1 < n_cols and row[j1] == label and not done[j1]:
+                j1 += 1
+            i1 = i + 1
+            while (i1 < n_rows
+                   and (labels[i1, j:j1] == label).all()
+                   and not visited[i1, j:j1].any()):
+                i1 += 1
+            visited[i:i1, j:j1] = True
+            rects.append((i, j, i1, j1, label))
+            j_next = j1
+    return rects
+
+
+def merge_surface_blocks(surface_blocks):
+    """
+    Groups (x, y, z, block_type) blocks into rectangles of equal block type
+    and height. Blocks are merged within each y level, so several blocks
+    may share a column (true-elevation voxel arenas).
+
+    Returns:
+        List of (x0, z0, x1, z1, y, block_type) with exclusive x1/z1.
+    """
+    if not surface_blocks:
+        return []
+    xs = np.array([b[0] for b in surface_blocks])
+    ys = np.array([b[1] for b in surface_blocks])
+    zs = np.array([b[2] for b in surface_blocks])
+    types, label_of = [], {}
+    cell_labels = np.empty(len(surface_blocks), dtype=np.int64)
+    for n, block in enumerate(surface_blocks):
+        block_type = block[3]
+        if block_type not in label_of:
+            label_of[block_type] = len(types)
+            types.append(block_type)
+        cell_labels[n] = label_of[block_type]
+
+    rects = []
+    for y in np.unique(ys):
+        layer = ys == y
+        x_min, z_min = xs[layer].min(), zs[layer].min()
+        shape = (xs[layer].max() - x_min + 1, zs[layer].max() - z_min + 1)
+        grid = np.full(shape, -1, dtype=np.int64)
+        grid[xs[layer] - x_min, zs[layer] - z_min] = cell_labels[layer]
+        rects.extend(
+            (int(x_min + i0), int(z_min + j0), int(x_min + i1), int(z_min + j1),
+             int(y), types[label])
+            for i0, j0, i1, j1, label in greedy_rectangles(grid)
+        )
+    return rects
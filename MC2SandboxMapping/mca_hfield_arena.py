@@ -0,0 +1,177 @@
+"""
+mca_hfield_arena.py
+
+Heightfield terrain backend for Minecraft arenas.
+
+Instead of one box geom per block (MCAArena), the extracted surface is
+written as a single MuJoCo ``hfield`` asset and one ``hfield`` geom, so
+model size and collision cost stay roughly constant however large the
+imported world is.
+"""
+
+import numpy as np
+from dm_control import mjcf
+from flygym.arena.base import BaseArena
+
+from mca_chunk_decoder import NO_SURFACE
+
+
+def hfield_file_contents(data: np.ndarray) -> bytes:
+    """MuJoCo custom binary hfield file of an (nrow, ncol) elevation array."""
+    nrow, ncol = data.shape
+    return (np.array([nrow, ncol], dtype="<i4").tobytes()
+            + np.ascontiguousarray(data, dtype="<f4").tobytes())
+
+
+def surface_blocks_to_grid(surface_blocks):
+    """
+    Turns (x, y, z, block_type) surface blocks into a dense int heightmap
+    indexed [x - x_min, z - z_min] (NO_SURFACE where there is no block)
+    and its world origin (x_min, z_min).
+    """
+    if not surface_blocks:
+        raise ValueError("surface_blocks is empty")
+    xs = np.array([b[0] for b in surface_blocks])
+    ys = np.array([b[1] for b in surface_blocks])
+    zs = np.array([b[2] for b in surface_blocks])
+    x_min, z_min = int(xs.min()), int(zs.min())
+    grid = np.full((xs.max() - x_min + 1, zs.max() - z_min + 1), NO_SURFACE,
+                   dtype=np.int32)
+    grid[xs - x_min, zs - z_min] = ys
+    return grid, (x_min, z_min)
+
+
+class MCAHeightfieldArena(BaseArena):
+    """
+    Builds an MJCF arena whose terrain is one hfield geom.
+
+    Column (x, z) is centred at (x * block_size, z * block_size) like in
+    MCAArena, and a surface block at height y is (y - base_y) *
+    block_height tall. By default the lowest surface block therefore has
+    the same height as an MCAArena box. Empty columns are at floor level.
+
+    A heightfield interpolates between samples, so by default block edges
+    become slopes between neighbouring column centres. With
+    step_edges=True every block is sampled samples_per_block times per
+    axis, which narrows each step to block_size / samples_per_block.
+
+    Parameters:
+        surface_blocks: List of (world_x, y, world_z, block_id).
+        block_size (float): Width/length of one block.
+        block_height (float): Height of one block level.
+        step_edges (bool): Keep (near) block-exact step edges.
+        samples_per_block (int): Samples per block and axis if step_edges.
+        base_y (int): Block level mapped to the floor; defaults to the
+            lowest surface block minus one.
+    """
+    def __init__(self,
+                 surface_blocks,
+                 block_size: float = 10,
+                 block_height: float = 10,
+                 step_edges: bool = False,
+                 samples_per_block: int = 4,
+                 base_y: int = None):
+        super().__init__()
+        grid, origin = surface_blocks_to_grid(surface_blocks)
+        self._init_terrain(grid, origin, block_size, block_height,
+                           step_edges, samples_per_block, base_y)
+
+    @classmethod
+    def from_mosaic(cls, mosaic, **kwargs):
+        """Builds the arena straight from a SurfaceMosaic's heightmap."""
+        arena = cls.__new__(cls)
+        BaseArena.__init__(arena)
+        heightmap = np.where(mosaic.block_ids > 0, mosaic.heightmap, NO_SURFACE)
+        arena._init_terrain(heightmap.astype(np.int32), mosaic.origin, **kwargs)
+        return arena
+
+    def _init_terrain(self, grid, origin, block_size=10, block_height=10,
+                      step_edges=False, samples_per_block=4, base_y=None):
+        self.block_size = block_size
+        self.block_height = block_height
+        self.step_edges = step_edges
+        self.samples_per_block = samples_per_block
+        self.origin = origin
+
+        present = grid != NO_SURFACE
+        if base_y is None:
+            base_y = int(grid[present].min()) - 1 if present.any() else 0
+        self.base_y = base_y
+        self.elevation = np.where(
+            present, (grid - base_y) * float(block_height), 0.0).clip(min=0.0)
+        # Everything the model depends on, for mjcf_model_cache
+        self.cache_params = {
+            "arena": type(self).__name__, "elevation": self.elevation,
+            "origin": origin, "block_size": block_size, "block_height": block_height,
+            "step_edges": step_edges, "samples_per_block": samples_per_block,
+        }
+        self._build_model()
+
+    def _sample_grid(self):
+        """Resamples the per-block elevation to hfield samples."""
+        nx, nz = self.elevation.shape
+        n = self.samples_per_block if self.step_edges else 1
+        if min(nx, nz) < 2:
+            n = max(n, 2)   # an hfield needs at least 2 samples per axis
+        if n == 1:
+            # One sample at every column centre
+            samples = self.elevation
+            half_x = (nx - 1) * self.block_size / 2.0
+            half_y = (nz - 1) * self.block_size / 2.0
+        else:
+            # n equal samples spread across every block, edge to edge
+            samples = np.repeat(np.repeat(self.elevation, n, axis=0), n, axis=1)
+            half_x = nx * self.block_size / 2.0
+            half_y = nz * self.block_size / 2.0
+        center = ((self.origin[0] + (nx - 1) / 2.0) * self.block_size,
+                  (self.origin[1] + (nz - 1) / 2.0) * self.block_size)
+        return samples, half_x, half_y, center
+
+    def _build_model(self):
+        # Create root element
+        self.root_element = mjcf.RootElement(model="mca_hfield_arena")
+        worldbody = self.root_element.worldbody
+
+        # Base floor plane
+        worldbody.add(
+            "geom", name="floor", type="plane",
+            size=[500, 500, 0.1], pos=[0, 0, 0], rgba=[0.9, 0.9, 0.9, 1]
+        )
+
+        samples, half_x, half_y, center = self._sample_grid()
+        low, high = float(samples.min()), float(samples.max())
+        # MuJoCo rescales elevation data to [0, 1] (min -> 0) and scales it
+        # by size[2], so the geom sits at the lowest sample instead.
+        span = high - low
+        normalized = (samples - low) / span if span > 0 else np.zeros_like(samples)
+        # Solid base from the lowest sample down to the floor
+        base = low if low > 0 else self.block_height
+
+        # The samples go in as a MuJoCo custom binary hfield file (int32
+        # nrow, ncol, then float32 data): the MJCF schema of dm_control has
+        # no `elevation` attribute. Columns run along +x and rows along y
+        # (world z), the first row at -y.
+        self.root_element.asset.add(
+            "hfield",
+            name="terrain",
+            size=[half_x, half_y, span if span > 0 else self.block_height, base],
+            file=mjcf.Asset(hfield_file_contents(normalized.T), ".bin"),
+        )
+        worldbody.add(
+            "geom",
+            name="terrain",
+            type="hfield",
+            hfield="terrain",
+            pos=[center[0], center[1], low],
+            rgba=(0.3, 0.6, 0.3, 1)
+        )
+        self.max_height = high
+
+    def get_model(self):
+        return self.root_element
+
+    def _get_max_floor_height(self):
+        return self.max_height
+
+    def get_spawn_position(self, rel_pos, rel_angle):
+        return rel_pos, rel_angle
@@ -1,6 +1,8 @@
 import anvil
 from pathlib import Path
 
+from mca_chunk_decoder import decode_chunk_surface, surface_to_blocks
+
 region_path = Path("r.0.0.mca")  
 chunk_x = 0
 chunk_z = 0
@@ -8,28 +10,13 @@ chunk_z = 0
 with open(region_path, "rb") as f:
     region = anvil.Region.from_file(f)
 
-try:
-    chunk = region.get_chunk(chunk_x, chunk_z)
-except anvil.errors.ChunkNotFound:
+# Decode the whole chunk at once: heightmap[x, z] and block_ids[x, z]
+surface = decode_chunk_surface(region, chunk_x, chunk_z)
+if surface is None:
     print(f"Chunk at ({chunk_x}, {chunk_z}) not found in the region.")
     exit()
 
-surface_blocks = []
-
-for local_x in range(16):
-    for local_z in range(16):
-        world_x = chunk_x * 16 + local_x
-        world_z = chunk_z * 16 + local_z
-
-        # Search from top down for first non-air block
-        for y in reversed(range(256)):
-            try:
-                block = chunk.get_block(local_x, y, local_z)
-                if block.id != "air":
-                    surface_blocks.append((world_x, y, world_z, block.id))
-                    break
-            except Exception:
-                continue
+surface_blocks = surface_to_blocks(surface, chunk_x, chunk_z)
 
 
 if not surface_blocks:
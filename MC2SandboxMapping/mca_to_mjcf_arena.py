@@ -1,8 +1,18 @@
 import anvil
+import argparse
+import time
 from pathlib import Path
 from dm_control import mjcf
 from flygym.arena.base import BaseArena
 
+from mca_area_extraction import extract_chunk_voxels, extract_world_area, mosaic_to_blocks
+from mca_block_materials import DEFAULT_MATERIALS_PATH, BlockMaterials
+from mca_chunk_decoder import decode_chunk_surface, surface_to_blocks
+from mca_greedy_merge import merge_surface_blocks
+from mca_hfield_arena import MCAHeightfieldArena
+from mca_voxel_culling import exposed_blocks
+from mca_xml_arena import MCAXmlArena
+
 REGION_PATH = Path("r.0.0.mca")
 CHUNK_X, CHUNK_Z = 0, 0
 
@@ -11,6 +21,9 @@ def extract_surface_blocks(region_path: Path, chunk_x: int, chunk_z: int):
     Reads the specified region file, loads the chunk at (chunk_x, chunk_z),
     and returns a list of (world_x, y, world_z, block_id) for the first
     non-air block in each column.
+
+    The chunk is decoded in one vectorized pass (see mca_chunk_decoder);
+    use decode_chunk_surface directly to get the heightmap/block-id arrays.
     """
     if not region_path.exists():
         raise FileNotFoundError(f"Region file not found: {region_path}")
@@ -18,38 +31,59 @@ def extract_surface_blocks(region_path: Path, chunk_x: int, chunk_z: int):
     with open(region_path, "rb") as f:
         region = anvil.Region.from_file(f)
 
-    try:
-        chunk = region.get_chunk(chunk_x, chunk_z)
-    except anvil.errors.ChunkNotFound:
+    surface = decode_chunk_surface(region, chunk_x, chunk_z)
+    if surface is None:
         raise RuntimeError(f"Chunk at ({chunk_x}, {chunk_z}) not found in region.")
-
-    surface_blocks = []
-    for local_x in range(16):
-        for local_z in range(16):
-            world_x = chunk_x * 16 + local_x
-            world_z = chunk_z * 16 + local_z
-
-            # Search from top (255) down for first non-air block
-            for y in range(255, -1, -1):
-                block = chunk.get_block(local_x, y, local_z)
-                if block.id != "air":
-                    surface_blocks.append((world_x, y, world_z, block.id))
-                    break
-    return surface_blocks
+    return surface_to_blocks(surface, chunk_x, chunk_z)
 
 # ----------------- Arena Builder ----------------
 class MCAArena(BaseArena):
     """
     Builds an MJCF arena with blocks placed according to surface_blocks.
+
+    If merge_boxes is True, neighbouring columns with the same block type
+    and height are combined into the fewest rectangular box geoms (greedy
+    meshing); the covered volume is unchanged. `num_block_geoms` and
+    `geoms_saved` report the effect.
+
+    By default every block sits on the floor. With true_elevation=True a
+    block at level y occupies heights [(y - base_y - 1), (y - base_y)] *
+    block_height (base_y defaults to the lowest block minus one), so
+    surface_blocks may also hold the exposed blocks below the surface
+    (see mca_voxel_culling.exposed_blocks).
+
+    Colours come from `materials` (a BlockMaterials, by default loaded
+    from block_materials.json): each material used gets one default class,
+    and the box geoms only reference their class. Geoms are unnamed unless
+    name_geoms is True.
     """
     def __init__(self,
                  surface_blocks,
                  block_size: float = 10,
-                 block_height: float = 10):
+                 block_height: float = 10,
+                 merge_boxes: bool = False,
+                 true_elevation: bool = False,
+                 base_y: int = None,
+                 materials: BlockMaterials = None,
+                 name_geoms: bool = False):
         super().__init__()
         self.surface_blocks = surface_blocks
         self.block_size = block_size
         self.block_height = block_height
+        self.merge_boxes = merge_boxes
+        self.true_elevation = true_elevation
+        if base_y is None:
+            base_y = min((b[1] for b in surface_blocks), default=1) - 1
+        self.base_y = base_y
+        self.materials = materials or BlockMaterials.from_file()
+        self.name_geoms = name_geoms
+        # Everything the model depends on, for mjcf_model_cache
+        self.cache_params = {
+            "arena": type(self).__name__, "surface_blocks": surface_blocks,
+            "block_size": block_size, "block_height": block_height,
+            "merge_boxes": merge_boxes, "true_elevation": true_elevation,
+            "base_y": base_y, "materials": self.materials, "name_geoms": name_geoms,
+        }
         self._build_model()
 
     def _build_model(self):
@@ -63,53 +97,165 @@ class MCAArena(BaseArena):
             size=[500, 500, 0.1], pos=[0, 0, 0], rgba=[0.9, 0.9, 0.9, 1]
         )
 
-        # Add a box for each surface block
-        for x, y, z, block_type in self.surface_blocks:
-            # Color by block type
-            color = (
-                (0.3, 0.6, 0.3, 1) if "grass" in block_type else
-                (0.5, 0.3, 0.1, 1) if "dirt"  in block_type else
-                (0.5, 0.5, 0.5, 1)
-            )
+        # Boxes as (x0, z0, x1, z1, y, block_type) with exclusive x1/z1
+        if self.merge_boxes:
+            boxes = merge_surface_blocks(self.surface_blocks)
+        else:
+            boxes = [(x, z, x + 1, z + 1, y, block_type)
+                     for x, y, z, block_type in self.surface_blocks]
+        self.num_block_geoms = len(boxes)
+        self.geoms_saved = len(self.surface_blocks) - len(boxes)
 
+        # One default class per material: box type, material and the
+        # single-block size, so each geom only carries what differs
+        block_half = [self.block_size / 2.0, self.block_size / 2.0,
+                      self.block_height / 2.0]
+        classes = {block_type: self.materials.resolve(block_type)
+                   for block_type in {b[5] for b in boxes}}
+        self.materials.add_classes(self.root_element, classes.values(), block_half)
+
+        # Add a box for each surface block (or merged rectangle of blocks)
+        for x0, z0, x1, z1, y, block_type in boxes:
             # Position in MJCF meters (or mm, depending on your scale)
-            xpos = x * self.block_size
-            ypos = z * self.block_size
-            zpos = self.block_height / 2.0
-
-            worldbody.add(
-                "geom",
-                name=f"{block_type}_{x}_{z}",
-                type="box",
-                size=[self.block_size/2.0, self.block_size/2.0, self.block_height/2.0],
-                pos=[xpos, ypos, zpos],
-                rgba=color
-            )
+            xpos = (x0 + x1 - 1) * self.block_size / 2.0
+            ypos = (z0 + z1 - 1) * self.block_size / 2.0
+            if self.true_elevation:
+                zpos = (y - self.base_y - 0.5) * self.block_height
+            else:
+                zpos = self.block_height / 2.0
+
+            attrs = {}
+            if x1 - x0 > 1 or z1 - z0 > 1:
+                attrs["size"] = [(x1 - x0) * self.block_size / 2.0,
+                                 (z1 - z0) * self.block_size / 2.0,
+                                 self.block_height / 2.0]
+            if self.name_geoms:
+                # Several blocks can share a column when elevation is kept
+                attrs["name"] = (f"{block_type}_{x0}_{y}_{z0}" if self.true_elevation
+                                 else f"{block_type}_{x0}_{z0}")
+            worldbody.add("geom", dclass=classes[block_type],
+                          pos=[xpos, ypos, zpos], **attrs)
 
     def get_model(self):
         return self.root_element
 
     def _get_max_floor_height(self):
+        if self.true_elevation and self.surface_blocks:
+            return (max(b[1] for b in self.surface_blocks) - self.base_y) * self.block_height
         return self.block_height
 
     def get_spawn_position(self, rel_pos, rel_angle):
         return rel_pos, rel_angle
 
 # -------------------- Main ----------------------
-def main():
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Build an MJCF arena from the surface of Minecraft region files.")
+    parser.add_argument("--region-dir", type=Path, default=REGION_PATH.parent,
+                        help="directory containing r.<rx>.<rz>.mca files")
+    box = parser.add_mutually_exclusive_group()
+    box.add_argument("--chunks", type=int, nargs=4,
+                     metavar=("X0", "Z0", "X1", "Z1"),
+                     help="inclusive bounding box in chunk coordinates")
+    box.add_argument("--blocks", type=int, nargs=4,
+                     metavar=("X0", "Z0", "X1", "Z1"),
+                     help="inclusive bounding box in world block coordinates")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="decoder processes (default: all cores, 1 = inline)")
+    parser.add_argument("--cache-dir", type=Path, default=None,
+                        help="on-disk cache of decoded chunk surfaces, invalidated by region "
+                             "header timestamps (default: .mca_cache; not used by --voxels)")
+    parser.add_argument("--no-cache", action="store_true", help="always decode from the .mca files")
+    parser.add_argument("--backend", choices=("boxes", "hfield", "xml"), default="boxes",
+                        help="one box geom per block, a single heightfield geom, or "
+                             "box geoms written straight to XML (large arenas)")
+    parser.add_argument("--step-edges", action="store_true",
+                        help="hfield backend: sample each block several times to keep step edges")
+    parser.add_argument("--true-elevation", action="store_true",
+                        help="boxes/xml backends: place blocks at their real height")
+    parser.add_argument("--voxels", action="store_true",
+                        help="boxes/xml backends: also add exposed blocks below the surface "
+                             "(implies --true-elevation; fully covered blocks are culled)")
+    parser.add_argument("--max-depth", type=int, default=None,
+                        help="with --voxels, drop blocks this many levels below their column top")
+    parser.add_argument("--closed-sides", action="store_true",
+                        help="with --voxels, cull the outer faces of the arena's edge blocks "
+                             "as if the world continued beyond the box")
+    parser.add_argument("--merge", action="store_true",
+                        help="merge equal neighbouring columns into larger boxes")
+    parser.add_argument("--materials", type=Path, default=DEFAULT_MATERIALS_PATH,
+                        help="JSON mapping of block types to MJCF materials")
+    parser.add_argument("--name-geoms", action="store_true",
+                        help="give every box geom a unique name (larger XML)")
+    parser.add_argument("--output", type=Path, default=Path("out_mjcf") / "mca_arena.xml")
+    args = parser.parse_args(argv)
+    if args.voxels and args.backend == "hfield":
+        parser.error("--voxels needs the boxes or xml backend")
+    if args.true_elevation and args.backend == "hfield":
+        parser.error("--true-elevation needs the boxes or xml backend")
+    if args.voxels and (args.cache_dir is not None or args.no_cache):
+        parser.error("--cache-dir and --no-cache only apply to surface extraction; "
+                     "--voxels always decodes the region files")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
     # 1) Extract blocks
-    blocks = extract_surface_blocks(REGION_PATH, CHUNK_X, CHUNK_Z)
-    print(f"Extracted {len(blocks)} surface blocks:")
+    start = time.perf_counter()
+    cache_dir = None if args.no_cache else args.cache_dir or Path(".mca_cache")
+    if args.blocks:
+        x0, z0, x1, z1 = args.blocks
+    else:
+        cx0, cz0, cx1, cz1 = args.chunks or (CHUNK_X, CHUNK_Z, CHUNK_X, CHUNK_Z)
+        x0, z0, x1, z1 = cx0 * 16, cz0 * 16, cx1 * 16 + 15, cz1 * 16 + 15
+    if args.voxels:
+        voxels = extract_chunk_voxels(args.region_dir, (x0 >> 4, z0 >> 4),
+                                      (x1 >> 4, z1 >> 4), args.workers)
+        # Crop to the requested box first so its edges are the arena's sides
+        dx, dz = x0 - voxels.origin[0], z0 - voxels.origin[1]
+        voxels = voxels._replace(
+            voxels=voxels.voxels[dx:dx + x1 - x0 + 1, dz:dz + z1 - z0 + 1],
+            origin=(x0, z0))
+        blocks = exposed_blocks(voxels, args.max_depth, args.closed_sides)
+        missing = voxels.missing
+    else:
+        mosaic = extract_world_area(args.region_dir, (x0, z0), (x1, z1),
+                                    args.workers, cache_dir)
+        blocks = mosaic_to_blocks(mosaic)
+        missing = mosaic.missing
+    elapsed = time.perf_counter() - start
+
+    kind = "exposed" if args.voxels else "surface"
+    print(f"Extracted {len(blocks)} {kind} blocks in {elapsed:.2f} s:")
     for b in blocks[:5]:  # show first few
         print(" ", b)
+    if missing:
+        print(f"Warning: {len(missing)} chunk(s) not found, e.g. {list(missing[:5])}")
 
     # 2) Build arena
-    arena = MCAArena(blocks, block_size=10, block_height=10)
+    if args.backend == "hfield":
+        arena = MCAHeightfieldArena.from_mosaic(
+            mosaic, block_size=10, block_height=10, step_edges=args.step_edges)
+    elif args.backend == "xml":
+        kwargs = dict(block_size=10, block_height=10, merge_boxes=args.merge,
+                      true_elevation=args.true_elevation or args.voxels,
+                      materials=BlockMaterials.from_file(args.materials))
+        arena = (MCAXmlArena(blocks, **kwargs) if args.voxels
+                 else MCAXmlArena.from_mosaic(mosaic, **kwargs))
+    else:
+        arena = MCAArena(blocks, block_size=10, block_height=10, merge_boxes=args.merge,
+                         true_elevation=args.true_elevation or args.voxels,
+                         materials=BlockMaterials.from_file(args.materials),
+                         name_geoms=args.name_geoms)
+    if args.merge and args.backend != "hfield":
+        print(f"Merged into {arena.num_block_geoms} box geoms "
+              f"({arena.geoms_saved} fewer than one per block)")
 
     # 3) Save MJCF for inspection
-    out_dir = Path("out_mjcf")
-    out_dir.mkdir(exist_ok=True)
-    xml_path = out_dir / "mca_arena.xml"
+    xml_path = args.output
+    xml_path.parent.mkdir(exist_ok=True, parents=True)
     xml_path.write_text(arena.get_model().to_xml_string())
     print(f"MJCF arena written to: {xml_path}")
 
@@ -0,0 +1,74 @@
+"""
+mca_voxel_culling.py
+
+Hidden-block culling for true-elevation voxel arenas.
+
+A block whose six faces all touch other (non-air) blocks can neither be
+seen nor touched, so it never needs a geom. Only the remaining exposed
+blocks (surface, cliff faces, overhang undersides, cave walls) are kept.
+Every air variant (air, cave_air, void_air) counts as empty.
+"""
+
+from typing import List, Optional
+
+import numpy as np
+
+from mca_chunk_decoder import AIR_BLOCKS
+
+
+def solid_mask(voxels: np.ndarray, palette) -> np.ndarray:
+    """Boolean mask of the non-air voxels."""
+    is_air = np.fromiter((name in AIR_BLOCKS for name in palette),
+                         dtype=bool, count=len(palette))
+    return ~is_air[voxels]
+
+
+def exposed_mask(solid: np.ndarray, max_depth: Optional[int] = None,
+                 closed_sides: bool = False) -> np.ndarray:
+    """
+    Marks solid voxels of a [x, z, y] mask that have at least one non-solid
+    face neighbour.
+
+    The space above the top and beyond the four sides counts as air, so
+    the blocks along the arena's edge keep their outer faces (the fly
+    can walk off the edge and see it). With closed_sides=True the world
+    is assumed to continue beyond the sides and those faces are culled
+    like any other covered face. The bottom is always treated as solid.
+    If `max_depth` is given, blocks more than `max_depth` levels below
+    their column's top block are dropped as well (e.g. enclosed caves).
+    """
+    padded = np.pad(solid, 1, constant_values=closed_sides)
+    padded[:, :, 0] = True
+    padded[:, :, -1] = False
+    core = (slice(1, -1), slice(1, -1), slice(1, -1))
+    covered = np.ones_like(solid)
+    for axis in range(3):
+        for shift in (-1, 1):
+            neighbour = list(core)
+            neighbour[axis] = slice(1 + shift, padded.shape[axis] - 1 + shift)
+            covered &= padded[tuple(neighbour)]
+    exposed = solid & ~covered
+
+    if max_depth is not None and solid.shape[2]:
+        height = solid.shape[2]
+        top = height - 1 - solid[:, :, ::-1].argmax(axis=2)
+        levels = np.arange(height)[None, None, :]
+        exposed &= levels >= (top - max_depth)[:, :, None]
+    return exposed
+
+
+def exposed_blocks(mosaic, max_depth: Optional[int] = None,
+                   closed_sides: bool = False) -> List[tuple]:
+    """
+    Converts a VoxelMosaic to the (world_x, y, world_z, block_id) tuples of
+    its exposed blocks, for MCAArena(..., true_elevation=True). See
+    exposed_mask for `max_depth` and `closed_sides`.
+    """
+    solid = solid_mask(mosaic.voxels, mosaic.palette)
+    local_x, local_z, local_y = np.nonzero(exposed_mask(solid, max_depth, closed_sides))
+    ids = mosaic.voxels[local_x, local_z, local_y]
+    x0, z0 = mosaic.origin
+    return [
+        (x0 + int(x), mosaic.y_min + int(y), z0 + int(z), mosaic.palette[i])
+        for x, y, z, i in zip(local_x, local_y, local_z, ids)
+    ]
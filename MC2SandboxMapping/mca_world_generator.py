@@ -0,0 +1,345 @@
+"""
+mca_world_generator.py
+
+Seedable bulk generator of synthetic Minecraft worlds for benchmarks.
+
+anvil_parser.py sets blocks one call at a time; here every chunk is built
+as a NumPy voxel array, its sections are packed into block-state longs in
+one vectorized step, and whole ``r.<rx>.<rz>.mca`` files are written
+directly (1.18+ chunk format, zlib-compressed NBT). Region files are
+generated in parallel, and the same seed always gives the same world:
+the header timestamps default to a value derived from the generation
+parameters (not the clock), so repeated runs are byte-identical while a
+world generated with other parameters still invalidates mca_chunk_cache.
+
+The chunks use the 1.18+ layout (DataVersion 3465, no "Level" tag).
+mca_chunk_decoder / mca_area_extraction read it, but the chunk API of
+the installed anvil-parser 0.9.0 (anvil.Chunk.from_region, as used by
+anvil_parser.py) does not: it raises KeyError: 'Tag Level does not exist'.
+
+Terrain:
+    flat    every column at `base`
+    noise   fractal value noise, `amplitude` blocks around `base`
+Fill:
+    layers  grass_block on top, three dirt, stone below, bedrock at y_min
+    random  every block drawn from `mix` (block ids, optional weights)
+
+Usage:
+    python mca_world_generator.py --out worlds/bench --regions 2 2 --seed 1
+"""
+
+import argparse
+import os
+import struct
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Minecraft 1.20.1; sections/block_states layout without the "Level" tag
+DATA_VERSION = 3465
+
+_TAG_END, _TAG_BYTE, _TAG_INT, _TAG_LONG = 0, 1, 3, 4
+_TAG_STRING, _TAG_LIST, _TAG_COMPOUND, _TAG_LONG_ARRAY = 8, 9, 10, 12
+
+
+# -------------------- Terrain ----------------------
+def value_noise(shape: Tuple[int, int], cell: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    Smooth noise in [0, 1): random values on a lattice with spacing
+    `cell`, smoothstep-interpolated to every point of `shape`.
+    """
+    lattice = rng.random((shape[0] // cell + 2, shape[1] // cell + 2))
+    ix, fx = np.divmod(np.arange(shape[0]), cell)
+    iz, fz = np.divmod(np.arange(shape[1]), cell)
+    tx = (fx / cell)[:, None]
+    tz = (fz / cell)[None, :]
+    tx, tz = tx * tx * (3 - 2 * tx), tz * tz * (3 - 2 * tz)
+    x0, z0 = ix[:, None], iz[None, :]
+    top = lattice[x0, z0] * (1 - tz) + lattice[x0, z0 + 1] * tz
+    bottom = lattice[x0 + 1, z0] * (1 - tz) + lattice[x0 + 1, z0 + 1] * tz
+    return top * (1 - tx) + bottom * tx
+
+
+def terrain_heightmap(shape: Tuple[int, int], seed: int, terrain: str = "noise",
+                      base: int = 64, amplitude: int = 16, scale: int = 64,
+                      octaves: int = 4) -> np.ndarray:
+    """
+    Surface height of every column of an area, indexed [x, z].
+
+    For "noise", octave k has lattice spacing scale / 2**k and half the
+    weight of the previous one.
+    """
+    if terrain == "flat":
+        return np.full(shape, base, dtype=np.int32)
+    if terrain != "noise":
+        raise ValueError(f"Unknown terrain {terrain!r}")
+    rng = np.random.default_rng(seed)
+    total = np.zeros(shape)
+    weight_sum = 0.0
+    for k in range(octaves):
+        weight = 0.5 ** k
+        total += weight * value_noise(shape, max(scale >> k, 1), rng)
+        weight_sum += weight
+    heights = base + (total / weight_sum - 0.5) * 2 * amplitude
+    return np.rint(heights).astype(np.int32)
+
+
+def column_voxels(heights: np.ndarray, y_min: int, fill: str = "layers",
+                  mix: Sequence[str] = ("stone", "dirt"),
+                  weights: Optional[Sequence[float]] = None,
+                  rng: Optional[np.random.Generator] = None):
+    """
+    Voxels of one chunk from its (16, 16) [x, z] heightmap.
+
+    Returns ``(voxels, palette)`` like mca_chunk_decoder.decode_chunk_voxels:
+    a uint16 array (height, 16, 16) indexed [y - y_min, z, x] into
+    `palette` (air first), topped at the highest column.
+    """
+    top = heights.T - y_min                      # [z, x], levels above y_min
+    height = max(int(top.max()) + 1, 1)
+    depth = top[None] - np.arange(height)[:, None, None]   # 0 = surface
+    solid = depth >= 0
+    if fill == "layers":
+        palette = ("air", "grass_block", "dirt", "stone", "bedrock")
+        voxels = np.select([depth == 0, depth <= 3], [1, 2], 3).astype(np.uint16)
+        voxels[0] = 4
+    elif fill == "random":
+        palette = ("air",) + tuple(mix)
+        if weights is not None:
+            weights = np.asarray(weights, dtype=float) / np.sum(weights)
+        voxels = (rng.choice(len(mix), size=solid.shape, p=weights) + 1).astype(np.uint16)
+    else:
+        raise ValueError(f"Unknown fill {fill!r}")
+    voxels[~solid] = 0
+    return voxels, palette
+
+
+# -------------------- NBT / Anvil encoding ----------------------
+def pack_block_states(indices: np.ndarray, bits: int) -> np.ndarray:
+    """
+    Inverse of mca_chunk_decoder.unpack_block_states (20w17a+ layout):
+    64 // bits indices per long, low bits first, no straddling.
+    """
+    per_long = 64 // bits
+    n_longs = -(-indices.size // per_long)
+    padded = np.zeros(n_longs * per_long, dtype=np.uint64)
+    padded[:indices.size] = indices
+    shifts = np.arange(per_long, dtype=np.uint64) * np.uint64(bits)
+    words = np.bitwise_or.reduce(padded.reshape(n_longs, per_long) << shifts, axis=1)
+    return words.view(np.int64)
+
+
+def _name(tag_type: int, name: str) -> bytes:
+    raw = name.encode()
+    return struct.pack(">bH", tag_type, len(raw)) + raw
+
+
+def _string(value: str) -> bytes:
+    raw = value.encode()
+    return struct.pack(">H", len(raw)) + raw
+
+
+def _palette_list(names) -> bytes:
+    # List of {Name: "minecraft:<id>"} compounds
+    out = [struct.pack(">bi", _TAG_COMPOUND, len(names))]
+    for name in names:
+        out.append(_name(_TAG_STRING, "Name") + _string(f"minecraft:{name}")
+                   + bytes([_TAG_END]))
+    return b"".join(out)
+
+
+def encode_chunk_nbt(voxels: np.ndarray, palette, chunk_x: int, chunk_z: int,
+                     y_min: int) -> bytes:
+    """
+    Uncompressed NBT of one chunk. `voxels` is (height, 16, 16) [y, z, x]
+    with `y_min` a multiple of 16; all-air sections are left out.
+    """
+    sections = []
+    for start in range(0, voxels.shape[0], 16):
+        block = np.zeros((16, 16, 16), dtype=np.uint16)
+        part = voxels[start:start + 16]
+        block[:part.shape[0]] = part
+        used, indices = np.unique(block, return_inverse=True)
+        if used.size == 1 and used[0] == 0:
+            continue
+        states = _name(_TAG_LIST, "palette") + _palette_list([palette[i] for i in used])
+        if used.size > 1:
+            bits = max((used.size - 1).bit_length(), 4)
+            longs = pack_block_states(indices.reshape(-1), bits)
+            states += (_name(_TAG_LONG_ARRAY, "data")
+                       + struct.pack(">i", longs.size) + longs.astype(">i8").tobytes())
+        biomes = _name(_TAG_LIST, "palette") + struct.pack(">bi", _TAG_STRING, 1) \
+            + _string("minecraft:plains")
+        sections.append(
+            _name(_TAG_BYTE, "Y") + struct.pack(">b", (y_min + start) >> 4)
+            + _name(_TAG_COMPOUND, "block_states") + states + bytes([_TAG_END])
+            + _name(_TAG_COMPOUND, "biomes") + biomes + bytes([_TAG_END])
+            + bytes([_TAG_END]))
+
+    body = (_name(_TAG_INT, "DataVersion") + struct.pack(">i", DATA_VERSION)
+            + _name(_TAG_INT, "xPos") + struct.pack(">i", chunk_x)
+            + _name(_TAG_INT, "zPos") + struct.pack(">i", chunk_z)
+            + _name(_TAG_INT, "yPos") + struct.pack(">i", y_min >> 4)
+            + _name(_TAG_STRING, "Status") + _string("minecraft:full")
+            + _name(_TAG_LONG, "LastUpdate") + struct.pack(">q", 0)
+            + _name(_TAG_LIST, "sections")
+            + struct.pack(">bi", _TAG_COMPOUND, len(sections)) + b"".join(sections))
+    return _name(_TAG_COMPOUND, "") + body + bytes([_TAG_END])
+
+
+def write_region(path: Path, chunks: Dict[Tuple[int, int], bytes],
+                 timestamp: Optional[int] = None):
+    """
+    Writes a region file from uncompressed chunk NBT keyed by (local_x,
+    local_z) within the region (0..31). Every chunk gets `timestamp`
+    (default 0) as its last-modification time.
+    """
+    timestamp = 0 if timestamp is None else timestamp
+    locations = np.zeros(1024, dtype=">i4")
+    timestamps = np.zeros(1024, dtype=">i4")
+    payloads, sector = [], 2
+    for (local_x, local_z), nbt_bytes in sorted(chunks.items(), key=lambda c: (c[0][1], c[0][0])):
+        data = zlib.compress(nbt_bytes)
+        # 4-byte length (including the compression byte), 2 = zlib
+        payload = struct.pack(">IB", len(data) + 1, 2) + data
+        n_sectors = -(-len(payload) // 4096)
+        payloads.append(payload.ljust(n_sectors * 4096, b"\0"))
+        index = local_x + local_z * 32
+        locations[index] = (sector << 8) | n_sectors
+        timestamps[index] = timestamp
+        sector += n_sectors
+    tmp = Path(path).with_name(Path(path).name + f".tmp{os.getpid()}")
+    with open(tmp, "wb") as f:
+        f.write(locations.tobytes())
+        f.write(timestamps.tobytes())
+        f.writelines(payloads)
+    os.replace(tmp, path)
+
+
+# -------------------- World ----------------------
+def _generate_region(task):
+    (out_dir, region_x, region_z, heights, origin, y_min, fill, mix, weights,
+     seed, timestamp) = task
+    chunks = {}
+    for local_x in range(32):
+        for local_z in range(32):
+            chunk_x, chunk_z = region_x * 32 + local_x, region_z * 32 + local_z
+            i, j = chunk_x * 16 - origin[0], chunk_z * 16 - origin[1]
+            if i < 0 or j < 0 or i >= heights.shape[0] or j >= heights.shape[1]:
+                continue
+            # Per-chunk stream, independent of worker scheduling
+            rng = np.random.default_rng([seed, chunk_x + 2 ** 31, chunk_z + 2 ** 31])
+            voxels, palette = column_voxels(heights[i:i + 16, j:j + 16], y_min,
+                                            fill, mix, weights, rng)
+            chunks[local_x, local_z] = encode_chunk_nbt(voxels, palette,
+                                                        chunk_x, chunk_z, y_min)
+    path = Path(out_dir) / f"r.{region_x}.{region_z}.mca"
+    write_region(path, chunks, timestamp)
+    return path, len(chunks)
+
+
+def generate_world(out_dir: Path, chunk_min: Tuple[int, int], chunk_max: Tuple[int, int],
+                   seed: int = 0, terrain: str = "noise", fill: str = "layers",
+                   mix: Sequence[str] = ("stone", "dirt"),
+                   weights: Optional[Sequence[float]] = None,
+                   base: int = 64, amplitude: int = 16, scale: int = 64,
+                   y_min: int = 0, processes: Optional[int] = None,
+                   timestamp: Optional[int] = None):
+    """
+    Writes every chunk of the inclusive box chunk_min..chunk_max into
+    region files under `out_dir`, one worker task per region file.
+
+    The heightmap is drawn once for the whole box, so terrain is seamless
+    across chunk and region borders. `timestamp` (seconds since the
+    epoch) goes into every chunk's header entry; by default it is derived
+    from the other arguments, so the output is byte-identical for equal
+    arguments. Returns the list of written paths.
+    """
+    (cx0, cz0), (cx1, cz1) = chunk_min, chunk_max
+    if y_min % 16:
+        raise ValueError("y_min must be a multiple of 16")
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    heights = terrain_heightmap(((cx1 - cx0 + 1) * 16, (cz1 - cz0 + 1) * 16), seed,
+                                terrain, base, amplitude, scale)
+    heights = np.maximum(heights, y_min)
+    origin = (cx0 * 16, cz0 * 16)
+    if timestamp is None:
+        params = (chunk_min, chunk_max, seed, terrain, fill, tuple(mix), weights,
+                  base, amplitude, scale, y_min)
+        timestamp = zlib.crc32(repr(params).encode()) & 0x7FFFFFFF
+
+    tasks = []
+    for region_x in range(cx0 >> 5, (cx1 >> 5) + 1):
+        for region_z in range(cz0 >> 5, (cz1 >> 5) + 1):
+            # Only the part of the heightmap inside this region
+            i0 = max(region_x * 512 - origin[0], 0)
+            j0 = max(region_z * 512 - origin[1], 0)
+            part = heights[i0:max(region_x * 512 + 512 - origin[0], 0),
+                           j0:max(region_z * 512 + 512 - origin[1], 0)]
+            tasks.append((out_dir, region_x, region_z, part,
+                          (origin[0] + i0, origin[1] + j0), y_min, fill,
+                          tuple(mix), weights, seed, timestamp))
+
+    if processes == 1 or len(tasks) == 1:
+        results = [_generate_region(t) for t in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            results = list(pool.map(_generate_region, tasks))
+    return [path for path, _ in results]
+
+
+# -------------------- Main ----------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Generate a reproducible synthetic Minecraft world.")
+    parser.add_argument("--out", type=Path, default=Path("synthetic_world"))
+    box = parser.add_mutually_exclusive_group()
+    box.add_argument("--chunks", type=int, nargs=4, metavar=("X0", "Z0", "X1", "Z1"),
+                     help="inclusive bounding box in chunk coordinates")
+    box.add_argument("--regions", type=int, nargs=2, metavar=("NX", "NZ"),
+                     help="NX x NZ full region files starting at r.0.0")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--terrain", choices=("flat", "noise"), default="noise")
+    parser.add_argument("--fill", choices=("layers", "random"), default="layers")
+    parser.add_argument("--mix", nargs="+", default=["stone", "dirt"],
+                        help="block ids drawn by --fill random")
+    parser.add_argument("--weights", type=float, nargs="+", default=None,
+                        help="relative frequency of each --mix block")
+    parser.add_argument("--base", type=int, default=64, help="mean surface height")
+    parser.add_argument("--amplitude", type=int, default=16)
+    parser.add_argument("--scale", type=int, default=64,
+                        help="largest noise feature size in blocks")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="generator processes (default: all cores, 1 = inline)")
+    parser.add_argument("--timestamp", type=int, default=None,
+                        help="chunk timestamp in the region headers (default: derived "
+                             "from the other options, so reruns are byte-identical)")
+    args = parser.parse_args(argv)
+
+    if args.regions:
+        chunk_min, chunk_max = (0, 0), (args.regions[0] * 32 - 1, args.regions[1] * 32 - 1)
+    elif args.chunks:
+        chunk_min, chunk_max = tuple(args.chunks[:2]), tuple(args.chunks[2:])
+    else:
+        chunk_min, chunk_max = (0, 0), (31, 31)
+    if args.weights is not None and len(args.weights) != len(args.mix):
+        parser.error("--weights needs one value per --mix block")
+
+    start = time.perf_counter()
+    paths = generate_world(args.out, chunk_min, chunk_max, args.seed, args.terrain,
+                           args.fill, args.mix, args.weights, args.base,
+                           args.amplitude, args.scale, processes=args.workers,
+                           timestamp=args.timestamp)
+    elapsed = time.perf_counter() - start
+    n_chunks = (chunk_max[0] - chunk_min[0] + 1) * (chunk_max[1] - chunk_min[1] + 1)
+    print(f"Wrote {n_chunks} chunks in {len(paths)} region file(s) to {args.out} "
+          f"in {elapsed:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
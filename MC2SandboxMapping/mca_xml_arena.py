@@ -0,0 +1,284 @@
+"""
+mca_xml_arena.py
+
+Direct XML emission of block geoms for very large Minecraft arenas.
+
+MCAArena adds every box through ``worldbody.add``, which builds a PyMJCF
+element (with per-attribute validation) per geom and serializes it again
+in ``to_xml_string``. Here the box geoms are formatted straight from
+NumPy arrays into MJCF lines and spliced into the XML of a small
+RootElement (floor, materials, default classes). Flies, cameras and
+everything else are still added through PyMJCF, so the arena works with
+BaseArena / SingleFlySimulation (and mjcf_model_cache) as usual.
+
+FlyGym only collides the fly with arena geoms through explicit contact
+pairs, created in Fly.init_floor_contacts for the PyMJCF geoms it can
+see. The pairs it creates for the floor are used as templates and
+repeated, as XML lines, for every block geom.
+
+Usage:
+    arena = MCAXmlArena(blocks, block_size=10, block_height=10)
+    arena = MCAXmlArena.from_mosaic(extract_chunk_area(...))
+
+Benchmark (1k to 1M blocks, vs the PyMJCF path):
+    python mca_xml_arena.py --sizes 1000 10000 100000 1000000
+"""
+
+import argparse
+import re
+import time
+
+import numpy as np
+from dm_control import mjcf
+from flygym.arena.base import BaseArena
+
+from mca_block_materials import BlockMaterials
+from mca_greedy_merge import merge_surface_blocks
+
+FLOOR_NAME = "floor"
+
+
+class BulkGeomRootElement(mjcf.RootElement):
+    """
+    RootElement whose XML also contains prebuilt geom lines (appended to
+    the worldbody) and one copy of every floor contact pair per geom.
+    """
+    __slots__ = ["_bulk_names", "_bulk_lines"]
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._bulk_names = []
+        self._bulk_lines = []
+
+    def add_bulk_geoms(self, names, lines):
+        """Registers geoms as parallel lists of names and `<geom .../>` lines."""
+        self._bulk_names.extend(names)
+        self._bulk_lines.extend(lines)
+
+    @property
+    def num_bulk_geoms(self) -> int:
+        return len(self._bulk_names)
+
+    def to_xml_string(self, prefix_root=None, self_only=False, *args, **kwargs):
+        xml = super().to_xml_string(prefix_root, self_only, *args, **kwargs)
+        if self_only or not self._bulk_lines:
+            return xml
+        parts = [xml[:xml.rindex("</worldbody>")], "\n".join(self._bulk_lines), "\n"]
+        rest = xml[xml.rindex("</worldbody>"):]
+
+        pattern = rf'<pair name="{FLOOR_NAME}_[^>]*geom2="{FLOOR_NAME}"[^>]*/>'
+        templates = [t.replace(f'name="{FLOOR_NAME}_', 'name="\0_')
+                      .replace(f'geom2="{FLOOR_NAME}"', 'geom2="\0"').split("\0")
+                     for t in re.findall(pattern, rest)]
+        if templates:
+            end = rest.rindex("</contact>")
+            pairs = "\n".join(name.join(t) for name in self._bulk_names for t in templates)
+            parts += [rest[:end], pairs, "\n", rest[end:]]
+        else:
+            parts.append(rest)
+        return "".join(parts)
+
+
+def box_geom_lines(classes, centers, half_sizes, block_half, name_prefix="block"):
+    """
+    `<geom>` lines for boxes of the given default classes. `half_sizes`
+    equal to `block_half` are left to the class.
+
+    Returns (names, lines).
+    """
+    names = [f"{name_prefix}_{i}" for i in range(len(classes))]
+    custom = np.any(half_sizes != np.asarray(block_half), axis=1)
+    lines = [
+        (f'<geom name="{name}" class="{cls}" pos="{x:g} {y:g} {z:g}" '
+         f'size="{sx:g} {sy:g} {sz:g}"/>') if c else
+        f'<geom name="{name}" class="{cls}" pos="{x:g} {y:g} {z:g}"/>'
+        for name, cls, (x, y, z), (sx, sy, sz), c in zip(
+            names, classes, centers.tolist(), half_sizes.tolist(), custom.tolist())
+    ]
+    return names, lines
+
+
+class MCAXmlArena(BaseArena):
+    """
+    Same arena as MCAArena (box geoms, material classes, optional greedy
+    merging and true elevation), with the block geoms emitted as XML in
+    bulk instead of one PyMJCF element each.
+
+    The block geoms are not PyMJCF elements, so they cannot be found or
+    bound through `root_element`; `num_block_geoms` reports their count.
+    Every block geom also gets one contact pair per fly contact geom,
+    so merge_boxes=True keeps large arenas much cheaper to simulate.
+    """
+    def __init__(self,
+                 surface_blocks,
+                 block_size: float = 10,
+                 block_height: float = 10,
+                 merge_boxes: bool = False,
+                 true_elevation: bool = False,
+                 base_y: int = None,
+                 materials: BlockMaterials = None):
+        xs = np.array([b[0] for b in surface_blocks], dtype=np.int64)
+        ys = np.array([b[1] for b in surface_blocks], dtype=np.int64)
+        zs = np.array([b[2] for b in surface_blocks], dtype=np.int64)
+        types, labels = np.unique(np.array([b[3] for b in surface_blocks], dtype=object)
+                                  if surface_blocks else np.array([], dtype=object),
+                                  return_inverse=True)
+        self._init_blocks(xs, ys, zs, labels.reshape(-1), tuple(types), block_size,
+                          block_height, merge_boxes, true_elevation, base_y, materials)
+
+    @classmethod
+    def from_arrays(cls, xs, ys, zs, labels, types, **kwargs):
+        """
+        Builds the arena from parallel block arrays: world x, y, z and an
+        index into `types` (block ids) per block.
+        """
+        arena = cls.__new__(cls)
+        arena._init_blocks(np.asarray(xs), np.asarray(ys), np.asarray(zs),
+                           np.asarray(labels), tuple(types), **kwargs)
+        return arena
+
+    @classmethod
+    def from_mosaic(cls, mosaic, **kwargs):
+        """Builds the arena straight from a SurfaceMosaic's arrays."""
+        ix, iz = np.nonzero(mosaic.block_ids)
+        return cls.from_arrays(ix + mosaic.origin[0], mosaic.heightmap[ix, iz],
+                               iz + mosaic.origin[1], mosaic.block_ids[ix, iz],
+                               mosaic.palette, **kwargs)
+
+    def _init_blocks(self, xs, ys, zs, labels, types, block_size=10, block_height=10,
+                     merge_boxes=False, true_elevation=False, base_y=None,
+                     materials=None):
+        BaseArena.__init__(self)
+        self.block_size = block_size
+        self.block_height = block_height
+        self.merge_boxes = merge_boxes
+        self.true_elevation = true_elevation
+        if base_y is None:
+            base_y = int(ys.min()) - 1 if ys.size else 0
+        self.base_y = base_y
+        self.max_y = int(ys.max()) if ys.size else None
+        self.materials = materials or BlockMaterials.from_file()
+        # Everything the model depends on, for mjcf_model_cache
+        self.cache_params = {
+            "arena": type(self).__name__, "xs": xs, "ys": ys, "zs": zs,
+            "labels": labels, "types": types, "block_size": block_size,
+            "block_height": block_height, "merge_boxes": merge_boxes,
+            "true_elevation": true_elevation, "base_y": base_y,
+            "materials": self.materials,
+        }
+        self._build_model(xs, ys, zs, labels, types)
+
+    def _build_model(self, xs, ys, zs, labels, types):
+        # Create root element
+        self.root_element = BulkGeomRootElement(model="mca_arena")
+        worldbody = self.root_element.worldbody
+
+        # Base floor plane
+        worldbody.add(
+            "geom", name=FLOOR_NAME, type="plane",
+            size=[500, 500, 0.1], pos=[0, 0, 0], rgba=[0.9, 0.9, 0.9, 1]
+        )
+
+        # Boxes as arrays x0, z0, x1, z1 (exclusive), y, label
+        n_blocks = xs.size
+        if self.merge_boxes:
+            rects = merge_surface_blocks(list(zip(xs.tolist(), ys.tolist(),
+                                                  zs.tolist(), labels.tolist())))
+            boxes = np.array(rects, dtype=np.int64).reshape(-1, 6)
+        else:
+            boxes = np.stack([xs, zs, xs + 1, zs + 1, ys, labels], axis=1).astype(np.int64)
+        x0, z0, x1, z1, y, label = boxes.T
+        self.num_block_geoms = len(boxes)
+        self.geoms_saved = n_blocks - len(boxes)
+
+        # One default class per material, resolved once per block type
+        block_half = [self.block_size / 2.0, self.block_size / 2.0,
+                      self.block_height / 2.0]
+        class_of = [self.materials.resolve(t) for t in types]
+        self.materials.add_classes(self.root_element,
+                                   [class_of[i] for i in np.unique(label)], block_half)
+
+        centers = np.empty((len(boxes), 3))
+        centers[:, 0] = (x0 + x1 - 1) * self.block_size / 2.0
+        centers[:, 1] = (z0 + z1 - 1) * self.block_size / 2.0
+        if self.true_elevation:
+            centers[:, 2] = (y - self.base_y - 0.5) * self.block_height
+        else:
+            centers[:, 2] = self.block_height / 2.0
+        half_sizes = np.empty((len(boxes), 3))
+        half_sizes[:, 0] = (x1 - x0) * self.block_size / 2.0
+        half_sizes[:, 1] = (z1 - z0) * self.block_size / 2.0
+        half_sizes[:, 2] = self.block_height / 2.0
+
+        classes = np.array(class_of, dtype=object)[label] if len(boxes) else []
+        self.root_element.add_bulk_geoms(
+            *box_geom_lines(classes, centers, half_sizes, block_half))
+
+    def get_model(self):
+        return self.root_element
+
+    def _get_max_floor_height(self):
+        if self.true_elevation and self.max_y is not None:
+            return (self.max_y - self.base_y) * self.block_height
+        return self.block_height
+
+    def get_spawn_position(self, rel_pos, rel_angle):
+        return rel_pos, rel_angle
+
+
+# -------------------- Benchmark ----------------------
+def _synthetic_blocks(n_blocks, seed=0):
+    from mca_world_generator import terrain_heightmap
+
+    side = max(int(round(n_blocks ** 0.5)), 1)
+    heights = terrain_heightmap((side, side), seed, amplitude=8, scale=32)
+    xs, zs = np.indices((side, side)).reshape(2, -1)
+    rng = np.random.default_rng(seed)
+    labels = rng.integers(0, 3, size=xs.size)
+    return xs, heights.ravel(), zs, labels, ("grass_block", "dirt", "stone")
+
+
+def main():
+    from mca_to_mjcf_arena import MCAArena
+
+    parser = argparse.ArgumentParser(
+        description="Build time of MCAXmlArena vs the PyMJCF MCAArena path.")
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=[1_000, 10_000, 100_000, 1_000_000])
+    parser.add_argument("--max-mjcf", type=int, default=10_000,
+                        help="skip the PyMJCF path above this many blocks (it grows "
+                             "faster than linearly)")
+    parser.add_argument("--compile", action="store_true",
+                        help="also compile the arena XML with MuJoCo")
+    args = parser.parse_args()
+
+    import mujoco
+
+    def run(build):
+        start = time.perf_counter()
+        arena = build()
+        xml = arena.root_element.to_xml_string()
+        built = time.perf_counter() - start
+        if not args.compile:
+            return built, None
+        start = time.perf_counter()
+        mujoco.MjModel.from_xml_string(xml, arena.root_element.get_assets())
+        return built, time.perf_counter() - start
+
+    print(f"{'blocks':>9} {'path':>6} {'build+xml s':>12} {'compile s':>10}")
+    for n in args.sizes:
+        xs, ys, zs, labels, types = _synthetic_blocks(n)
+        paths = [("xml", lambda: MCAXmlArena.from_arrays(
+            xs, ys, zs, labels, types, true_elevation=True))]
+        if xs.size <= args.max_mjcf:
+            blocks = list(zip(xs.tolist(), ys.tolist(), zs.tolist(),
+                              [types[i] for i in labels]))
+            paths.insert(0, ("mjcf", lambda: MCAArena(blocks, true_elevation=True)))
+        for name, build in paths:
+            built, compiled = run(build)
+            compiled = "-" if compiled is None else f"{compiled:.2f}"
+            print(f"{xs.size:>9} {name:>6} {built:>12.2f} {compiled:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+"""
+mjcf_model_cache.py
+
+Cache of compiled MuJoCo models.
+
+dm_control builds and compiles the full MJCF (arena + fly) on every
+launch, which dominates startup for large Minecraft arenas. The compiled
+model is stored in MuJoCo's binary (.mjb) format and loaded on later
+launches with the same arena and fly.
+
+CachedSingleFlySimulation keys the model on construction parameters:
+the arena's `cache_params` (MCAArena, MCAXmlArena, MCAHeightfieldArena),
+the fly's own MJCF and contact settings, the cameras, the timestep and
+the flygym, dm_control and MuJoCo versions. On a hit it skips the floor
+contact pairs (Fly.init_floor_contacts) and the XML of the combined
+model, which cost far more than the compile itself. Arenas without
+`cache_params` fall back to hashing the generated XML and assets.
+
+Simulation.__init__ builds its physics inline, so the subclass repeats
+that constructor (flygym 1.2) with the physics step swapped for the
+cache, instead of patching mjcf.Physics or the fly for the process.
+
+Usage:
+    sim = CachedSingleFlySimulation(fly=fly, cameras=[cam], arena=arena)
+
+or, for code that builds its own MJCF model:
+    physics = physics_from_mjcf_model(mjcf_model)
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import tempfile
+import time
+from collections.abc import Iterable
+from importlib.metadata import version
+from pathlib import Path
+from typing import Optional
+
+import mujoco
+import numpy as np
+from dm_control import mjcf
+from flygym import Camera, SingleFlySimulation
+from flygym.arena import FlatTerrain
+
+DEFAULT_CACHE_DIR = Path(".mjcf_cache")
+
+
+def model_key(xml_string: str, assets: dict) -> str:
+    """Hash of everything the compiled model depends on."""
+    digest = hashlib.sha256()
+    digest.update(mujoco.__version__.encode())
+    digest.update(xml_string.encode())
+    for name in sorted(assets):
+        digest.update(name.encode())
+        content = assets[name]
+        digest.update(content if isinstance(content, bytes) else content.encode())
+    return digest.hexdigest()
+
+
+def _jsonable(value):
+    if isinstance(value, np.ndarray):
+        value = np.ascontiguousarray(value)
+        return [str(value.dtype), value.shape, hashlib.sha256(value.tobytes()).hexdigest()]
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, mjcf.Element):
+        # e.g. the default class of a camera
+        return [value.tag, getattr(value, "dclass", None) or getattr(value, "name", None)]
+    if hasattr(value, "cache_params"):
+        return value.cache_params
+    raise TypeError(f"{type(value).__name__} has no cache_params")
+
+
+def camera_params(cam) -> list:
+    """The MJCF camera a FlyGym Camera adds, and where it is attached."""
+    attachment = cam.attachment_point
+    element = attachment.root.find("camera", str(cam.camera_id).split("/")[-1])
+    return [cam.camera_id, attachment.root.model, attachment.tag,
+            getattr(attachment, "name", None),
+            None if element is None else element.get_attributes()]
+
+
+def simulation_key(fly, cameras, arena, timestep: float) -> Optional[str]:
+    """
+    Hash of the construction parameters of a single-fly simulation, or
+    None if the arena does not describe itself with `cache_params`.
+    """
+    arena_params = getattr(arena, "cache_params", None)
+    if arena_params is None:
+        return None
+    params = {
+        "versions": [version("flygym"), version("dm_control"), mujoco.__version__],
+        "arena": arena_params,
+        "arena_friction": arena.friction,
+        "timestep": timestep,
+        "fly": [fly.name, fly.model.to_xml_string(), fly.spawn_pos, fly.spawn_orientation,
+                fly.friction, fly.contact_solref, fly.contact_solimp, fly.floor_collisions],
+        # Cameras add elements to the fly or the arena at construction
+        "cameras": [camera_params(cam) for cam in cameras],
+    }
+    text = json.dumps(params, sort_keys=True, default=_jsonable)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def _load_binary(path: Path):
+    if path.exists():
+        try:
+            return mjcf.Physics.from_binary_path(str(path))
+        except Exception:
+            path.unlink(missing_ok=True)   # stale or truncated; recompile
+    return None
+
+
+def physics_from_mjcf_model(mjcf_model, cache_dir: Path = DEFAULT_CACHE_DIR,
+                            key: Optional[str] = None):
+    """
+    Drop-in replacement for mjcf.Physics.from_mjcf_model that loads the
+    compiled model from `cache_dir` when the same XML was compiled before,
+    and stores it there otherwise. If `key` is given it names the cache
+    entry instead of a hash of the XML.
+    """
+    xml_string = mjcf_model.to_xml_string()
+    assets = mjcf_model.get_assets()
+    path = Path(cache_dir) / f"{key or model_key(xml_string, assets)}.mjb"
+    if key is None:
+        physics = _load_binary(path)
+        if physics is not None:
+            return physics
+
+    physics = mjcf.Physics.from_xml_string(xml_string=xml_string, assets=assets)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + f".tmp{os.getpid()}")
+    mujoco.mj_saveModel(physics.model.ptr, str(tmp), None)
+    os.replace(tmp, path)
+    return physics
+
+
+class CachedSingleFlySimulation(SingleFlySimulation):
+    """
+    SingleFlySimulation whose compiled model comes from the cache (see
+    the module docstring for the key). `model_cache_dir=None` compiles
+    as SingleFlySimulation does, without reading or writing a cache.
+    """
+    def __init__(self, fly, cameras=None, arena=None, timestep: float = 0.0001,
+                 gravity=(0.0, 0.0, -9.81e3), *,
+                 model_cache_dir: Optional[Path] = DEFAULT_CACHE_DIR):
+        # Simulation.__init__ of flygym 1.2, but for _build_physics()
+        self.fly = fly
+        self.flies = [fly]
+        if cameras is None:
+            self.cameras = [Camera(attachment_point=fly.model.worldbody,
+                                   camera_name="camera_left")]
+        elif isinstance(cameras, Iterable):
+            self.cameras = list(cameras)
+        else:
+            self.cameras = [cameras]
+        self.arena = arena if arena is not None else FlatTerrain()
+        self.timestep = timestep
+        self.curr_time = 0.0
+        self._floor_height = self.arena._get_max_floor_height()
+        self.arena.spawn_entity(fly.model, fly.spawn_pos, fly.spawn_orientation)
+        self.arena.root_element.option.timestep = timestep
+
+        self.physics = self._build_physics(model_cache_dir)
+
+        for camera in self.cameras:
+            camera.init_camera_orientation(self.physics)
+        self.gravity = gravity
+        self._set_init_pose()
+        fly.post_init(self)
+
+    def _build_physics(self, cache_dir: Optional[Path]):
+        if cache_dir is None:
+            self.fly.init_floor_contacts(self.arena)
+            return mjcf.Physics.from_mjcf_model(self.arena.root_element)
+        key = simulation_key(self.fly, self.cameras, self.arena, self.timestep)
+        if key is not None:
+            physics = _load_binary(Path(cache_dir) / f"{key}.mjb")
+            if physics is not None:
+                # The floor contact pairs are compiled into the cached model
+                self.fly._floor_contacts = {}
+                return physics
+        self.fly.init_floor_contacts(self.arena)
+        return physics_from_mjcf_model(self.arena.root_element, cache_dir, key)
+
+
+# -------------------- Benchmark ----------------------
+def main():
+    from flygym import Fly
+    from mca_area_extraction import extract_chunk_area, mosaic_to_blocks
+    from mca_to_mjcf_arena import MCAArena
+
+    parser = argparse.ArgumentParser(
+        description="Cold compile vs warm cache load of an MCAArena simulation.")
+    parser.add_argument("--region-dir", type=Path, default=Path("."))
+    parser.add_argument("--chunks", type=int, nargs=4, default=(0, 0, 1, 1),
+                        metavar=("X0", "Z0", "X1", "Z1"))
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    x0, z0, x1, z1 = args.chunks
+    blocks = mosaic_to_blocks(extract_chunk_area(args.region_dir, (x0, z0), (x1, z1)))
+
+    def launch(cache_dir):
+        # Same fly name every time, as in a fresh process
+        start = time.perf_counter()
+        arena = MCAArena(blocks, block_size=10, block_height=10)
+        fly = Fly(name="0", init_pose="stretch", control="position")
+        sim = CachedSingleFlySimulation(fly=fly, cameras=[], arena=arena,
+                                        model_cache_dir=cache_dir)
+        elapsed = time.perf_counter() - start
+        ngeom = sim.physics.model.ngeom
+        sim.close()
+        return elapsed, ngeom
+
+    cold, warm = [], []
+    for _ in range(args.repeats):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            elapsed, ngeom = launch(cache_dir)
+            cold.append(elapsed)
+            warm.append(launch(cache_dir)[0])
+
+    print(f"{len(blocks)} blocks, {ngeom} geoms")
+    print(f"Cold compile: {min(cold):.3f} s")
+    print(f"Warm load:    {min(warm):.3f} s ({min(cold) / min(warm):.1f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
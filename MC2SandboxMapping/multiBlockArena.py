@@ -4,23 +4,33 @@ multiBlockArena.py
 
 1. Defines a MultiCenterBlockArena with five boxes around the origin.
 2. Runs a SingleFlySimulation with a fixed top-down camera.
-3. Captures every frame via physics.render() into a list.
-4. Writes out an MP4 (imageio-ffmpeg) and a PNG snapshot.
+3. Renders only the steps that become video frames (fps / play speed;
+   by default every step, as before), optionally on a worker thread fed
+   with state snapshots (--async-render with MUJOCO_GL=egl or osmesa,
+   worthwhile with a spare core), and streams them to an MP4
+   (imageio-ffmpeg), so memory stays flat however long the run is.
+4. Writes a PNG snapshot of the last frame.
 """
 
+import argparse
 import os
+import sys
 # (No MUJOCO_GL override here—using default GLFW on Windows)
 
 from pathlib import Path
 import numpy as np
-import matplotlib.pyplot as plt
-import imageio  # pip install imageio imageio-ffmpeg
 
 from dm_control import mjcf
 from flygym.arena.base import BaseArena
-from flygym import Fly, Camera, SingleFlySimulation
+from flygym import Fly, Camera
 from flygym.preprogrammed import all_leg_dofs
 
+from mjcf_model_cache import DEFAULT_CACHE_DIR, CachedSingleFlySimulation
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from render_scheduler import AsyncRenderer, RenderScheduler, offscreen_threads_supported
+from video_recorder import VideoRecorder  # pip install imageio imageio-ffmpeg
+
 
 class MultiCenterBlockArena(BaseArena):
     """Five blocks clustered around (0,0), flush with the floor plane."""
@@ -28,6 +38,8 @@ class MultiCenterBlockArena(BaseArena):
         super().__init__()                 # must call before building MJCF
         self.block_size   = block_size
         self.block_height = block_height
+        self.cache_params = {"arena": type(self).__name__, "block_size": block_size,
+                             "block_height": block_height}
         self._build_arena()
 
     def _build_arena(self):
@@ -80,7 +92,26 @@ class MultiCenterBlockArena(BaseArena):
         return rel_pos, rel_angle
 
 
-def main():
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Preview video of the multi-block arena.")
+    parser.add_argument("--run-time", type=float, default=0.01,
+                        help="simulated seconds (default: 100 steps)")
+    parser.add_argument("--play-speed", type=float, default=None,
+                        help="simulated seconds per second of video "
+                             "(default: timestep x fps, one frame per step)")
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--async-render", action="store_true",
+                        help="render on a worker thread so physics steps do not wait")
+    parser.add_argument("--no-model-cache", action="store_true",
+                        help="always compile the model instead of using .mjcf_cache")
+    args = parser.parse_args(argv)
+    if args.async_render and not offscreen_threads_supported():
+        print("Warning: --async-render needs MUJOCO_GL=egl or osmesa; rendering synchronously")
+        args.async_render = False
+    timestep = 1e-4
+    # Default: one video frame per physics step, like the original preview
+    play_speed = args.play_speed or timestep * args.fps
+
     # 1) Build arena & fly
     arena = MultiCenterBlockArena(block_size=50, block_height=20)
     fly   = Fly(init_pose="stretch", control="position")
@@ -97,13 +128,16 @@ def main():
         camera_name="cam_top",
         targeted_fly_names=fly.name,
         camera_parameters=cam_params,
-        play_speed=1.0,
+        play_speed=play_speed,
+        fps=args.fps,
         draw_contacts=False,
         window_size=(800, 608)  # make height divisible by 16 for video
     )
 
     # 3) Create the simulation
-    sim = SingleFlySimulation(fly=fly, cameras=[cam], arena=arena)
+    sim = CachedSingleFlySimulation(
+        fly=fly, cameras=[cam], arena=arena, timestep=timestep,
+        model_cache_dir=None if args.no_model_cache else DEFAULT_CACHE_DIR)
     physics = sim.physics
 
     # 4) Resolve the true camera_id
@@ -112,26 +146,31 @@ def main():
             cam.camera_id = cid
             break
 
-    # 5) Step & capture frames manually
+    # 5) Step, rendering only when a video frame is due, and stream the
+    #    frames to the MP4 as they are rendered
     WIDTH, HEIGHT = 800, 608
-    frames = []
-    for _ in range(100):
-        sim.step({"joints": [0.0] * len(all_leg_dofs)})
-        img = physics.render(width=WIDTH, height=HEIGHT, camera_id=cam.camera_id)
-        frames.append(img)
-
-    # 6) Save outputs
     out_dir = Path("outputs/arena_preview/")
-    out_dir.mkdir(exist_ok=True, parents=True)
-
-    # a) MP4 via imageio
     video_path = out_dir / "arena_preview.mp4"
-    imageio.mimwrite(str(video_path), frames, fps=30)
-    print("Video saved at:", video_path)
-
-    # b) PNG snapshot via matplotlib
+    scheduler = RenderScheduler(args.fps, play_speed)
+    num_steps = int(args.run_time / sim.timestep)
+    with VideoRecorder(video_path, fps=args.fps) as recorder:
+        if args.async_render:
+            with AsyncRenderer(physics, cam.camera_id, (WIDTH, HEIGHT), recorder) as renderer:
+                for _ in range(num_steps):
+                    sim.step({"joints": [0.0] * len(all_leg_dofs)})
+                    if scheduler.due(sim.curr_time):
+                        renderer.submit(physics)
+        else:
+            for _ in range(num_steps):
+                sim.step({"joints": [0.0] * len(all_leg_dofs)})
+                if scheduler.due(sim.curr_time):
+                    recorder.append(physics.render(width=WIDTH, height=HEIGHT,
+                                                   camera_id=cam.camera_id))
+    print(f"Video saved at: {video_path} ({scheduler.frames} frames from {num_steps} steps)")
+
+    # 6) PNG snapshot of the last frame
     snapshot_path = out_dir / "arena_snapshot.png"
-    plt.imsave(snapshot_path, frames[-1])
+    recorder.save_snapshot(snapshot_path)
     print("Snapshot saved at:", snapshot_path)
 
     sim.close()
@@ -1,11 +1,20 @@
+import argparse
+
 from dm_control import mjcf
 from flygym.arena.base import BaseArena
-from flygym import Fly, Camera, SingleFlySimulation
+from flygym import Fly
 from flygym.preprogrammed import all_leg_dofs
 from pathlib import Path
+import sys
 import numpy as np
 import matplotlib.pyplot as plt
 
+from mjcf_model_cache import DEFAULT_CACHE_DIR, CachedSingleFlySimulation
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from render_scheduler import RenderScheduler
+from video_recorder import StreamingCamera, VideoRecorder, drain_camera
+
 # =========== Custom Arena Definition ====================
 class SingleBlockArena(BaseArena):
     """
@@ -15,6 +24,8 @@ class SingleBlockArena(BaseArena):
         super().__init__()
         self.block_size = block_size
         self.block_height = block_height
+        self.cache_params = {"arena": type(self).__name__, "block_size": block_size,
+                             "block_height": block_height}
         self._build_arena()
 
     def _build_arena(self):
@@ -54,6 +65,11 @@ class SingleBlockArena(BaseArena):
 
 # ==================== Arena Visualization ====================
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Preview video of the single-block arena.")
+    parser.add_argument("--no-model-cache", action="store_true",
+                        help="always compile the model instead of using .mjcf_cache")
+    args = parser.parse_args()
+
     # Create arena and fly
     arena = SingleBlockArena(block_size=50, block_height=20)
     fly = Fly(init_pose="stretch", control="position")
@@ -67,7 +83,7 @@ if __name__ == "__main__":
     }
 
     # Attach the camera
-    cam = Camera(
+    cam = StreamingCamera(
         attachment_point=fly.model.worldbody,
         camera_name="cam_top",
         targeted_fly_names=fly.name,
@@ -78,23 +94,25 @@ if __name__ == "__main__":
     )
 
     # Create simulation
-    sim = SingleFlySimulation(fly=fly, cameras=[cam], arena=arena)
-
-    # Step a few times just to generate frames
-    for _ in range(100):
-        sim.step({"joints": [0.0] * len(all_leg_dofs)})
-        sim.render()
+    sim = CachedSingleFlySimulation(
+        fly=fly, cameras=[cam], arena=arena,
+        model_cache_dir=None if args.no_model_cache else DEFAULT_CACHE_DIR)
 
     # Save output directory
     output_dir = Path("outputs/arena_preview/")
     output_dir.mkdir(exist_ok=True, parents=True)
 
-    # Save video
-    cam.save_video(output_dir / "arena_preview.mp4")
+    # Step a few times just to generate frames, streaming them to the video
+    scheduler = RenderScheduler.from_camera(cam)
+    with VideoRecorder(output_dir / "arena_preview.mp4", fps=cam.fps) as recorder:
+        for _ in range(100):
+            sim.step({"joints": [0.0] * len(all_leg_dofs)})
+            scheduler.render(sim)
+            drain_camera(cam, recorder)
     print(f"Video saved at: {output_dir / 'arena_preview.mp4'}")
 
     # Save single snapshot
-    plt.imshow(cam._frames[-1])
+    plt.imshow(cam.last_frame)
     plt.axis("off")
     plt.savefig(output_dir / "arena_snapshot.png", bbox_inches="tight", pad_inches=0)
     print(f"Snapshot saved at: {output_dir / 'arena_snapshot.png'}")
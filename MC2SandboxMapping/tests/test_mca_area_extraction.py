@@ -0,0 +1,44 @@
+"""Region files rewritten between extractions must be decoded again."""
+
+import os
+import shutil
+import struct
+import sys
+from pathlib import Path
+
+import numpy as np
+
+HERE = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(HERE))
+
+from mca_area_extraction import extract_chunk_area  # noqa: E402
+
+
+def _swap_first_chunks(region_path: Path):
+    """Rewrites the region so chunks (0, 0) and (1, 0) trade places."""
+    data = bytearray(region_path.read_bytes())
+    data[0:4], data[4:8] = data[4:8], data[0:4]
+    timestamp = struct.unpack(">i", data[4096:4100])[0] + 1
+    data[4096:4104] = struct.pack(">ii", timestamp, timestamp)
+    region_path.write_bytes(bytes(data))
+    stat = region_path.stat()
+    os.utime(region_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def test_rewritten_region_is_reread(tmp_path):
+    region_dir = tmp_path / "region"
+    region_dir.mkdir()
+    region_path = region_dir / "r.0.0.mca"
+    shutil.copy(HERE / "r.0.0.mca", region_path)
+    cache_dir = tmp_path / "cache"
+
+    before = extract_chunk_area(region_dir, (0, 0), (1, 0), processes=1,
+                                cache_dir=cache_dir)
+    assert not np.array_equal(before.heightmap[:16], before.heightmap[16:])
+
+    _swap_first_chunks(region_path)
+    for cache in (cache_dir, None):
+        after = extract_chunk_area(region_dir, (0, 0), (1, 0), processes=1,
+                                   cache_dir=cache)
+        np.testing.assert_array_equal(after.heightmap[:16], before.heightmap[16:])
+        np.testing.assert_array_equal(after.heightmap[16:], before.heightmap[:16])
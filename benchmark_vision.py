@@ -0,0 +1,300 @@
+"""
+benchmark_vision.py
+
+CPU benchmark of the fly-vision pipeline variants.
+
+Every variant turns BGR frames into left/right eye brightness (and, where
+it produces them, (2, 721, 2) eye readings). Variants are run on a grid
+of input resolutions and batch sizes and compared with the reference
+(each half resized bilinearly to the retina grid, then
+Retina.raw_image_to_hex_pxls, in float64):
+
+    resize_hex/linear       split -> cv2.resize (bilinear) -> hex  (reference)
+    resize_hex/nearest      split -> cv2.resize (nearest) -> hex -> float32
+    resize_split/linear     cv2.resize of the whole frame -> split -> hex
+    one_eye_split/linear    whole frame as one eye, hemifield brightness
+    sampler/linear          retina_sampling.eye_samplers per frame
+    sampler/nearest         retina_sampling.eye_samplers per frame
+    batched/linear          eye samplers, one sparse apply per stacked batch
+    batch_kernel/linear     BatchRetinaSampler on the list of frames, into a reused buffer
+    operator/nearest        vision_brightness.BrightnessOperator (brightness only)
+
+For each run it records throughput, per-batch latency percentiles
+(vision_timing), peak traced memory (tracemalloc: Python and NumPy
+allocations, not OpenCV's internal buffers), one-off build time, and the
+max error of readings and of the normalized left/right brightness
+difference against the reference. Runs are CPU only (OpenCL off).
+
+Results can be stored as a baseline; later runs are then checked
+against it and regressions are flagged (exit status 1).
+
+Usage:
+    python benchmark_vision.py --save-baseline vision_baseline.json
+    python benchmark_vision.py --baseline vision_baseline.json
+    python benchmark_vision.py --resolutions 640x480 1920x1080 --batches 1 32 --variants sampler batched
+"""
+
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from retina_sampling import BatchRetinaSampler, RetinaSampler, eye_samplers
+from vision_brightness import BrightnessOperator, RetinaRegions, eye_brightness_features
+from vision_timing import StageTimer
+
+DEFAULT_RESOLUTIONS = ["640x480", "1280x720", "1920x1080", "3840x2160"]
+DEFAULT_BATCHES = [1, 16]
+
+
+# -------------------- Variants ----------------------
+# Each builder returns fn(frames) -> (readings (B, 2, N, 2) or None,
+# brightness (B, 2)) for BGR frames of one shape.
+def _eye_brightness(readings):
+    """Mean intensity of each eye: (..., 2, N, 2) -> (..., 2)."""
+    return readings.max(axis=-1).mean(axis=-1)
+
+
+def _resize_hex(retina, shape, interpolation, float32=False):
+    size = (retina.ncols, retina.nrows)
+
+    def run(frames):
+        readings = []
+        for frame in frames:
+            rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            mid = rgb.shape[1] // 2
+            eyes = [retina.raw_image_to_hex_pxls(np.ascontiguousarray(
+                        cv2.resize(half, size, interpolation=interpolation)))
+                    for half in (rgb[:, :mid], rgb[:, mid:])]
+            readings.append(np.stack(eyes))
+        readings = np.stack(readings)
+        if float32:
+            readings = readings.astype(np.float32)
+        return readings, _eye_brightness(readings)
+    return run
+
+
+def _resize_split(retina, shape, interpolation):
+    size = (2 * retina.ncols, retina.nrows)
+
+    def run(frames):
+        readings = []
+        for frame in frames:
+            rgb = cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB), size,
+                             interpolation=interpolation)
+            readings.append(np.stack([
+                retina.raw_image_to_hex_pxls(np.ascontiguousarray(rgb[:, :retina.ncols])),
+                retina.raw_image_to_hex_pxls(np.ascontiguousarray(rgb[:, retina.ncols:]))]))
+        readings = np.stack(readings)
+        return readings, _eye_brightness(readings)
+    return run
+
+
+def _one_eye_split(retina, shape, interpolation):
+    sampler = RetinaSampler(retina, shape, interpolation=interpolation, bgr=True)
+    halves = RetinaRegions.hemifields(retina)
+
+    def run(frames):
+        return None, np.stack([halves.brightness(sampler(frame)) for frame in frames])
+    return run
+
+
+def _sampler(retina, shape, interpolation):
+    samplers = eye_samplers(retina, shape, interpolation, bgr=True)
+
+    def run(frames):
+        readings = np.stack([np.stack([s(frame) for s in samplers]) for frame in frames])
+        return readings, _eye_brightness(readings)
+    return run
+
+
+def _batched(retina, shape, interpolation):
+    samplers = eye_samplers(retina, shape, interpolation, bgr=True)
+
+    def run(frames):
+        # Per-frame gather, one sparse apply per eye on the stacked batch.
+        # This loses to per-frame apply. Stacking copies every gathered
+        # frame again (14 ms for 16 frames at 1920x1080). The CSR x dense
+        # product then reads a (terms, B) float32 block of 44 MB that does
+        # not stay in cache, and takes 30 ms where 16 mat-vecs over 2.7 MB
+        # vectors take 15 ms. preprocess therefore applies per frame.
+        readings = np.stack([s.apply(np.stack([s.gather(f) for f in frames]))
+                             for s in samplers], axis=1)
+        return readings, _eye_brightness(readings)
+    return run
+
+
+def _batch_kernel(retina, shape, interpolation):
+    batch = BatchRetinaSampler(retina, shape, interpolation, bgr=True)
+    buffers = {}
+
+    def run(frames):
+        out = buffers.get(len(frames))
+        if out is None:
+            out = buffers[len(frames)] = batch.allocate(len(frames))
+        readings = batch(frames, out=out)
+        return readings, _eye_brightness(readings)
+    return run
+
+
+def _operator(retina, shape, interpolation):
+    operator = BrightnessOperator(retina, shape, eye_brightness_features(retina, mean=True),
+                                  interpolation, bgr=True)
+
+    def run(frames):
+        return None, np.stack([operator(frame) for frame in frames])
+    return run
+
+
+VARIANTS = {
+    "resize_hex/linear": lambda r, s: _resize_hex(r, s, cv2.INTER_LINEAR),
+    "resize_hex/nearest": lambda r, s: _resize_hex(r, s, cv2.INTER_NEAREST, float32=True),
+    "resize_split/linear": lambda r, s: _resize_split(r, s, cv2.INTER_LINEAR),
+    "one_eye_split/linear": lambda r, s: _one_eye_split(r, s, cv2.INTER_LINEAR),
+    "sampler/linear": lambda r, s: _sampler(r, s, cv2.INTER_LINEAR),
+    "sampler/nearest": lambda r, s: _sampler(r, s, cv2.INTER_NEAREST),
+    "batched/linear": lambda r, s: _batched(r, s, cv2.INTER_LINEAR),
+    "batch_kernel/linear": lambda r, s: _batch_kernel(r, s, cv2.INTER_LINEAR),
+    "operator/nearest": lambda r, s: _operator(r, s, cv2.INTER_NEAREST),
+}
+REFERENCE = "resize_hex/linear"
+
+
+# -------------------- Measurement ----------------------
+def make_frames(image: np.ndarray, width: int, height: int, count: int):
+    """`count` distinct BGR frames of the given size (shifted copies)."""
+    base = cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+    step = max(width // max(count, 1), 1)
+    return [np.ascontiguousarray(np.roll(base, i * step, axis=1)) for i in range(count)]
+
+
+def _diff_ratio(brightness):
+    total = brightness.sum(axis=-1)
+    return np.where(total > 0, 2 * (brightness[..., 0] - brightness[..., 1])
+                    / np.maximum(total, 1e-12), 0.0)
+
+
+def run_variant(name, retina, frames, repeats, reference):
+    start = time.perf_counter()
+    fn = VARIANTS[name](retina, frames[0].shape)
+    build_ms = (time.perf_counter() - start) * 1e3
+    readings, brightness = fn(frames)          # warm-up, and the output checked
+
+    timer = StageTimer()
+    for _ in range(repeats):
+        with timer.span(name):
+            fn(frames)
+    # Memory from one more batch; tracing would slow the timed ones
+    tracemalloc.start()
+    fn(frames)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    stats = timer.summary()[name]
+    result = {
+        "frames_per_s": len(frames) * repeats / (stats["total_ms"] / 1e3),
+        "batch_p50_ms": stats["p50_ms"],
+        "batch_p99_ms": stats["p99_ms"],
+        "peak_mem_mb": peak / 2 ** 20,
+        "build_ms": build_ms,
+        "diff_ratio_err": float(np.abs(_diff_ratio(brightness)
+                                       - _diff_ratio(reference[1])).max()),
+        "reading_err": None,
+    }
+    if readings is not None:
+        result["reading_err"] = float(np.abs(readings - reference[0]).max())
+    return result
+
+
+def check_regressions(results, baseline, speed_tolerance, error_tolerance):
+    """Messages for runs slower or less accurate than the baseline."""
+    messages = []
+    for key, result in results.items():
+        base = baseline.get(key)
+        if base is None:
+            continue
+        if result["frames_per_s"] < base["frames_per_s"] * (1 - speed_tolerance):
+            messages.append(f"{key}: {result['frames_per_s']:.1f} frames/s vs "
+                            f"{base['frames_per_s']:.1f} in baseline")
+        for field in ("reading_err", "diff_ratio_err"):
+            if (result[field] is not None and base.get(field) is not None
+                    and result[field] > base[field] + error_tolerance):
+                messages.append(f"{key}: {field} {result[field]:.2e} vs "
+                                f"{base[field]:.2e} in baseline")
+    return messages
+
+
+# -------------------- Main ----------------------
+def main():
+    from flygym.vision.retina import Retina
+
+    parser = argparse.ArgumentParser(description="CPU benchmark of the vision-pipeline variants.")
+    parser.add_argument("--image", default="test2.jpg")
+    parser.add_argument("--resolutions", nargs="+", default=DEFAULT_RESOLUTIONS,
+                        help="input sizes as WIDTHxHEIGHT")
+    parser.add_argument("--batches", type=int, nargs="+", default=DEFAULT_BATCHES)
+    parser.add_argument("--variants", nargs="+", default=list(VARIANTS),
+                        help="variant names or prefixes (e.g. sampler)")
+    parser.add_argument("--repeats", type=int, default=5, help="timed batches per run")
+    parser.add_argument("--threads", type=int, default=None, help="cv2.setNumThreads")
+    parser.add_argument("--output", type=Path, default=None, help="write results as JSON")
+    parser.add_argument("--save-baseline", type=Path, default=None)
+    parser.add_argument("--baseline", type=Path, default=None,
+                        help="flag regressions against this baseline")
+    parser.add_argument("--speed-tolerance", type=float, default=0.15,
+                        help="allowed throughput drop vs the baseline (fraction)")
+    parser.add_argument("--error-tolerance", type=float, default=1e-4)
+    args = parser.parse_args()
+
+    cv2.ocl.setUseOpenCL(False)
+    if args.threads is not None:
+        cv2.setNumThreads(args.threads)
+    image = cv2.imread(args.image)
+    if image is None:
+        raise FileNotFoundError(f"Error: Image file '{args.image}' not found.")
+    variants = [v for v in VARIANTS
+                if any(v == p or v.split("/")[0] == p for p in args.variants)]
+    retina = Retina()
+
+    results = {}
+    header = (f"{'resolution':>10} {'batch':>5} {'variant':<22} {'frames/s':>9} {'p50 ms':>8} "
+              f"{'p99 ms':>8} {'mem MB':>7} {'build ms':>8} {'read err':>9} {'ratio err':>9}")
+    print(header)
+    for resolution in args.resolutions:
+        width, height = (int(v) for v in resolution.lower().split("x"))
+        for batch in args.batches:
+            frames = make_frames(image, width, height, batch)
+            reference = VARIANTS[REFERENCE](retina, frames[0].shape)(frames)
+            for name in variants:
+                result = run_variant(name, retina, frames, args.repeats, reference)
+                key = f"{resolution}/b{batch}/{name}"
+                results[key] = result
+                read_err = ("-" if result["reading_err"] is None
+                            else f"{result['reading_err']:.1e}")
+                print(f"{resolution:>10} {batch:>5} {name:<22} {result['frames_per_s']:>9.1f} "
+                      f"{result['batch_p50_ms']:>8.2f} {result['batch_p99_ms']:>8.2f} "
+                      f"{result['peak_mem_mb']:>7.1f} {result['build_ms']:>8.1f} "
+                      f"{read_err:>9} {result['diff_ratio_err']:>9.1e}", flush=True)
+
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+    if args.save_baseline:
+        args.save_baseline.write_text(json.dumps(results, indent=2))
+        print(f"Baseline saved to {args.save_baseline}")
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text())
+        regressions = check_regressions(results, baseline, args.speed_tolerance,
+                                        args.error_tolerance)
+        if regressions:
+            print("REGRESSIONS:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+        print(f"No regressions against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
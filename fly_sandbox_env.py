@@ -1,19 +1,23 @@
 import numpy as np
-import pickle
 import matplotlib.pyplot as plt
 from pathlib import Path
 from tqdm import trange
 
 import gymnasium as gym
 from gymnasium import spaces
-from flygym import Fly, Camera, SingleFlySimulation, get_data_path
+from flygym import Fly, SingleFlySimulation, get_data_path
 from flygym.preprogrammed import all_leg_dofs
 
+from kinematic_replay import DEFAULT_WINDOW, KinematicReplay, load_recording
+from render_scheduler import RenderScheduler
+from video_recorder import StreamingCamera, VideoRecorder, drain_camera
+
 
 class FlySandboxEnv(gym.Env):
     """A sandbox environment where the fly moves based on pre-recorded kinematic data."""
 
-    def __init__(self, run_time=10, timestep=1e-4):
+    def __init__(self, run_time=10, timestep=1e-4, replay_window=DEFAULT_WINDOW,
+                 arena=None, camera=True):
         super().__init__()
 
         self.run_time = run_time
@@ -25,18 +29,16 @@ class FlySandboxEnv(gym.Env):
         behavior_file = data_path / "behavior" / "210902_pr_fly1.pkl"
         
         try:
-            with open(behavior_file, "rb") as f:
-                self.data = pickle.load(f)
+            # Converted once to a float32 dataset under .replay_cache/, then memory-mapped
+            # (no unpickling, shared by all envs and processes)
+            self.recording = load_recording(behavior_file, self.actuated_joints)
         except FileNotFoundError:
             raise FileNotFoundError(f"Missing behavior file: {behavior_file}")
 
-        # The dataset is provided at 2000 Hz. We will try to run the simulation at 10000 Hz, so let’s interpolate it 5x
+        # The dataset is provided at 2000 Hz. We will try to run the simulation at 10000 Hz, so let’s interpolate it 5x,
+        # one window of replay_window steps at a time as the episode advances
         self.target_num_steps = int(self.run_time / self.timestep)
-        self.data_block = np.zeros((len(self.actuated_joints), self.target_num_steps))
-        input_t = np.arange(len(self.data["joint_LFCoxa"])) * self.data["meta"]["timestep"]
-        output_t = np.arange(self.target_num_steps) * self.timestep
-        for i, joint in enumerate(self.actuated_joints):
-            self.data_block[i, :] = np.interp(output_t, input_t, self.data[joint])
+        self.replay = KinematicReplay(self.recording, self.timestep, replay_window)
         #note: skipped the  time series of DoF angles, see https://neuromechfly.org/tutorials/gym_basics_and_kinematic_replay.html on dof angles time stamp
         # Define Gym observation & action spaces
         self.observation_space = spaces.Box(low=-1, high=1, shape=(3, 42), dtype=np.float32)
@@ -44,23 +46,29 @@ class FlySandboxEnv(gym.Env):
 
         # Initialize Fly Simulation
         self.fly = Fly(init_pose="stretch", actuated_joints=self.actuated_joints, control="position")
-        self.cam = Camera(fly=self.fly, play_speed=1.0, draw_contacts=True)
-        self.sim = SingleFlySimulation(fly=self.fly, cameras=[self.cam])
-
-    def reset(self, seed=None):
+        # camera=False skips rendering entirely (e.g. headless vectorized workers)
+        self.cam = StreamingCamera(fly=self.fly, play_speed=1.0, draw_contacts=True) if camera else None
+        self.sim = SingleFlySimulation(fly=self.fly, cameras=[self.cam] if camera else [],
+                                       arena=arena)
+        # render() only draws the steps that become video frames
+        self.render_scheduler = RenderScheduler.from_camera(self.cam) if camera else None
+
+    def reset(self, *, seed=None, options=None):
         """Resets the environment and returns initial observation."""
-        super().reset(seed=seed)
-        obs, info = self.sim.reset()
+        super().reset(seed=seed, options=options)
+        obs, info = self.sim.reset(seed=seed, options=options)
         self.current_step = 0
+        if self.render_scheduler is not None:
+            self.render_scheduler.reset()
         return obs, info
 
     def step(self, action):
         """Executes a step based on the given action (kinematic replay)."""
         if self.current_step >= self.target_num_steps:
-            return self.sim.observation, 0, True, False, {}
+            return self.sim.get_observation(), 0, True, False, {}
 
         # Use pre-recorded joint angles as action
-        joint_pos = self.data_block[:, self.current_step]
+        joint_pos = self.replay[self.current_step]
         action = {"joints": joint_pos}
         obs, reward, terminated, truncated, info = self.sim.step(action)
 
@@ -69,7 +77,8 @@ class FlySandboxEnv(gym.Env):
 
     def render(self, mode="human"):
         """Renders the simulation."""
-        self.sim.render()
+        if self.render_scheduler is not None:
+            self.render_scheduler.render(self.sim)
 
     def close(self):
         """Closes the environment properly."""
@@ -83,20 +92,18 @@ if __name__ == "__main__":
     obs, info = env.reset()
     print("Starting Simulation:")
 
-    for step in range(env.target_num_steps): # let's simulate 1000 steps max
-        action = np.random.uniform(-1, 1, size=(len(env.actuated_joints),))   # your controller decides what to do based on obs: random
-        obs, reward, terminated, truncated, info = env.step(action)
-        #print(f"Step {step}: Reward = {reward}, Terminated = {terminated}") 
-        env.render()
-        if terminated or truncated:
-            print("Simulation Ended Early.")
-            break
-
-    # Save the rendered video
+    # Rendered frames are streamed to the video as the simulation runs
     output_dir = Path("outputs/gym_basics/")
-    output_dir.mkdir(exist_ok=True, parents=True)
-    
-    env.sim.cameras[0].save_video(output_dir / "fly_simulation.mp4") 
+    with VideoRecorder(output_dir / "fly_simulation.mp4", fps=env.cam.fps) as recorder:
+        for step in range(env.target_num_steps): # let's simulate 1000 steps max
+            action = np.random.uniform(-1, 1, size=(len(env.actuated_joints),))   # your controller decides what to do based on obs: random
+            obs, reward, terminated, truncated, info = env.step(action)
+            #print(f"Step {step}: Reward = {reward}, Terminated = {terminated}") 
+            env.render()
+            drain_camera(env.cam, recorder)
+            if terminated or truncated:
+                print("Simulation Ended Early.")
+                break
 
     print(f"Simulation video saved at: {output_dir / 'fly_simulation.mp4'}")
 
@@ -0,0 +1,361 @@
+"""
+fly_sandbox_vector_env.py
+
+Vectorized FlySandboxEnv: N simulations in worker processes, with
+actions and observations passed through one preallocated shared-memory
+block instead of being pickled every step.
+
+Each worker builds its env from a (picklable) factory, probes one reset
+to learn the observation layout (FlyGym returns a dict of arrays), and
+then attaches to a SharedMemory block holding, per env, every
+observation array, the action, reward and termination flags. A step is
+the parent writing all actions, one short "step" message per worker,
+and the workers writing results in place; only infos travel through the
+pipes. Episodes auto-reset inside the workers (Gymnasium's SAME_STEP
+mode: the returned observation is the first of the new episode and the
+last one is in infos["final_obs"]).
+
+SharedMemoryVectorEnv is a gymnasium.vector.VectorEnv, so it works with
+the usual vector wrappers and RL libraries.
+
+Usage:
+    envs = SharedMemoryVectorEnv([make_sandbox_env(run_time=1.0)] * 4)
+    obs, infos = envs.reset(seed=0)
+    obs, rewards, terminated, truncated, infos = envs.step(envs.action_space.sample())
+
+Scaling benchmark (env-steps/s as N grows; --arena mca for a Minecraft
+arena from MC2SandboxMapping):
+    python fly_sandbox_vector_env.py --num-envs 1 2 4 8 --steps 2000
+"""
+
+import argparse
+import functools
+import multiprocessing as mp
+import os
+import sys
+import time
+import traceback
+from multiprocessing import shared_memory
+from pathlib import Path
+from typing import Callable, Sequence
+
+import numpy as np
+from gymnasium import spaces
+from gymnasium.vector import AutoresetMode, VectorEnv
+from gymnasium.vector.utils import batch_space
+
+MC2_DIR = Path(__file__).resolve().parent / "MC2SandboxMapping"
+
+
+# -------------------- Env factories ----------------------
+def _build_sandbox_env(arena_fn, env_kwargs):
+    from fly_sandbox_env import FlySandboxEnv
+
+    arena = arena_fn() if arena_fn is not None else None
+    return FlySandboxEnv(arena=arena, **env_kwargs)
+
+
+def make_sandbox_env(arena_fn: Callable = None, camera: bool = False, **env_kwargs):
+    """
+    Picklable factory of FlySandboxEnv for the workers. `arena_fn` (also
+    picklable, e.g. a functools.partial) builds the arena inside the
+    worker; cameras are off by default.
+    """
+    return functools.partial(_build_sandbox_env, arena_fn, dict(camera=camera, **env_kwargs))
+
+
+def mca_arena(region_dir, chunk_min, chunk_max, cache_dir=".mca_cache", block_size=10,
+              block_height=10):
+    """MCAXmlArena of a chunk box of Minecraft region files (see MC2SandboxMapping)."""
+    if str(MC2_DIR) not in sys.path:
+        sys.path.insert(0, str(MC2_DIR))
+    from mca_area_extraction import extract_chunk_area
+    from mca_xml_arena import MCAXmlArena
+
+    mosaic = extract_chunk_area(Path(region_dir), tuple(chunk_min), tuple(chunk_max),
+                                processes=1, cache_dir=Path(cache_dir))
+    return MCAXmlArena.from_mosaic(mosaic, block_size=block_size, block_height=block_height)
+
+
+# -------------------- Shared memory ----------------------
+def _observation_layout(observation):
+    if isinstance(observation, dict):
+        items = [(f"obs/{key}", np.asarray(value)) for key, value in observation.items()]
+    else:
+        items = [("obs", np.asarray(observation))]
+    return [(key, value.shape, value.dtype.str) for key, value in items]
+
+
+class _SharedArrays:
+    """Named (num_envs, ...) arrays packed into one SharedMemory block."""
+    def __init__(self, layout, num_envs: int, name: str = None):
+        offsets, size = [], 0
+        for _, shape, dtype in layout:
+            size = -(-size // 64) * 64
+            offsets.append(size)
+            size += num_envs * int(np.prod(shape, dtype=np.int64)) * np.dtype(dtype).itemsize
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.arrays = {key: np.ndarray((num_envs, *shape), dtype, buffer=self.shm.buf,
+                                       offset=offset)
+                       for (key, shape, dtype), offset in zip(layout, offsets)}
+
+    def close(self, unlink: bool = False):
+        self.arrays = {}
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+def _write_observation(arrays, index, observation):
+    if isinstance(observation, dict):
+        for key, value in observation.items():
+            arrays[f"obs/{key}"][index] = value
+    else:
+        arrays["obs"][index] = observation
+
+
+def _worker(index: int, env_fn, pipe, parent_pipe):
+    parent_pipe.close()
+    shared = None
+    try:
+        env = env_fn()
+        observation, _ = env.reset()
+        pipe.send((True, (_observation_layout(observation), env.observation_space,
+                          env.action_space)))
+        shm_name, layout, num_envs = pipe.recv()
+        shared = _SharedArrays(layout, num_envs, shm_name)
+        arrays = shared.arrays
+        action = arrays["action"][index]
+        pipe.send((True, None))
+
+        while True:
+            command, data = pipe.recv()
+            if command == "step":
+                observation, reward, terminated, truncated, info = env.step(action.copy())
+                if terminated or truncated:
+                    final_observation = observation
+                    observation, reset_info = env.reset()
+                    info = {"final_obs": final_observation, "final_info": info, **reset_info}
+                _write_observation(arrays, index, observation)
+                arrays["reward"][index] = reward
+                arrays["terminated"][index] = terminated
+                arrays["truncated"][index] = truncated
+                pipe.send((True, info))
+            elif command == "reset":
+                observation, info = env.reset(**data)
+                _write_observation(arrays, index, observation)
+                pipe.send((True, info))
+            elif command == "close":
+                env.close()
+                pipe.send((True, None))
+                break
+            else:
+                raise ValueError(f"Unknown command: {command}")
+    except (KeyboardInterrupt, EOFError):
+        pass
+    except Exception:
+        pipe.send((False, traceback.format_exc()))
+    finally:
+        if shared is not None:
+            shared.close()
+        pipe.close()
+
+
+# -------------------- Vector env ----------------------
+class SharedMemoryVectorEnv(VectorEnv):
+    """
+    Runs one env per worker process; observations, actions, rewards and
+    termination flags live in shared memory.
+
+    Parameters:
+        env_fns: Picklable env factories, one per worker.
+        context: multiprocessing start method ("spawn" is safe with
+            MuJoCo / OpenGL state in the parent).
+        copy: Return copies of the observation buffers. With copy=False
+            the returned arrays are overwritten by the next step/reset.
+    """
+    metadata = {"autoreset_mode": AutoresetMode.SAME_STEP}
+
+    def __init__(self, env_fns: Sequence[Callable], context: str = "spawn", copy: bool = True):
+        self.num_envs = len(env_fns)
+        self.copy = copy
+        self.closed = False
+        ctx = mp.get_context(context)
+
+        self._pipes, self._processes = [], []
+        for index, env_fn in enumerate(env_fns):
+            parent_pipe, child_pipe = ctx.Pipe()
+            process = ctx.Process(target=_worker, name=f"FlySandboxWorker-{index}",
+                                  args=(index, env_fn, child_pipe, parent_pipe), daemon=True)
+            process.start()
+            child_pipe.close()
+            self._pipes.append(parent_pipe)
+            self._processes.append(process)
+
+        probes = self._receive()
+        obs_layout, observation_space, action_space = probes[0]
+        if any(probe[0] != obs_layout for probe in probes[1:]):
+            self.close()
+            raise ValueError("All envs must return observations of the same layout")
+        self.single_action_space = action_space
+        self.single_observation_space = self._space_from_layout(observation_space, obs_layout)
+        self.observation_space = batch_space(self.single_observation_space, self.num_envs)
+        self.action_space = batch_space(self.single_action_space, self.num_envs)
+
+        layout = obs_layout + [("action", action_space.shape, np.dtype(action_space.dtype).str),
+                               ("reward", (), "<f8"), ("terminated", (), "|b1"),
+                               ("truncated", (), "|b1")]
+        self._shared = _SharedArrays(layout, self.num_envs)
+        for pipe in self._pipes:
+            pipe.send((self._shared.shm.name, layout, self.num_envs))
+        self._receive()
+        self._obs_keys = [key for key, _, _ in obs_layout]
+
+    @staticmethod
+    def _space_from_layout(space, layout):
+        # FlyGym envs may declare a space that differs from what they return
+        if len(layout) == 1 and layout[0][0] == "obs":
+            _, shape, dtype = layout[0]
+            if isinstance(space, spaces.Box) and space.shape == shape:
+                return space
+            return spaces.Box(-np.inf, np.inf, shape, np.dtype(dtype))
+        declared = space.spaces if isinstance(space, spaces.Dict) else {}
+        result = {}
+        for key, shape, dtype in layout:
+            name = key[len("obs/"):]
+            sub = declared.get(name)
+            if not (isinstance(sub, spaces.Box) and sub.shape == shape):
+                sub = spaces.Box(-np.inf, np.inf, shape, np.dtype(dtype))
+            result[name] = sub
+        return spaces.Dict(result)
+
+    def _receive(self):
+        results, errors = [], []
+        for index, pipe in enumerate(self._pipes):
+            try:
+                ok, payload = pipe.recv()
+            except EOFError:
+                ok, payload = False, f"exited with code {self._processes[index].exitcode}"
+            if ok:
+                results.append(payload)
+            else:
+                errors.append(f"Worker {index} failed:\n{payload}")
+        if errors:
+            raise RuntimeError("\n".join(errors))
+        return results
+
+    def _observations(self):
+        arrays = self._shared.arrays
+        if self._obs_keys == ["obs"]:
+            return arrays["obs"].copy() if self.copy else arrays["obs"]
+        return {key[len("obs/"):]: arrays[key].copy() if self.copy else arrays[key]
+                for key in self._obs_keys}
+
+    def _collect_infos(self, env_infos):
+        infos = {}
+        for index, info in enumerate(env_infos):
+            if info:
+                infos = self._add_info(infos, info, index)
+        return infos
+
+    def reset(self, *, seed=None, options=None):
+        if seed is None or isinstance(seed, int):
+            seeds = [None if seed is None else seed + i for i in range(self.num_envs)]
+        else:
+            seeds = list(seed)
+        for pipe, env_seed in zip(self._pipes, seeds):
+            kwargs = {"seed": env_seed}
+            if options is not None:
+                kwargs["options"] = options    # not every env's reset() takes it
+            pipe.send(("reset", kwargs))
+        infos = self._collect_infos(self._receive())
+        return self._observations(), infos
+
+    def step(self, actions):
+        arrays = self._shared.arrays
+        arrays["action"][:] = actions
+        for pipe in self._pipes:
+            pipe.send(("step", None))
+        infos = self._collect_infos(self._receive())
+        return (self._observations(), arrays["reward"].copy(), arrays["terminated"].copy(),
+                arrays["truncated"].copy(), infos)
+
+    def close_extras(self, **kwargs):
+        for pipe, process in zip(self._pipes, self._processes):
+            if process.is_alive():
+                try:
+                    pipe.send(("close", None))
+                    pipe.recv()
+                except (OSError, EOFError):
+                    pass                       # broken pipe, connection reset
+        for pipe, process in zip(self._pipes, self._processes):
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+            pipe.close()
+        if getattr(self, "_shared", None) is not None:
+            self._shared.close(unlink=True)
+            self._shared = None
+
+    def __del__(self):
+        if not getattr(self, "closed", True):
+            self.close()
+
+
+# -------------------- Scaling benchmark ----------------------
+def benchmark(env_fn, num_envs: int, steps: int, context: str = "spawn", seed: int = 0):
+    """(startup seconds, env-steps per second) of `steps` vector steps."""
+    start = time.perf_counter()
+    envs = SharedMemoryVectorEnv([env_fn] * num_envs, context=context)
+    try:
+        envs.reset(seed=seed)
+        startup = time.perf_counter() - start
+        envs.action_space.seed(seed)
+        actions = envs.action_space.sample()
+        start = time.perf_counter()
+        for _ in range(steps):
+            envs.step(actions)
+        elapsed = time.perf_counter() - start
+    finally:
+        envs.close()
+    return startup, num_envs * steps / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Env-steps/s of SharedMemoryVectorEnv as the number of workers grows.")
+    parser.add_argument("--num-envs", type=int, nargs="+",
+                        default=sorted({1, 2, os.cpu_count() or 1}))
+    parser.add_argument("--steps", type=int, default=1000, help="vector steps per run")
+    parser.add_argument("--run-time", type=float, default=0.05,
+                        help="episode length in seconds (short, to include auto-resets)")
+    parser.add_argument("--timestep", type=float, default=1e-4)
+    parser.add_argument("--arena", choices=("flat", "mca"), default="flat")
+    parser.add_argument("--region-dir", type=Path, default=MC2_DIR)
+    parser.add_argument("--chunks", type=int, nargs=4, default=(0, 0, 0, 0),
+                        metavar=("X0", "Z0", "X1", "Z1"))
+    parser.add_argument("--context", default="spawn", choices=mp.get_all_start_methods())
+    args = parser.parse_args()
+
+    arena_fn = None
+    if args.arena == "mca":
+        arena_fn = functools.partial(mca_arena, args.region_dir, args.chunks[:2], args.chunks[2:])
+    env_fn = make_sandbox_env(arena_fn, run_time=args.run_time, timestep=args.timestep)
+
+    print(f"{os.cpu_count()} CPU cores, arena: {args.arena}, {args.steps} steps per run")
+    print(f"{'envs':>5} {'startup s':>10} {'env-steps/s':>12} {'speedup':>8} {'per env':>8}")
+    base = None
+    for num_envs in args.num_envs:
+        startup, rate = benchmark(env_fn, num_envs, args.steps, args.context)
+        # Relative to the first (usually single-worker) run
+        base = base or (rate, num_envs)
+        speedup = rate / base[0]
+        print(f"{num_envs:>5} {startup:>10.2f} {rate:>12.1f} {speedup:>7.2f}x "
+              f"{speedup * base[1] / num_envs:>8.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,19 +2,13 @@ import numpy as np
 import cv2
 import time
 import matplotlib.pyplot as plt
-from flygym.vision.retina import Retina
+from retina_cache import cached_eye_samplers, load_retina
+from vision_timing import timer
 
 # --- Helpers ---------------------------------------------------------------
 def has_cuda():
     return hasattr(cv2, "cuda") and cv2.cuda.getCudaEnabledDeviceCount() > 0
 
-def cuda_resize_np(img_np, dsize, interpolation=cv2.INTER_NEAREST):
-    """Resize a NumPy HxWxC image on the GPU and return a NumPy result."""
-    g = cv2.cuda_GpuMat()
-    g.upload(img_np)
-    g_res = cv2.cuda.resize(g, dsize, interpolation=interpolation)
-    return g_res.download()
-
 def maybe_cuda_cvt_color_bgr2rgb(img_bgr, use_cuda):
     """Optional GPU BGR->RGB; returns NumPy RGB image."""
     if not use_cuda:
@@ -24,18 +18,12 @@ def maybe_cuda_cvt_color_bgr2rgb(img_bgr, use_cuda):
     g_rgb = cv2.cuda.cvtColor(g, cv2.COLOR_BGR2RGB)
     return g_rgb.download()
 
-def resize_img(img, size_wh, use_cuda, interpolation=cv2.INTER_NEAREST):
-    """Resize on GPU if available, else CPU."""
-    if use_cuda:
-        return cuda_resize_np(img, size_wh, interpolation=interpolation)
-    else:
-        return cv2.resize(img, size_wh, interpolation=interpolation)
-
 # --- Main ------------------------------------------------------------------
 start_time = time.time()
 
 image_path = "test2.jpg"
-raw_bgr = cv2.imread(image_path)
+with timer.span("imread"):
+    raw_bgr = cv2.imread(image_path)
 if raw_bgr is None:
     raise FileNotFoundError(f"Error: Image file '{image_path}' not found.")
 
@@ -43,37 +31,35 @@ USE_CUDA = has_cuda()
 print(f"[INFO] OpenCV CUDA available: {USE_CUDA}")
 
 # Convert to RGB (optionally on GPU)
-raw_image = maybe_cuda_cvt_color_bgr2rgb(raw_bgr, USE_CUDA)
+with timer.span("bgr2rgb"):
+    raw_image = maybe_cuda_cvt_color_bgr2rgb(raw_bgr, USE_CUDA)
 
-# Split into left/right halves (NumPy)
-mid_col = raw_image.shape[1] // 2
-left_image  = raw_image[:, :mid_col, :]
-right_image = raw_image[:, mid_col:, :]
+with timer.span("retina_init"):
+    retina = load_retina()
 
-# Retina target size
-retina = Retina()
-target_size = (retina.ncols, retina.nrows)  # (width, height)
+# --- Fused resize + retina sampling of the left/right halves ---------------
+# (nearest-neighbour, no intermediate ncols x nrows image)
+with timer.span("sampler_build"):
+    left_sampler, right_sampler = cached_eye_samplers(retina, raw_image.shape,
+                                                      interpolation=cv2.INTER_NEAREST)
+with timer.span("hex_sampling"):
+    left_fly_vision  = left_sampler(raw_image).astype(np.float32)
+    right_fly_vision = right_sampler(raw_image).astype(np.float32)
 
-# --- GPU-accelerated resize (with CPU fallback) ----------------------------
-left_resized  = resize_img(left_image,  target_size, USE_CUDA, interpolation=cv2.INTER_NEAREST)
-right_resized = resize_img(right_image, target_size, USE_CUDA, interpolation=cv2.INTER_NEAREST)
-
-# Retina transforms (NumPy/CPU)
-left_fly_vision  = retina.raw_image_to_hex_pxls(left_resized).astype(np.float32)
-right_fly_vision = retina.raw_image_to_hex_pxls(right_resized).astype(np.float32)
-
-left_brightness  = np.sum(left_fly_vision[:, 1])
-right_brightness = np.sum(right_fly_vision[:, 1])
+with timer.span("brightness"):
+    left_brightness  = np.sum(left_fly_vision[:, 1])
+    right_brightness = np.sum(right_fly_vision[:, 1])
 
 print(f"Left Eye Brightness:  {left_brightness}")
 print(f"Right Eye Brightness: {right_brightness}")
 
-if left_brightness > right_brightness:
-    movement = (-1, 0, 0)  # Move left
-elif right_brightness > left_brightness:
-    movement = (1, 0, 0)   # Move right
-else:
-    movement = (0, 1, 0)   # Move forward if balanced
+with timer.span("decision"):
+    if left_brightness > right_brightness:
+        movement = (-1, 0, 0)  # Move left
+    elif right_brightness > left_brightness:
+        movement = (1, 0, 0)   # Move right
+    else:
+        movement = (0, 1, 0)   # Move forward if balanced
 
 print(f"Movement Vector: {movement}")
 
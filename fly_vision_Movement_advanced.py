@@ -2,31 +2,33 @@ import numpy as np
 import cv2
 import time
 import matplotlib.pyplot as plt
-from flygym.vision.retina import Retina
+from retina_cache import load_retina
+from vision_brightness import BrightnessOperator, eye_brightness_features, steering_from_brightness
+from vision_timing import timer
 
 start_time = time.time()
 
 image_path = "test2.jpg"
-raw_image = cv2.imread(image_path)
+with timer.span("imread"):
+    raw_image = cv2.imread(image_path)
 if raw_image is None:
     raise FileNotFoundError(f"Error: Image file '{image_path}' not found.")
-raw_image = cv2.cvtColor(raw_image, cv2.COLOR_BGR2RGB)
-
-mid_col = raw_image.shape[1] // 2
-left_image = raw_image[:, :mid_col, :]
-right_image = raw_image[:, mid_col:, :]
+with timer.span("bgr2rgb"):
+    raw_image = cv2.cvtColor(raw_image, cv2.COLOR_BGR2RGB)
 
 # --- Initialize the Retina ---
-retina = Retina()
-
-left_resized = cv2.resize(left_image, (retina.ncols, retina.nrows), interpolation=cv2.INTER_NEAREST)
-right_resized = cv2.resize(right_image, (retina.ncols, retina.nrows), interpolation=cv2.INTER_NEAREST)
+with timer.span("retina_init"):
+    retina = load_retina()
 
-left_fly_vision = retina.raw_image_to_hex_pxls(left_resized).astype(np.float32)
-right_fly_vision = retina.raw_image_to_hex_pxls(right_resized).astype(np.float32)
-
-left_brightness = np.sum(left_fly_vision[:, 1])
-right_brightness = np.sum(right_fly_vision[:, 1])
+# Left/right pale-channel brightness straight from the frame: the
+# nearest-neighbour eye sampling and the sum are one precomputed weighting
+# of the pixels (see vision_brightness)
+with timer.span("operator_build"):
+    brightness = BrightnessOperator(retina, raw_image.shape,
+                                    eye_brightness_features(retina, channel=1),
+                                    interpolation=cv2.INTER_NEAREST)
+with timer.span("brightness"):
+    left_brightness, right_brightness = brightness(raw_image)
 print(f"Left Eye Brightness: {left_brightness}")
 print(f"Right Eye Brightness: {right_brightness}")
 #  average brightness and the normalized difference ratio.
@@ -42,18 +44,17 @@ base_forward = 1.0
 turning_scale = 5.0  
 max_turn = 2.0     
 
-if abs(diff_ratio) < threshold:
-    movement = (0, base_forward, 0)
-else:
-    turning = -turning_scale * diff_ratio
-    turning = np.clip(turning, -max_turn, max_turn)
-    movement = (turning, base_forward, 0)
+with timer.span("decision"):
+    movement = steering_from_brightness(left_brightness, right_brightness, threshold,
+                                        base_forward, turning_scale, max_turn)
 
 print(f"Advanced Movement Vector: {movement}")
 
 end_time = time.time()
 time_usage = end_time - start_time
 print(f"Optimized Time Usage: {time_usage:.4f} seconds")
+# Readings are only needed for the plots
+_, (left_fly_vision, right_fly_vision) = brightness.with_reading(raw_image)
 left_human = retina.hex_pxls_to_human_readable(left_fly_vision, color_8bit=True).max(axis=-1)
 right_human = retina.hex_pxls_to_human_readable(right_fly_vision, color_8bit=True).max(axis=-1)
 
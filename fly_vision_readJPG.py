@@ -1,41 +1,309 @@
-import numpy as np
+"""
+fly_vision_readJPG.py
+
+Streaming JPEG / video -> fly-vision preprocessing.
+
+Frames come from a directory of JPEGs, a video file or a single image.
+Decoding and the retina transform (retina_sampling.BatchRetinaSampler,
+which reads the pixels of both eyes straight from the uint8 frame) run
+on a thread pool, since OpenCV and the Numba kernel release the GIL,
+with a bounded number of frames in flight. Each batch of (B, 2, 721, 2)
+readings (left and right eye halves) is written straight into a
+memory-mapped .npy file. Memory use therefore stays constant however long the input is.
+No BGR -> RGB conversion is needed: the samplers read OpenCV's BGR order.
+
+Usage:
+    python fly_vision_readJPG.py --input ./raw_frames --output preprocessed.npy
+    python fly_vision_readJPG.py --input footage.mp4 --output footage_vision.npy --batch 128
+    python fly_vision_readJPG.py --input test2.jpg --output test2.npy --show
+"""
+
+import argparse
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
 import cv2
-import matplotlib.pyplot as plt
-from flygym import Fly
-from flygym.vision.retina import Retina
+import numpy as np
+
+from jpeg_decode import imread_for_retina
+from retina_sampling import BatchRetinaSampler, eye_samplers
+from vision_timing import timer
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".bmp"}
+
+# Fixed .npy header size, so the frame count can be rewritten in place
+_NPY_HEADER_LEN = 128
+
+
+# -------------------- Frame sources ----------------------
+def list_frames(input_path: Path):
+    """Sorted image files of a directory (or the single image given)."""
+    input_path = Path(input_path)
+    if input_path.is_dir():
+        return sorted(p for p in input_path.iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)
+    return [input_path]
+
+
+def is_video(input_path: Path) -> bool:
+    input_path = Path(input_path)
+    return input_path.is_file() and input_path.suffix.lower() not in IMAGE_SUFFIXES
+
+
+def _read_video(path: Path, frames: queue.Queue, stop: threading.Event):
+    # VideoCapture decodes sequentially; one thread keeps it busy
+    cap = cv2.VideoCapture(str(path))
+    try:
+        while not stop.is_set():
+            with timer.span("decode"):
+                ok, frame = cap.read()
+            if not ok:
+                break
+            frames.put(frame)
+    finally:
+        cap.release()
+        frames.put(None)
+
+
+def _ordered_map(fn, items, pool, prefetch):
+    """pool.map that keeps at most `prefetch` items in flight."""
+    pending = deque()
+    for item in items:
+        pending.append(pool.submit(fn, item))
+        if len(pending) >= prefetch:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def load_frames(input_path: Path, workers: int = None, prefetch: int = None,
+                reduce_for=None, skipped: list = None):
+    """
+    Yields the BGR frames of a JPEG directory, single image or video, in
+    order. Images are decoded on `workers` threads with at most
+    `prefetch` frames decoded ahead. If `reduce_for` is a Retina, JPEGs are
+    decoded at the smallest DCT scale that still covers its grid per eye
+    half (see jpeg_decode).
+
+    Images that cannot be read are skipped with a warning and their paths
+    appended to `skipped`, so one bad file does not end a long run.
+    """
+    workers = workers or os.cpu_count()
+    prefetch = prefetch or 2 * workers
+
+    def decode(path):
+        with timer.span("decode"):
+            if reduce_for is not None:
+                frame = imread_for_retina(path, reduce_for)
+            else:
+                frame = cv2.imread(str(path))
+        return frame
+
+    if not is_video(input_path):
+        paths = list_frames(input_path)
+        with ThreadPoolExecutor(workers) as pool:
+            for path, frame in zip(paths, _ordered_map(decode, paths, pool, prefetch)):
+                if frame is None:
+                    print(f"Warning: skipping unreadable image '{path}'")
+                    if skipped is not None:
+                        skipped.append(path)
+                    continue
+                yield frame
+        return
+
+    frames, stop = queue.Queue(maxsize=prefetch), threading.Event()
+    reader = threading.Thread(target=_read_video, args=(input_path, frames, stop), daemon=True)
+    reader.start()
+    try:
+        while (frame := frames.get()) is not None:
+            yield frame
+    finally:
+        stop.set()
+        while reader.is_alive():      # unblock the reader if the queue is full
+            try:
+                frames.get_nowait()
+            except queue.Empty:
+                reader.join(0.01)
+
+
+def count_frames(input_path: Path) -> int:
+    """Number of frames (a video's reported count may be approximate)."""
+    if not is_video(input_path):
+        return len(list_frames(input_path))
+    cap = cv2.VideoCapture(str(input_path))
+    count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    return max(count, 0)
+
+
+# -------------------- Retina transform ----------------------
+class _SamplerCache:
+    """
+    Left/right eye samplers of the `max_shapes` most recently used frame
+    shapes (frames are BGR).
+    """
+    def __init__(self, retina, interpolation, max_shapes: int = 4):
+        self.retina = retina
+        self.interpolation = interpolation
+        self.max_shapes = max_shapes
+        self._samplers = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __getitem__(self, shape):
+        with self._lock:
+            if shape in self._samplers:
+                self._samplers.move_to_end(shape)
+            else:
+                with timer.span("sampler_build"):
+                    self._samplers[shape] = BatchRetinaSampler.from_samplers(eye_samplers(
+                        self.retina, shape, self.interpolation, bgr=True))
+                if len(self._samplers) > self.max_shapes:
+                    self._samplers.popitem(last=False)
+            return self._samplers[shape]
+
+
+def preprocess(frames, retina, batch_size: int = 64, interpolation: int = cv2.INTER_LINEAR,
+               workers: int = None, prefetch: int = None):
+    """
+    Yields (B, 2, N, 2) float32 retina readings (left and right halves of
+    each frame) for an iterable of BGR frames.
+
+    Every frame is run through the retina kernel on one of `workers`
+    threads; a batch only collects the readings.
+    """
+    workers = workers or os.cpu_count()
+    prefetch = prefetch or 2 * workers
+    samplers = _SamplerCache(retina, interpolation)
+
+    def sample(frame):
+        sampler = samplers[frame.shape]
+        with timer.span("retina_apply"):
+            return sampler.sample(frame)
+
+    with ThreadPoolExecutor(workers) as pool:
+        batch = []
+        for readings in _ordered_map(sample, frames, pool, prefetch):
+            batch.append(readings)
+            if len(batch) == batch_size:
+                yield np.stack(batch)
+                batch = []
+        if batch:
+            yield np.stack(batch)
+
+
+# -------------------- Output ----------------------
+def _write_npy_header(f, shape, dtype):
+    header = repr({"descr": np.lib.format.dtype_to_descr(np.dtype(dtype)),
+                   "fortran_order": False, "shape": tuple(shape)})
+    header = header.ljust(_NPY_HEADER_LEN - 10 - 1) + "\n"
+    f.seek(0)
+    f.write(b"\x93NUMPY\x01\x00" + len(header).to_bytes(2, "little") + header.encode("latin1"))
 
-image_path = "test2.jpg"
-raw_image = cv2.imread(image_path)
 
-if raw_image is None:
-    raise FileNotFoundError(f"Error: Image file '{image_path}' not found.")
+class NpyWriter:
+    """
+    Appends frames to a memory-mapped .npy file whose frame count grows as
+    needed and is fixed up on close.
+    """
+    def __init__(self, path: Path, frame_shape, dtype=np.float32, capacity: int = 1024):
+        self.path = Path(path)
+        self.frame_shape = tuple(frame_shape)
+        self.dtype = np.dtype(dtype)
+        self.count = 0
+        self._frame_bytes = int(np.prod(self.frame_shape)) * self.dtype.itemsize
+        with open(self.path, "wb") as f:
+            _write_npy_header(f, (0, *self.frame_shape), self.dtype)
+        self._map(max(capacity, 1))
 
-raw_image = cv2.cvtColor(raw_image, cv2.COLOR_BGR2RGB)
+    def _map(self, capacity):
+        with open(self.path, "r+b") as f:
+            f.truncate(_NPY_HEADER_LEN + capacity * self._frame_bytes)
+        self.capacity = capacity
+        self._array = np.memmap(self.path, dtype=self.dtype, mode="r+",
+                                offset=_NPY_HEADER_LEN,
+                                shape=(capacity, *self.frame_shape))
 
-fly = Fly(enable_vision=True)
-retina = Retina()
+    def write(self, batch: np.ndarray):
+        end = self.count + len(batch)
+        if end > self.capacity:
+            self._array.flush()
+            del self._array
+            self._map(max(end, 2 * self.capacity))
+        self._array[self.count:end] = batch
+        self.count = end
 
-resized_image = cv2.resize(raw_image, (retina.ncols, retina.nrows))
+    def close(self):
+        self._array.flush()
+        del self._array
+        with open(self.path, "r+b") as f:
+            _write_npy_header(f, (self.count, *self.frame_shape), self.dtype)
+            f.truncate(_NPY_HEADER_LEN + self.count * self._frame_bytes)
 
-fly_vision = retina.raw_image_to_hex_pxls(resized_image)
 
-print("Fly Vision Data Shape:", fly_vision.shape)  # Expected: (721, 2)
+# -------------------- Main ----------------------
+def main():
+    from retina_cache import load_retina
 
-vision_left = fly.retina.hex_pxls_to_human_readable(fly_vision, color_8bit=True)
-vision_right = vision_left  # We only have one image, so duplicate for both eyes
+    parser = argparse.ArgumentParser(
+        description="Convert a JPEG directory, video or image to (N, 2, 721, 2) fly vision.")
+    parser.add_argument("--input", type=Path, default=Path("test2.jpg"),
+                        help="directory of images, video file or single image")
+    parser.add_argument("--output", type=Path, default=Path("processed_data.npy"))
+    parser.add_argument("--batch", type=int, default=64, help="frames per retina batch")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="decode threads (default: all cores)")
+    parser.add_argument("--prefetch", type=int, default=None,
+                        help="frames in flight per stage (default: 2 x workers)")
+    parser.add_argument("--interpolation", choices=("linear", "nearest"), default="linear")
+    parser.add_argument("--reduced-decode", action="store_true",
+                        help="decode JPEGs at 1/2, 1/4 or 1/8 scale when that still "
+                             "covers the retina (see jpeg_decode.py)")
+    parser.add_argument("--show", action="store_true", help="plot the first frame's eyes")
+    parser.add_argument("--timing", default=None,
+                        help="per-stage timing: .json / .csv path, or '-' to print")
+    args = parser.parse_args()
 
-vision_left_gray = vision_left.max(axis=-1)  # Convert (H, W, 2) → (H, W)
-vision_right_gray = vision_right.max(axis=-1)  # Convert (H, W, 2) → (H, W)
+    if args.timing:
+        timer.enabled = True
+    with timer.span("retina_init"):
+        retina = load_retina()
+    interpolation = cv2.INTER_LINEAR if args.interpolation == "linear" else cv2.INTER_NEAREST
+    writer = NpyWriter(args.output, (2, retina.num_ommatidia_per_eye, 2),
+                       capacity=count_frames(args.input))
 
-fig, axs = plt.subplots(1, 2, figsize=(6, 3), tight_layout=True)
-axs[0].imshow(vision_left_gray, cmap="gray")  # Left Eye
-axs[0].set_title("Left Eye Vision")
-axs[0].axis("off")
+    start = time.perf_counter()
+    skipped = []
+    frames = load_frames(args.input, args.workers, args.prefetch,
+                         retina if args.reduced_decode else None, skipped)
+    for batch in preprocess(frames, retina, args.batch, interpolation,
+                            args.workers, args.prefetch):
+        with timer.span("write"):
+            writer.write(batch)
+    writer.close()
+    elapsed = time.perf_counter() - start
+    print(f"Fly Vision Data: {writer.count} frames -> {args.output} "
+          f"({writer.count / max(elapsed, 1e-9):.1f} frames/s)")
+    if skipped:
+        print(f"Warning: {len(skipped)} unreadable image(s) skipped, e.g. {skipped[0]}")
+    if args.timing:
+        timer.export(args.timing)
 
-axs[1].imshow(vision_right_gray, cmap="gray")  # Right Eye
-axs[1].set_title("Right Eye Vision")
-axs[1].axis("off")
+    if args.show and writer.count:
+        import matplotlib.pyplot as plt
 
-plt.show() 
+        vision = np.load(args.output, mmap_mode="r")[0]
+        fig, axs = plt.subplots(1, 2, figsize=(6, 3), tight_layout=True)
+        for ax, eye, title in zip(axs, vision, ("Left Eye Vision", "Right Eye Vision")):
+            human = retina.hex_pxls_to_human_readable(np.asarray(eye), color_8bit=True)
+            ax.imshow(human.max(axis=-1), cmap="gray")
+            ax.set_title(title)
+            ax.axis("off")
+        plt.show()
 
 
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""
+jpeg_decode.py
+
+Reduced-resolution JPEG decoding sized to the retina.
+
+A JPEG can be decoded at 1/2, 1/4 or 1/8 scale in the DCT domain
+(cv2.IMREAD_REDUCED_COLOR_2/4/8), which skips most of the inverse DCT and
+upsampling work. The retina only needs each eye half to cover ncols x
+nrows pixels, so the largest factor that still does is picked from the
+JPEG header, and the small remaining resize happens in the retina
+sampler (retina_sampling).
+
+Usage:
+    frame = imread_for_retina("frame.jpg", retina)     # BGR, maybe reduced
+
+Decode speed-up and retina output difference vs a full decode:
+    python jpeg_decode.py --image test2.jpg --upscale 4
+"""
+
+import argparse
+import struct
+import time
+from pathlib import Path
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+
+REDUCED_FLAGS = {
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+# Start-of-frame markers (baseline, progressive, ...) hold the image size
+_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7,
+                0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def _exif_orientation(segment: bytes) -> int:
+    """Orientation tag (1-8) of an APP1 Exif segment body, 1 if absent."""
+    if segment[:6] != b"Exif\0\0":
+        return 1
+    tiff = segment[6:]
+    order = {b"II": "<", b"MM": ">"}.get(tiff[:2])
+    if order is None or len(tiff) < 8:
+        return 1
+    ifd = struct.unpack(order + "I", tiff[4:8])[0]
+    if ifd + 2 > len(tiff):
+        return 1
+    count = struct.unpack(order + "H", tiff[ifd:ifd + 2])[0]
+    for entry in range(ifd + 2, min(ifd + 2 + 12 * count, len(tiff) - 11), 12):
+        tag, _, _, value = struct.unpack(order + "HHIH", tiff[entry:entry + 10])
+        if tag == 0x0112:
+            return value if 1 <= value <= 8 else 1
+    return 1
+
+
+def jpeg_size(data: bytes) -> Optional[Tuple[int, int]]:
+    """
+    (height, width) of a JPEG as cv2.imdecode returns it, or None if
+    `data` is not a JPEG. The frame header size is swapped when the Exif
+    orientation (5-8) rotates the image by 90 degrees, since OpenCV
+    applies the orientation while decoding.
+    """
+    if data[:2] != b"\xff\xd8":
+        return None
+    pos = 2
+    orientation = 1
+    while pos + 4 <= len(data):
+        if data[pos] != 0xFF:
+            return None
+        marker = data[pos + 1]
+        if marker == 0xFF:                 # fill byte
+            pos += 1
+            continue
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            pos += 2
+            continue
+        length = struct.unpack(">H", data[pos + 2:pos + 4])[0]
+        if marker == 0xE1:
+            orientation = _exif_orientation(data[pos + 4:pos + 2 + length])
+        if marker in _SOF_MARKERS:
+            height, width = struct.unpack(">HH", data[pos + 5:pos + 9])
+            return (width, height) if orientation >= 5 else (height, width)
+        pos += 2 + length
+    return None
+
+
+def reduction_factor(size: Tuple[int, int], retina, split_eyes: bool = True) -> int:
+    """
+    Largest JPEG scale factor (1, 2, 4 or 8) whose decoded image still has
+    at least retina.nrows rows and retina.ncols columns per eye half
+    (per image if split_eyes is False).
+    """
+    height, width = size
+    halves = 2 if split_eyes else 1
+    for factor in (8, 4, 2):
+        # libjpeg rounds scaled dimensions up
+        if (-(-height // factor) >= retina.nrows
+                and -(-width // factor) // halves >= retina.ncols):
+            return factor
+    return 1
+
+
+def decode_for_retina(data: bytes, retina, split_eyes: bool = True) -> np.ndarray:
+    """Decodes encoded image bytes to BGR at the smallest scale that still
+    covers the retina grid."""
+    buf = np.frombuffer(data, dtype=np.uint8)
+    size = jpeg_size(data)
+    factor = reduction_factor(size, retina, split_eyes) if size else 1
+    return cv2.imdecode(buf, REDUCED_FLAGS.get(factor, cv2.IMREAD_COLOR))
+
+
+def imread_for_retina(path, retina, split_eyes: bool = True) -> Optional[np.ndarray]:
+    """cv2.imread counterpart of decode_for_retina (None if unreadable)."""
+    try:
+        data = Path(path).read_bytes()
+    except OSError:
+        return None
+    return decode_for_retina(data, retina, split_eyes)
+
+
+# -------------------- Benchmark ----------------------
+def main():
+    from retina_cache import load_retina
+
+    from retina_sampling import eye_samplers
+
+    parser = argparse.ArgumentParser(
+        description="Reduced vs full JPEG decode: speed and retina output difference.")
+    parser.add_argument("--image", default="test2.jpg")
+    parser.add_argument("--upscale", type=float, default=4.0,
+                        help="re-encode the image this much larger, like a high-res camera")
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    retina = load_retina()
+    image = cv2.imread(args.image)
+    if image is None:
+        raise FileNotFoundError(f"Error: Image file '{args.image}' not found.")
+    if args.upscale != 1:
+        image = cv2.resize(image, None, fx=args.upscale, fy=args.upscale,
+                           interpolation=cv2.INTER_CUBIC)
+    data = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes()
+    buf = np.frombuffer(data, dtype=np.uint8)
+
+    def timed(fn):
+        fn()
+        start = time.perf_counter()
+        for _ in range(args.repeats):
+            result = fn()
+        return (time.perf_counter() - start) / args.repeats * 1e3, result
+
+    full_ms, full = timed(lambda: cv2.imdecode(buf, cv2.IMREAD_COLOR))
+    reduced_ms, reduced = timed(lambda: decode_for_retina(data, retina))
+    factor = full.shape[0] // reduced.shape[0]
+
+    outputs = []
+    for frame in (full, reduced):
+        samplers = eye_samplers(retina, frame.shape, bgr=True)
+        outputs.append(np.stack([s(frame) for s in samplers]))
+    diff = np.abs(outputs[0] - outputs[1])
+    print(f"JPEG {full.shape[1]}x{full.shape[0]} -> 1/{factor} "
+          f"({reduced.shape[1]}x{reduced.shape[0]})")
+    print(f"Decode: full {full_ms:.2f} ms, reduced {reduced_ms:.2f} ms "
+          f"({full_ms / reduced_ms:.1f}x faster)")
+    print(f"Retina output: max |diff| {diff.max():.4f}, mean |diff| {diff.mean():.5f} "
+          f"(readings in [0, 1])")
+
+
+if __name__ == "__main__":
+    main()
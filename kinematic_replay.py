@@ -0,0 +1,298 @@
+"""
+kinematic_replay.py
+
+Memory-mapped behavior datasets and lazy, windowed kinematic replay for
+FlySandboxEnv.
+
+FlyGym ships recorded kinematics as pickles: a dict of joint name -> 1-D
+angle time series plus a "meta" dict (timestep, source, ...). Unpickling
+is slow, gives every process its own copy and is not safe on untrusted
+files. convert_recording() turns any recording in that schema into a
+columnar dataset directory:
+
+    angles.npy   float32 (n_joints, n_samples), each joint a contiguous row
+    index.json   format version, joint -> row order, n_samples, meta and
+                 any other JSON-serializable keys
+
+load_dataset() converts once per source file (keyed on its path, size
+and mtime) into a cache directory and then memory-maps angles.npy
+read-only, so env instances in one process share one array and
+processes share the OS page cache: construction is near-instant and
+zero-copy.
+
+The recording used to be interpolated to the simulation rate (10 kHz)
+for the whole run_time up front, as a float64 (n_joints, n_steps) block
+per env. KinematicReplay instead interpolates only a fixed-size float32
+window of steps at a time as step() moves forward, so memory no longer
+grows with run_time.
+
+Usage:
+    source = load_recording(behavior_file, actuated_joints)
+    replay = KinematicReplay(source, timestep=1e-4)
+    joint_pos = replay[step]          # (n_joints,) float32 copy
+
+Convert recordings ahead of time (e.g. before starting workers):
+    python kinematic_replay.py path/to/recording.pkl [...]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import time
+from dataclasses import dataclass
+from functools import cached_property, lru_cache
+from pathlib import Path
+from typing import Sequence
+
+import numpy as np
+
+DEFAULT_CACHE_DIR = Path(".replay_cache")
+DEFAULT_WINDOW = 4096
+FORMAT_VERSION = 1
+
+
+# -------------------- Columnar dataset ----------------------
+def _to_json(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (tuple, set)):
+        return list(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _is_series(value) -> bool:
+    if isinstance(value, (str, bytes, dict)):
+        return False
+    try:
+        array = np.asarray(value)
+    except (TypeError, ValueError):
+        return False
+    return array.ndim == 1 and array.size > 1 and np.issubdtype(array.dtype, np.number)
+
+
+class BehaviorDataset:
+    """
+    A converted recording: `angles` (memory-mapped float32, one row per
+    joint), the joint order, `meta` and the recording's other keys
+    (`extra`).
+    """
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        index = json.loads((self.directory / "index.json").read_text())
+        if index.get("format") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported dataset format in {self.directory}")
+        self.joints = tuple(index["joints"])
+        self.num_samples = index["num_samples"]
+        self.meta = index["meta"]
+        self.extra = index.get("extra", {})
+        self.source = index.get("source")
+        self._rows = {joint: row for row, joint in enumerate(self.joints)}
+
+    @cached_property
+    def angles(self) -> np.ndarray:
+        angles = np.load(self.directory / "angles.npy", mmap_mode="r")
+        if angles.shape != (len(self.joints), self.num_samples):
+            raise ValueError(f"angles.npy does not match index.json in {self.directory}")
+        return angles
+
+    @property
+    def timestep(self) -> float:
+        return self.meta["timestep"]
+
+    def __contains__(self, joint: str) -> bool:
+        return joint in self._rows
+
+    def __getitem__(self, joint: str) -> np.ndarray:
+        """(n_samples,) float32 series of `joint` (a read-only view)."""
+        return self.angles[self._rows[joint]]
+
+    def rows(self, joints: Sequence[str]) -> np.ndarray:
+        missing = [joint for joint in joints if joint not in self._rows]
+        if missing:
+            raise KeyError(f"Joints not in the recording: {', '.join(missing)}")
+        return np.array([self._rows[joint] for joint in joints], dtype=np.int64)
+
+    def select(self, joints: Sequence[str]) -> "RecordedKinematics":
+        """The recording restricted to `joints`, in that order (no copy)."""
+        return RecordedKinematics(self.angles, self.rows(joints), self.timestep, tuple(joints))
+
+    @staticmethod
+    def save(recording: dict, directory: Path, source: str = None) -> "BehaviorDataset":
+        """Writes a recording dict to `directory` (atomically)."""
+        directory = Path(directory)
+        if "meta" not in recording or "timestep" not in recording["meta"]:
+            raise ValueError("Recording has no meta['timestep']")
+        joints = [key for key, value in recording.items()
+                  if key != "meta" and _is_series(value)]
+        if not joints:
+            raise ValueError("Recording has no joint time series")
+        lengths = {len(recording[joint]) for joint in joints}
+        if len(lengths) != 1:
+            raise ValueError(f"Joint series have different lengths: {sorted(lengths)}")
+        angles = np.empty((len(joints), lengths.pop()), dtype=np.float32)
+        for row, joint in enumerate(joints):
+            angles[row] = recording[joint]
+
+        extra = {}
+        for key, value in recording.items():
+            if key == "meta" or key in joints:
+                continue
+            try:
+                json.dumps(value, default=_to_json)
+            except (TypeError, ValueError):
+                continue
+            extra[key] = value
+        index = {"format": FORMAT_VERSION, "source": source, "joints": joints,
+                 "num_samples": angles.shape[1], "meta": recording["meta"], "extra": extra}
+
+        directory.parent.mkdir(parents=True, exist_ok=True)
+        tmp = Path(tempfile.mkdtemp(prefix=directory.name + ".tmp", dir=directory.parent))
+        np.save(tmp / "angles.npy", angles)
+        (tmp / "index.json").write_text(json.dumps(index, indent=2, default=_to_json))
+        try:
+            os.replace(tmp, directory)
+        except OSError:
+            # Another process saved it first
+            shutil.rmtree(tmp, ignore_errors=True)
+        return BehaviorDataset(directory)
+
+
+def _dataset_dir(behavior_file: Path, cache_dir: Path, size: int, mtime_ns: int) -> Path:
+    digest = hashlib.sha256(
+        f"{FORMAT_VERSION}:{behavior_file.resolve()}:{size}:{mtime_ns}".encode())
+    return Path(cache_dir) / f"{behavior_file.stem}_{digest.hexdigest()[:16]}"
+
+
+def convert_recording(behavior_file, directory: Path) -> BehaviorDataset:
+    """Converts a FlyGym behavior pickle to a dataset in `directory`."""
+    behavior_file = Path(behavior_file)
+    with open(behavior_file, "rb") as f:
+        recording = pickle.load(f)
+    return BehaviorDataset.save(recording, directory, source=str(behavior_file))
+
+
+@lru_cache(maxsize=32)
+def _load_dataset(behavior_file: Path, cache_dir: Path, size: int,
+                  mtime_ns: int) -> BehaviorDataset:
+    directory = _dataset_dir(behavior_file, cache_dir, size, mtime_ns)
+    try:
+        return BehaviorDataset(directory)
+    except (OSError, KeyError, ValueError):
+        shutil.rmtree(directory, ignore_errors=True)
+    return convert_recording(behavior_file, directory)
+
+
+def load_dataset(behavior_file, cache_dir: Path = DEFAULT_CACHE_DIR) -> BehaviorDataset:
+    """
+    The dataset of a FlyGym behavior pickle, converted into `cache_dir`
+    the first time (or when the pickle changes) and memory-mapped.
+    Repeated calls in a process return the same object while the pickle
+    is unchanged (same size and mtime).
+    """
+    behavior_file = Path(behavior_file)
+    stat = behavior_file.stat()
+    return _load_dataset(behavior_file, Path(cache_dir), stat.st_size, stat.st_mtime_ns)
+
+
+@dataclass(frozen=True)
+class RecordedKinematics:
+    """Rows `rows` of a read-only (n_all_joints, n_samples) float32 array."""
+    angles: np.ndarray
+    rows: np.ndarray
+    timestep: float
+    joints: tuple
+
+    @property
+    def num_samples(self) -> int:
+        return self.angles.shape[1]
+
+    @property
+    def duration(self) -> float:
+        return (self.num_samples - 1) * self.timestep
+
+
+def load_recording(behavior_file, joints: Sequence[str],
+                   cache_dir: Path = DEFAULT_CACHE_DIR) -> RecordedKinematics:
+    """The recorded angles of `joints` from a FlyGym behavior pickle (see load_dataset)."""
+    return load_dataset(behavior_file, cache_dir).select(joints)
+
+
+# -------------------- Replay ----------------------
+class KinematicReplay:
+    """
+    Recorded joint angles linearly interpolated to `timestep`, computed
+    in float32 windows of `window` steps on demand. Like np.interp, steps
+    past the end of the recording hold its last sample.
+
+    Parameters:
+        source: RecordedKinematics (shared, read-only).
+        timestep: Simulation timestep.
+        window: Steps interpolated at a time.
+    """
+    def __init__(self, source: RecordedKinematics, timestep: float,
+                 window: int = DEFAULT_WINDOW):
+        self.source = source
+        self.timestep = timestep
+        self.window = window
+        self._block = np.empty((len(source.joints), window), dtype=np.float32)
+        self._start = None
+
+    @property
+    def num_joints(self) -> int:
+        return len(self.source.joints)
+
+    def _fill(self, start: int):
+        # Sample position of every step in the window, then one blend of
+        # neighbouring columns for all joints
+        pos = (np.arange(start, start + self.window) * self.timestep) / self.source.timestep
+        last = self.source.num_samples - 1
+        pos = np.clip(pos, 0, last)
+        left = np.minimum(np.floor(pos).astype(np.int64), max(last - 1, 0))
+        frac = (pos - left).astype(np.float32)
+        right = np.minimum(left + 1, last)
+        rows = self.source.rows[:, None]
+        angles = self.source.angles
+        np.multiply(angles[rows, left], 1 - frac, out=self._block)
+        self._block += angles[rows, right] * frac
+        self._start = start
+
+    def __getitem__(self, step: int) -> np.ndarray:
+        """(n_joints,) float32 angles at simulation step `step` (a copy,
+        so it stays valid when the window moves)."""
+        if self._start is None or not self._start <= step < self._start + self.window:
+            self._fill(step - step % self.window)
+        return self._block[:, step - self._start].copy()
+
+
+# -------------------- Converter CLI ----------------------
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convert FlyGym behavior pickles to memory-mapped datasets.")
+    parser.add_argument("recordings", nargs="+", type=Path)
+    parser.add_argument("--cache-dir", type=Path, default=DEFAULT_CACHE_DIR)
+    args = parser.parse_args()
+
+    for behavior_file in args.recordings:
+        start = time.perf_counter()
+        with open(behavior_file, "rb") as f:
+            pickle.load(f)
+        unpickle = time.perf_counter() - start
+
+        dataset = load_dataset(behavior_file, args.cache_dir)
+        start = time.perf_counter()
+        BehaviorDataset(dataset.directory).angles
+        mapped = time.perf_counter() - start
+        print(f"{behavior_file} -> {dataset.directory}")
+        print(f"  {len(dataset.joints)} joints x {dataset.num_samples} samples "
+              f"@ {dataset.timestep} s, extra keys: {sorted(dataset.extra) or '-'}")
+        print(f"  load: unpickle {unpickle * 1e3:.2f} ms, memory-mapped {mapped * 1e3:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+queue_worker.py
+
+Bounded producer/consumer queue with one background worker thread.
+
+VideoRecorder (encoding) and render_scheduler.AsyncRenderer
+(rasterizing) both hand work to a thread and must not buffer without
+bound when it falls behind. QueueWorker holds what they share: a
+bounded queue whose producer blocks while it is full, the worker loop,
+error propagation to the producer (the queue is drained on failure, so
+a blocked producer wakes up) and close() / context-manager shutdown.
+
+Usage:
+    class Printer(QueueWorker):
+        @contextmanager
+        def _session(self):
+            yield print
+
+    with Printer(max_queue=8) as printer:
+        printer._submit("hello")
+"""
+
+import queue
+import threading
+from abc import ABC, abstractmethod
+from typing import Callable, ContextManager
+
+_STOP = object()
+
+
+class QueueWorker(ABC):
+    """
+    A bounded queue consumed by a background thread.
+
+    Subclasses implement _session(), a context manager run on the
+    worker thread that yields the function handling each queued item;
+    its setup and teardown (opening a writer, freeing a context) stay on
+    that thread. A failure stops the worker and is raised as a
+    RuntimeError with `failure_message` by the next _submit() or close().
+    """
+    failure_message = "Background worker failed"
+
+    def __init__(self, max_queue: int):
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._error = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=type(self).__name__, daemon=True)
+        self._thread.start()
+
+    @abstractmethod
+    def _session(self) -> ContextManager[Callable]:
+        """Context manager yielding the handler of each queued item."""
+
+    def _run(self):
+        try:
+            with self._session() as handle:
+                while True:
+                    item = self._queue.get()
+                    if item is _STOP:
+                        break
+                    handle(item)
+        except Exception as error:
+            self._error = error
+            # Unblock a producer waiting on a full queue
+            while True:
+                try:
+                    self._queue.get_nowait()
+                except queue.Empty:
+                    break
+
+    def _check(self):
+        if self._error is not None:
+            raise RuntimeError(self.failure_message) from self._error
+
+    def _submit(self, item):
+        """Queues `item`, blocking while the queue is full."""
+        if self._closed:
+            raise ValueError(f"{type(self).__name__} is closed")
+        self._check()
+        self._put(item)
+
+    def _put(self, item):
+        while True:
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                self._check()
+
+    def close(self):
+        """Handles the pending items and stops the worker."""
+        if self._closed:
+            return
+        self._closed = True
+        if self._error is None:
+            self._put(_STOP)
+        self._thread.join()
+        self._check()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.close()
+        except RuntimeError:
+            # Keep the exception raised inside the block, if any
+            if exc_type is None:
+                raise
+        return False
@@ -0,0 +1,166 @@
+"""
+render_scheduler.py
+
+Render decimation and decoupled offscreen rendering for simulations.
+
+At a 1e-4 s timestep, rendering on every physics step produces frames
+far above the video frame rate, and rasterization dominates wall time.
+RenderScheduler renders only when a video frame is due: one frame per
+play_speed / fps seconds of simulated time, the schedule FlyGym's Camera
+uses. Calling sim.render() on every step still costs a pass over the
+flies and cameras, so the scheduler skips that call entirely. It keeps
+its own frame clock, which restarts when simulated time goes back
+(sim.reset()).
+
+AsyncRenderer moves offscreen rendering to a worker thread. When a frame
+is due, the physics loop only snapshots the kinematic state (qpos, mocap
+poses, time) into a bounded queue. The worker holds its own MjData on
+the shared model, restores each snapshot, runs the forward kinematics
+and rasterizes, so physics stepping does not wait on rendering unless
+the worker falls `max_pending` frames behind.
+
+AsyncRenderer renders a camera id like physics.render(), not through
+FlyGym's Camera.render(). Camera tracking (the camera moves that
+Camera._update_camera applies to the bound camera) and overlays
+(contact and gravity arrows, play-speed and time text) are not
+applied, so use it for fixed cameras or accept plain frames. Its GL
+context is created on the worker thread, which only the EGL and OSMesa
+backends support: AsyncRenderer refuses to start unless MUJOCO_GL is
+"egl" or "osmesa" (see offscreen_threads_supported()).
+
+Usage:
+    scheduler = RenderScheduler.from_camera(cam)
+    for _ in range(num_steps):
+        sim.step(action)
+        scheduler.render(sim)              # instead of sim.render()
+        drain_camera(cam, recorder)
+
+    with AsyncRenderer(sim.physics, cam.camera_id, (800, 608), recorder) as renderer:
+        for _ in range(num_steps):
+            sim.step(action)
+            if scheduler.due(sim.curr_time):
+                renderer.submit(sim.physics)
+"""
+
+import os
+from contextlib import contextmanager
+
+import numpy as np
+
+from queue_worker import QueueWorker
+
+# MuJoCo GL backends whose contexts may live on a non-main thread
+THREADED_GL_BACKENDS = ("egl", "osmesa")
+
+
+class RenderScheduler:
+    """
+    Decides which simulation times get a video frame.
+
+    Parameters:
+        fps: Frame rate of the output video.
+        play_speed: Simulated seconds per second of video.
+    """
+    def __init__(self, fps: float = 30, play_speed: float = 1.0):
+        self.fps = fps
+        self.play_speed = play_speed
+        self.interval = play_speed / fps
+        self.frames = 0
+        self._last_time = None
+
+    @classmethod
+    def from_camera(cls, cam) -> "RenderScheduler":
+        """Schedule of a FlyGym Camera (its fps and play_speed)."""
+        return cls(cam.fps, cam.play_speed)
+
+    def reset(self):
+        self.frames = 0
+        self._last_time = None
+
+    def due(self, curr_time: float) -> bool:
+        """Whether a frame is due at `curr_time` (counts it if so)."""
+        if self._last_time is not None and curr_time < self._last_time:
+            self.reset()
+        self._last_time = curr_time
+        if curr_time < self.frames * self.interval:
+            return False
+        self.frames += 1
+        return True
+
+    def render(self, sim):
+        """sim.render() if a frame is due, else None."""
+        if not self.due(sim.curr_time):
+            return None
+        return sim.render()
+
+
+def offscreen_threads_supported() -> bool:
+    """
+    Whether MUJOCO_GL selects a backend that renders off the main thread.
+    Unset counts as unsupported: dm_control then tries GLFW first.
+    """
+    return os.environ.get("MUJOCO_GL", "").lower() in THREADED_GL_BACKENDS
+
+
+class AsyncRenderer(QueueWorker):
+    """
+    Rasterizes physics state snapshots on a worker thread (EGL or OSMesa
+    only; no Camera tracking or overlays, see the module docstring).
+
+    Parameters:
+        physics: dm_control Physics being simulated (its model is shared).
+        camera_id: Camera to render (id or name).
+        window_size: (width, height) of the frames.
+        recorder: Optional VideoRecorder receiving every frame.
+        max_pending: Snapshots that may wait for the worker before
+            submit() blocks.
+    """
+    failure_message = "Offscreen rendering failed"
+
+    def __init__(self, physics, camera_id, window_size, recorder=None, max_pending: int = 64):
+        if not offscreen_threads_supported():
+            raise RuntimeError(
+                f"AsyncRenderer needs MUJOCO_GL in {THREADED_GL_BACKENDS}, got "
+                f"{os.environ.get('MUJOCO_GL')!r}: GLFW contexts must stay on the main thread")
+        self.camera_id = camera_id
+        self.width, self.height = window_size
+        self.recorder = recorder
+        self.frames_rendered = 0
+        self.last_frame = None
+        # Own MjData (and GL context, created and freed on the worker thread)
+        self._physics = physics.copy(share_model=True)
+        super().__init__(max_pending)
+
+    @classmethod
+    def for_camera(cls, sim, cam, recorder=None, **kwargs) -> "AsyncRenderer":
+        """Renderer of a FlyGym Camera's view (without its tracking or
+        overlays, which only Camera.render() applies)."""
+        return cls(sim.physics, cam.camera_id, cam.window_size, recorder, **kwargs)
+
+    @contextmanager
+    def _session(self):
+        try:
+            yield self._render
+        finally:
+            self._physics.free()
+
+    def _render(self, snapshot):
+        physics = self._physics
+        data = physics.data
+        qpos, mocap_pos, mocap_quat, time = snapshot
+        data.qpos[:] = qpos
+        data.mocap_pos[:] = mocap_pos
+        data.mocap_quat[:] = mocap_quat
+        data.time = time
+        physics.forward()
+        frame = physics.render(height=self.height, width=self.width, camera_id=self.camera_id)
+        self.last_frame = frame
+        self.frames_rendered += 1
+        if self.recorder is not None:
+            self.recorder.append(frame)
+
+    def submit(self, physics):
+        """Queues a frame of the current state of `physics`."""
+        data = physics.data
+        self._submit((np.array(data.qpos), np.array(data.mocap_pos),
+                      np.array(data.mocap_quat), float(data.time)))
@@ -0,0 +1,292 @@
+"""
+retina_cache.py
+
+On-disk cache of the retina geometry for fast startup of vision tools.
+
+`from flygym.vision.retina import Retina` imports the whole flygym
+package (MuJoCo, dm_control, the arenas and simulation), and the Retina
+methods are Numba functions compiled on first call. Vision-only tools
+just need the ommatidia geometry. The first load_retina() builds a
+flygym Retina once and saves its arrays, plus the per-pixel tables used
+to sample and rasterize, as .npy files under a versioned key (cache
+format + flygym version). Later processes memory-map those arrays lazily
+and get a NumPy-only RetinaGeometry, which offers the Retina attributes
+and methods the vision scripts use, without importing flygym.
+
+The sparse retina samplers (retina_sampling) can be cached the same way
+per frame shape, since building them costs more than using them.
+
+Usage:
+    retina = load_retina()
+    fly_vision = retina.raw_image_to_hex_pxls(resized_rgb)
+    left, right = cached_eye_samplers(retina, frame.shape, bgr=True)
+
+Cold-start benchmark (fresh interpreters, flygym Retina vs the cache):
+    python retina_cache.py --image test2.jpg
+"""
+
+import argparse
+import hashlib
+import importlib.metadata
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from functools import cached_property
+from pathlib import Path
+
+import numpy as np
+
+DEFAULT_CACHE_DIR = Path(".retina_cache")
+FORMAT_VERSION = 1
+
+_SCALARS = ("distortion_coefficient", "zoom", "nrows", "ncols", "num_ommatidia_per_eye")
+
+
+def geometry_key() -> str:
+    """Key of the default geometry: cache format and flygym version."""
+    try:
+        flygym_version = importlib.metadata.version("flygym")
+    except importlib.metadata.PackageNotFoundError:
+        flygym_version = "unknown"
+    digest = hashlib.sha256(f"{FORMAT_VERSION}:flygym-{flygym_version}".encode())
+    return digest.hexdigest()[:16]
+
+
+class RetinaGeometry:
+    """
+    NumPy-only stand-in for flygym's Retina, backed by (memory-mapped)
+    arrays: the ommatidia map, pale-type mask and pixel counts, plus
+    raw_image_to_hex_pxls and hex_pxls_to_human_readable with the same
+    results.
+
+    Lattice tables, over the pixels inside the hex lattice in row-major
+    order: their flat index (lattice_index), ommatidium (0-based,
+    lattice_ommatidium) and the RGB channel that ommatidium reads
+    (lattice_channel).
+    """
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        meta = json.loads((self.directory / "meta.json").read_text())
+        self.key = meta.get("key")
+        for name in _SCALARS:
+            setattr(self, name, meta[name])
+
+    def _load(self, name):
+        return np.load(self.directory / f"{name}.npy", mmap_mode="r")
+
+    @cached_property
+    def ommatidia_id_map(self) -> np.ndarray:
+        return self._load("ommatidia_id_map")
+
+    @cached_property
+    def pale_type_mask(self) -> np.ndarray:
+        return self._load("pale_type_mask")
+
+    @cached_property
+    def num_pixels_per_ommatidia(self) -> np.ndarray:
+        return self._load("num_pixels_per_ommatidia")
+
+    @cached_property
+    def lattice_index(self) -> np.ndarray:
+        return self._load("lattice_index")
+
+    @cached_property
+    def lattice_ommatidium(self) -> np.ndarray:
+        return self._load("lattice_ommatidium")
+
+    @cached_property
+    def lattice_channel(self) -> np.ndarray:
+        return self._load("lattice_channel")
+
+    @cached_property
+    def _lattice_bin(self) -> np.ndarray:
+        # Output element (ommatidium, channel) each lattice pixel adds to
+        return (self.lattice_ommatidium.astype(np.int64) * 2
+                + np.asarray(self.pale_type_mask)[self.lattice_ommatidium])
+
+    @cached_property
+    def _lattice_size(self) -> np.ndarray:
+        return np.asarray(self.num_pixels_per_ommatidia,
+                          dtype=np.float64)[self.lattice_ommatidium]
+
+    # -------------------- Building ----------------------
+    @staticmethod
+    def save(retina, directory: Path, key: str = None) -> "RetinaGeometry":
+        """Writes the geometry of a flygym Retina to `directory` (atomically)."""
+        directory = Path(directory)
+        id_map = np.asarray(retina.ommatidia_id_map)
+        pale = np.asarray(retina.pale_type_mask, dtype=np.int64)
+        lattice_index = np.flatnonzero(id_map.ravel())
+        lattice_ommatidium = (id_map.ravel()[lattice_index] - 1).astype(np.int16)
+        arrays = {
+            "ommatidia_id_map": id_map,
+            "pale_type_mask": pale,
+            "num_pixels_per_ommatidia": np.asarray(retina.num_pixels_per_ommatidia),
+            "lattice_index": lattice_index.astype(np.int32),
+            "lattice_ommatidium": lattice_ommatidium,
+            "lattice_channel": (pale[lattice_ommatidium] + 1).astype(np.int8),
+        }
+        meta = {name: getattr(retina, name) for name in _SCALARS}
+        meta = {name: value.item() if hasattr(value, "item") else value
+                for name, value in meta.items()}
+        meta["key"] = key
+
+        directory.parent.mkdir(parents=True, exist_ok=True)
+        tmp = Path(tempfile.mkdtemp(prefix=directory.name + ".tmp", dir=directory.parent))
+        for name, array in arrays.items():
+            np.save(tmp / f"{name}.npy", array)
+        (tmp / "meta.json").write_text(json.dumps(meta, indent=2))
+        try:
+            os.replace(tmp, directory)
+        except OSError:
+            # Another process saved it first
+            shutil.rmtree(tmp, ignore_errors=True)
+        return RetinaGeometry(directory)
+
+    # -------------------- Retina methods ----------------------
+    def raw_image_to_hex_pxls(self, raw_img: np.ndarray) -> np.ndarray:
+        """(N, 2) ommatidia reading of an (nrows, ncols, 3) RGB image, as
+        Retina.raw_image_to_hex_pxls."""
+        flat = raw_img.reshape(-1, 3)
+        values = flat[self.lattice_index, self.lattice_channel] / self._lattice_size
+        vals = np.bincount(self._lattice_bin, weights=values,
+                           minlength=2 * self.num_ommatidia_per_eye)
+        return vals.reshape(self.num_ommatidia_per_eye, 2) / 255
+
+    def hex_pxls_to_human_readable(self, ommatidia_reading: np.ndarray,
+                                   color_8bit: bool = False) -> np.ndarray:
+        """(nrows, ncols, ...) image of an (N, ...) reading, as
+        Retina.hex_pxls_to_human_readable."""
+        input_shape = ommatidia_reading.shape
+        if input_shape[0] != self.num_ommatidia_per_eye:
+            raise ValueError(
+                "The 0th dimension of the ommatidia reading must match the number of "
+                "ommatidia in the eye.")
+        reading = ommatidia_reading.reshape(self.num_ommatidia_per_eye, -1)
+        if color_8bit:
+            image = np.full((self.ommatidia_id_map.size, reading.shape[1]), 255, dtype=np.uint8)
+            image[self.lattice_index] = (reading * 255)[self.lattice_ommatidium]
+        else:
+            image = np.zeros((self.ommatidia_id_map.size, reading.shape[1]), dtype=reading.dtype)
+            image[self.lattice_index] = reading[self.lattice_ommatidium]
+        return image.reshape(*self.ommatidia_id_map.shape, *input_shape[1:])
+
+
+def load_retina(cache_dir: Path = DEFAULT_CACHE_DIR, refresh: bool = False) -> RetinaGeometry:
+    """
+    Default retina geometry from `cache_dir`, built from flygym's Retina
+    (importing flygym) only if it is not cached yet for this flygym
+    version.
+    """
+    key = geometry_key()
+    directory = Path(cache_dir) / key
+    if not refresh:
+        try:
+            return RetinaGeometry(directory)
+        except (OSError, KeyError, ValueError):
+            pass
+    from flygym.vision.retina import Retina
+
+    shutil.rmtree(directory, ignore_errors=True)
+    return RetinaGeometry.save(Retina(), directory, key)
+
+
+# -------------------- Sampler cache ----------------------
+def cached_sampler(retina, src_shape, columns=None, interpolation=None, bgr=False):
+    """
+    RetinaSampler for a RetinaGeometry, loaded from next to the geometry
+    when it was built before for the same frame shape and settings.
+    """
+    import cv2
+
+    from retina_sampling import RetinaSampler
+
+    interpolation = cv2.INTER_LINEAR if interpolation is None else interpolation
+    height, width = src_shape[:2]
+    x0, x1 = columns if columns is not None else (0, width)
+    path = (Path(retina.directory) / "samplers"
+            / f"{height}x{width}_{x0}-{x1}_i{interpolation}_{'bgr' if bgr else 'rgb'}.npz")
+    if path.exists():
+        try:
+            with np.load(path) as arrays:
+                return RetinaSampler.from_arrays(dict(arrays))
+        except (OSError, KeyError, ValueError):
+            path.unlink(missing_ok=True)
+    sampler = RetinaSampler(retina, src_shape, (x0, x1), interpolation, bgr)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.stem + f".tmp{os.getpid()}.npz")
+    np.savez(tmp, **sampler.to_arrays())
+    os.replace(tmp, path)
+    return sampler
+
+
+def cached_eye_samplers(retina, src_shape, interpolation=None, bgr=False):
+    """eye_samplers counterpart of cached_sampler."""
+    width = src_shape[1]
+    mid = width // 2
+    return (cached_sampler(retina, src_shape, (0, mid), interpolation, bgr),
+            cached_sampler(retina, src_shape, (mid, width), interpolation, bgr))
+
+
+# -------------------- Cold-start benchmark ----------------------
+_COLD_FLYGYM = """
+import time; start = time.perf_counter()
+import cv2
+from flygym.vision.retina import Retina
+from retina_sampling import eye_samplers
+from vision_brightness import RetinaRegions, movement_from_brightness
+frame = cv2.imread({image!r})
+retina = Retina()
+readings = [s(frame) for s in eye_samplers(retina, frame.shape, bgr=True)]
+whole = RetinaRegions.whole(retina)
+left, right = (whole.human_readable_sum(r)[0] for r in readings)
+movement_from_brightness(left, right)
+print(time.perf_counter() - start, 'flygym' in __import__('sys').modules)
+"""
+
+_COLD_CACHED = """
+import time; start = time.perf_counter()
+import cv2
+from retina_cache import load_retina, cached_eye_samplers
+from vision_brightness import RetinaRegions, movement_from_brightness
+frame = cv2.imread({image!r})
+retina = load_retina({cache_dir!r})
+readings = [s(frame) for s in cached_eye_samplers(retina, frame.shape, bgr=True)]
+whole = RetinaRegions.whole(retina)
+left, right = (whole.human_readable_sum(r)[0] for r in readings)
+movement_from_brightness(left, right)
+print(time.perf_counter() - start, 'flygym' in __import__('sys').modules)
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Cold-start time of a single-image brightness decision: flygym Retina vs cache.")
+    parser.add_argument("--image", default="test2.jpg")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    def cold(script, runs=args.runs):
+        times = []
+        for _ in range(runs):
+            out = subprocess.run([sys.executable, "-c", script], capture_output=True,
+                                 text=True, check=True, cwd=Path(__file__).parent)
+            seconds, imported = out.stdout.split()
+            times.append(float(seconds))
+        return min(times), imported == "True"
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        base, base_flygym = cold(_COLD_FLYGYM.format(image=args.image))
+        first, _ = cold(_COLD_CACHED.format(image=args.image, cache_dir=cache_dir), runs=1)
+        warm, warm_flygym = cold(_COLD_CACHED.format(image=args.image, cache_dir=cache_dir))
+    print(f"flygym Retina:      {base:.3f} s (flygym imported: {base_flygym})")
+    print(f"cache, first build: {first:.3f} s")
+    print(f"cache, warm:        {warm:.3f} s (flygym imported: {warm_flygym}), "
+          f"{base / warm:.1f}x faster")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,399 @@
+"""
+retina_sampling.py
+
+Fused image -> ommatidia sampling for the fly-vision scripts.
+
+The scripts resize every eye image to the full retina grid (ncols x
+nrows) with cv2.resize and then call Retina.raw_image_to_hex_pxls, which
+averages one colour channel over the pixels of each of the 721
+ommatidia. Both steps are linear in the source pixels, so for a fixed
+source resolution they collapse into one sparse averaging matrix from
+the source elements that are actually read to the ommatidia. Applying it
+is one gather and one float32 sparse mat-vec, and the intermediate
+resized image is never built.
+
+Supported interpolations are cv2.INTER_NEAREST (exact) and
+cv2.INTER_LINEAR (OpenCV rounds its bilinear weights to 1/2048, so
+results differ by a fraction of an intensity level).
+
+BatchRetinaSampler applies the same operators with a Numba kernel. The
+kernel reads the uint8 frames directly, so there is no float32 gather
+copy. It writes (N, 2, 721, 2) readings into a caller-provided buffer.
+It takes one (N, H, W, 3) or (N, 2, H, W, 3) array, parallel over
+frames, or a list of frames read in place. Stacking a list first costs
+more than the kernel saves.
+
+On one core, benchmark_vision (batch 16) measures it against
+eye_samplers(frame) calls at 1218 vs 1211 frames/s for 640x480 (+0.6%)
+and 210 vs 196 for 1920x1080 (+7%). In fly_vision_readJPG.preprocess it
+replaced gather + apply and went from 168 to 220 frames/s at 1920x1080.
+
+Numba is imported on first use. The kernel is compiled then, or loaded
+from Numba's cache.
+
+Usage:
+    left, right = eye_samplers(retina, raw_image.shape)
+    left_fly_vision = left(raw_image)      # (721, 2), like raw_image_to_hex_pxls
+
+    batch = BatchRetinaSampler(retina, frames.shape[1:])
+    out = batch.allocate(len(frames))
+    batch(frames, out=out)                 # (N, 2, 721, 2), frames (N, H, W, 3)
+
+Check and benchmark against the resize path:
+    python retina_sampling.py --image test2.jpg
+"""
+
+import argparse
+import time
+from functools import lru_cache
+from typing import Optional, Sequence, Tuple, Union
+
+import cv2
+import numpy as np
+import scipy.sparse
+
+
+def _resize_taps(n_src: int, n_dst: int, interpolation: int):
+    """
+    Source indices and weights along one axis for cv2.resize, as
+    (n_dst, taps) arrays, following OpenCV's coordinate mapping.
+    """
+    # Same rounding as OpenCV: the scale is the inverse of dst / src
+    scale = 1.0 / (n_dst / n_src)
+    dst = np.arange(n_dst)
+    if interpolation == cv2.INTER_NEAREST:
+        src = np.minimum(np.floor(dst * scale).astype(np.int64), n_src - 1)
+        return src[:, None], np.ones((n_dst, 1))
+    if interpolation == cv2.INTER_LINEAR:
+        pos = (dst + 0.5) * scale - 0.5
+        src = np.floor(pos).astype(np.int64)
+        frac = pos - src
+        frac[src < 0] = 0.0
+        src[src < 0] = 0
+        edge = src >= n_src - 1
+        frac[edge] = 0.0
+        src[edge] = n_src - 1
+        return (np.stack([src, np.minimum(src + 1, n_src - 1)], axis=1),
+                np.stack([1.0 - frac, frac], axis=1))
+    raise ValueError("Only cv2.INTER_NEAREST and cv2.INTER_LINEAR are supported")
+
+
+class RetinaSampler:
+    """
+    Precomputed sparse operator from a raw (H, W, 3) frame, or a column
+    range of it, to the (N, 2) ommatidia reading of `retina`.
+
+    Equivalent to
+        retina.raw_image_to_hex_pxls(
+            cv2.resize(frame[:, x0:x1], (retina.ncols, retina.nrows),
+                       interpolation=interpolation))
+    for frames of shape `src_shape`. With bgr=True the frame is read in
+    OpenCV's BGR order, so the colour conversion can be skipped too.
+
+    Parameters:
+        retina: flygym Retina providing the ommatidia map and pale mask.
+        src_shape: (H, W) or (H, W, 3) of the frames to sample.
+        columns: (x0, x1) column range used as the eye image; whole frame
+            by default.
+        interpolation: cv2.INTER_NEAREST or cv2.INTER_LINEAR.
+        bgr: Frames are BGR instead of RGB.
+    """
+    def __init__(self, retina, src_shape, columns: Optional[Tuple[int, int]] = None,
+                 interpolation: int = cv2.INTER_LINEAR, bgr: bool = False):
+        height, width = src_shape[:2]
+        x0, x1 = columns if columns is not None else (0, width)
+        self.src_shape = (height, width)
+        self.columns = (x0, x1)
+        self.interpolation = interpolation
+        self.bgr = bgr
+        self.num_ommatidia = retina.num_ommatidia_per_eye
+        self.pale_type_mask = np.asarray(retina.pale_type_mask, dtype=np.int64)
+
+        # Retina pixels inside the hex lattice and their ommatidium
+        id_map = retina.ommatidia_id_map.astype(np.int64)
+        rows, cols = np.nonzero(id_map)
+        ommatidium = id_map[rows, cols] - 1
+        # raw_image_to_hex_pxls reads RGB channel 1 (G) for yellow and 2 (B)
+        # for pale ommatidia
+        channel = self.pale_type_mask[ommatidium] + 1
+        if bgr:
+            channel = 2 - channel
+
+        row_src, row_w = _resize_taps(height, retina.nrows, interpolation)
+        col_src, col_w = _resize_taps(x1 - x0, retina.ncols, interpolation)
+        # Every retina pixel expands to taps_y * taps_x source pixels
+        src_row = row_src[rows][:, :, None]
+        src_col = col_src[cols][:, None, :] + x0
+        weight = row_w[rows][:, :, None] * col_w[cols][:, None, :]
+        counts = np.bincount(ommatidium, minlength=self.num_ommatidia)
+        weight = weight / (255.0 * counts[ommatidium][:, None, None])
+        flat = (src_row * width + src_col) * 3 + channel[:, None, None]
+
+        terms_per_px = weight[0].size
+        term_omm = np.repeat(ommatidium, terms_per_px)
+        term_src = flat.reshape(-1)
+        term_w = weight.reshape(-1)
+        keep = term_w != 0
+        term_omm, term_src, term_w = term_omm[keep], term_src[keep], term_w[keep]
+
+        # Columns are only the source elements that are read, in memory
+        # order so the gather walks the frame forwards; repeated
+        # (ommatidium, element) terms are summed by the CSR conversion
+        self.src_index, column = np.unique(term_src, return_inverse=True)
+        self.matrix = scipy.sparse.csr_matrix(
+            (term_w, (term_omm, column.reshape(-1))),
+            shape=(self.num_ommatidia, self.src_index.size)).astype(np.float32)
+
+        self._out_index = np.arange(self.num_ommatidia) * 2 + self.pale_type_mask
+
+    def to_arrays(self) -> dict:
+        """The sampler as plain arrays (see from_arrays)."""
+        matrix = self.matrix
+        return {"src_shape": np.asarray(self.src_shape), "columns": np.asarray(self.columns),
+                "interpolation": np.asarray(self.interpolation), "bgr": np.asarray(self.bgr),
+                "pale_type_mask": self.pale_type_mask, "src_index": self.src_index,
+                "data": matrix.data, "indices": matrix.indices, "indptr": matrix.indptr}
+
+    @classmethod
+    def from_arrays(cls, arrays: dict) -> "RetinaSampler":
+        """Rebuilds a sampler saved with to_arrays without recomputing it."""
+        sampler = cls.__new__(cls)
+        sampler.src_shape = tuple(int(v) for v in arrays["src_shape"])
+        sampler.columns = tuple(int(v) for v in arrays["columns"])
+        sampler.interpolation = int(arrays["interpolation"])
+        sampler.bgr = bool(arrays["bgr"])
+        sampler.pale_type_mask = np.asarray(arrays["pale_type_mask"], dtype=np.int64)
+        sampler.num_ommatidia = sampler.pale_type_mask.size
+        sampler.src_index = np.asarray(arrays["src_index"])
+        sampler.matrix = scipy.sparse.csr_matrix(
+            (arrays["data"], arrays["indices"], arrays["indptr"]),
+            shape=(sampler.num_ommatidia, sampler.src_index.size))
+        sampler._out_index = np.arange(sampler.num_ommatidia) * 2 + sampler.pale_type_mask
+        return sampler
+
+    @property
+    def num_terms(self) -> int:
+        return self.matrix.nnz
+
+    def gather(self, frame: np.ndarray) -> np.ndarray:
+        """The float32 source values the operator reads from `frame`."""
+        if frame.shape[:2] != self.src_shape:
+            raise ValueError(f"Sampler built for {self.src_shape}, got {frame.shape[:2]}")
+        return frame.reshape(-1)[self.src_index].astype(np.float32)
+
+    def apply(self, gathered: np.ndarray) -> np.ndarray:
+        """
+        (..., N, 2) readings from `gather` output, one frame (n,) or a
+        batch (B, n) at once.
+        """
+        gathered = np.asarray(gathered)
+        values = (self.matrix @ gathered.reshape(-1, gathered.shape[-1]).T).T
+        out = np.zeros((values.shape[0], self.num_ommatidia * 2), dtype=values.dtype)
+        out[:, self._out_index] = values
+        return out.reshape(*gathered.shape[:-1], self.num_ommatidia, 2)
+
+    def intensities(self, frame: np.ndarray) -> np.ndarray:
+        """(N,) reading of each ommatidium in its own channel."""
+        return self.matrix @ self.gather(frame)
+
+    def __call__(self, frame: np.ndarray) -> np.ndarray:
+        """(N, 2) reading like Retina.raw_image_to_hex_pxls (the channel an
+        ommatidium does not use is 0)."""
+        out = np.zeros(self.num_ommatidia * 2)
+        out[self._out_index] = self.intensities(frame)
+        return out.reshape(self.num_ommatidia, 2)
+
+
+def eye_samplers(retina, src_shape, interpolation: int = cv2.INTER_LINEAR,
+                 bgr: bool = False) -> Tuple[RetinaSampler, RetinaSampler]:
+    """Samplers for the left and right halves of a frame, split at W // 2
+    like the vision scripts."""
+    width = src_shape[1]
+    mid = width // 2
+    return (RetinaSampler(retina, src_shape, (0, mid), interpolation, bgr),
+            RetinaSampler(retina, src_shape, (mid, width), interpolation, bgr))
+
+
+@lru_cache(maxsize=None)
+def _sample_kernels():
+    """(parallel over frames, serial) Numba kernels. Numba adds ~0.2 s to
+    import, so only BatchRetinaSampler users pay it."""
+    import numba as nb
+
+    def sample_batch(frames, indptr, src, weights, out_index, zero_index, out):
+        # frames (B, L) uint8; CSR rows -> out[:, out_index[row]]. One
+        # frame per thread: the reads of a frame stay within its own
+        # pixels, which keeps this cache-friendly
+        for b in nb.prange(frames.shape[0]):
+            frame = frames[b]
+            for row in range(indptr.size - 1):
+                acc = np.float32(0.0)
+                for k in range(indptr[row], indptr[row + 1]):
+                    acc += weights[k] * np.float32(frame[src[k]])
+                out[b, out_index[row]] = acc
+            for i in range(zero_index.size):
+                out[b, zero_index[i]] = 0.0
+
+    # The serial kernel starts no Numba threads, so it is safe to call
+    # from any thread (e.g. a ThreadPoolExecutor worker)
+    return (nb.njit(parallel=True, nogil=True, cache=True)(sample_batch),
+            nb.njit(nogil=True, cache=True)(sample_batch))
+
+
+class BatchRetinaSampler:
+    """
+    Left/right eye readings of a stack of frames in one call.
+
+    Stacked arrays are sampled by Numba's worker threads; call those from
+    the main thread (Numba's default threading layer can hang at exit
+    when started from another thread). Lists of frames and sample() run
+    on the calling thread.
+
+    Parameters:
+        retina: flygym Retina (or retina_cache.RetinaGeometry).
+        sample_shape: Shape of one sample: (H, W, 3) for whole frames whose
+            left and right halves are the eyes (as eye_samplers), or
+            (2, H, W, 3) for eye images that are already split.
+        interpolation: cv2.INTER_NEAREST or cv2.INTER_LINEAR.
+        bgr: Frames are BGR instead of RGB.
+    """
+    def __init__(self, retina, sample_shape, interpolation: int = cv2.INTER_LINEAR,
+                 bgr: bool = False):
+        sample_shape = tuple(sample_shape)
+        if len(sample_shape) == 4 and sample_shape[0] == 2:
+            samplers = (RetinaSampler(retina, sample_shape[1:], None, interpolation, bgr),)
+        elif len(sample_shape) == 3:
+            samplers = eye_samplers(retina, sample_shape, interpolation, bgr)
+        else:
+            raise ValueError(f"Expected (H, W, 3) or (2, H, W, 3) samples, got {sample_shape}")
+        self._init(samplers, sample_shape)
+
+    @classmethod
+    def from_samplers(cls, samplers) -> "BatchRetinaSampler":
+        """
+        From existing samplers: a (left, right) pair over one frame, or a
+        single sampler applied to both eyes of pre-split samples.
+        """
+        batch = cls.__new__(cls)
+        if len(samplers) == 2:
+            shape = (*samplers[0].src_shape, 3)
+        else:
+            shape = (2, *samplers[0].src_shape, 3)
+        batch._init(tuple(samplers), shape)
+        return batch
+
+    def _init(self, samplers, sample_shape):
+        self.sample_shape = sample_shape
+        self.num_ommatidia = samplers[0].num_ommatidia
+        # One CSR over all rows; each row's terms index the flat sample
+        # (whole frame) or flat eye image (pre-split)
+        matrices = [s.matrix.tocsr() for s in samplers]
+        self._indptr = np.concatenate(
+            [[0]] + [m.indptr[1:] + sum(p.nnz for p in matrices[:i])
+                     for i, m in enumerate(matrices)]).astype(np.int64)
+        src = np.concatenate([s.src_index[m.indices] for s, m in zip(samplers, matrices)])
+        index_type = np.int32 if src.max(initial=0) < 2 ** 31 else np.int64
+        self._src = src.astype(index_type)
+        self._weights = np.concatenate([m.data for m in matrices]).astype(np.float32)
+        self._out_index = np.concatenate(
+            [eye * 2 * self.num_ommatidia + s._out_index
+             for eye, s in enumerate(samplers)]).astype(np.int64)
+        # Output elements no row writes (the channel an ommatidium does not use)
+        unused = np.ones(len(samplers) * 2 * self.num_ommatidia, dtype=bool)
+        unused[self._out_index] = False
+        self._zero_index = np.flatnonzero(unused)
+
+    @property
+    def split(self) -> bool:
+        """Samples are pre-split (2, H, W, 3) eye images."""
+        return len(self.sample_shape) == 4
+
+    def allocate(self, n_frames: int) -> np.ndarray:
+        """Output buffer for `n_frames` frames."""
+        return np.empty((n_frames, 2, self.num_ommatidia, 2), dtype=np.float32)
+
+    def __call__(self, frames: Union[np.ndarray, Sequence[np.ndarray]],
+                 out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        (N, 2, N_omm, 2) float32 readings of N samples, given as one
+        (N, *sample_shape) array or as a sequence of sample arrays (read
+        in place, never stacked), written into `out` if given
+        (C-contiguous float32 of that shape).
+        """
+        n_frames = len(frames)
+        if out is None:
+            out = self.allocate(n_frames)
+        elif (out.shape != (n_frames, 2, self.num_ommatidia, 2) or out.dtype != np.float32
+              or not out.flags.c_contiguous):
+            raise ValueError("out must be a C-contiguous float32 (N, 2, N_omm, 2) array")
+        parallel, serial = _sample_kernels()
+        if isinstance(frames, np.ndarray):
+            self._sample(parallel, frames, out)
+        else:
+            for i, frame in enumerate(frames):
+                self._sample(serial, frame[None], out[i:i + 1])
+        return out
+
+    def sample(self, frame: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        (2, N_omm, 2) readings of one sample, without starting Numba's
+        worker threads (safe to call from any thread).
+        """
+        if out is None:
+            out = self.allocate(1)[0]
+        self._sample(_sample_kernels()[1], frame[None], out[None])
+        return out
+
+    def _sample(self, kernel, frames: np.ndarray, out: np.ndarray):
+        if tuple(frames.shape[1:]) != self.sample_shape:
+            raise ValueError(f"Sampler built for (N, *{self.sample_shape}), got {frames.shape}")
+        rows = 2 * frames.shape[0] if self.split else frames.shape[0]
+        kernel(np.ascontiguousarray(frames).reshape(rows, -1), self._indptr, self._src,
+               self._weights, self._out_index, self._zero_index, out.reshape(rows, -1))
+
+
+# -------------------- Check & Benchmark ----------------------
+def main():
+    from flygym.vision.retina import Retina
+
+    parser = argparse.ArgumentParser(
+        description="Agreement and speed of RetinaSampler vs resize + raw_image_to_hex_pxls.")
+    parser.add_argument("--image", default="test2.jpg")
+    parser.add_argument("--repeats", type=int, default=50)
+    args = parser.parse_args()
+
+    raw_bgr = cv2.imread(args.image)
+    if raw_bgr is None:
+        raise FileNotFoundError(f"Error: Image file '{args.image}' not found.")
+    raw_image = cv2.cvtColor(raw_bgr, cv2.COLOR_BGR2RGB)
+    retina = Retina()
+    target_size = (retina.ncols, retina.nrows)
+    mid = raw_image.shape[1] // 2
+
+    def reference(interpolation):
+        return [retina.raw_image_to_hex_pxls(np.ascontiguousarray(
+                    cv2.resize(half, target_size, interpolation=interpolation)))
+                for half in (raw_image[:, :mid], raw_image[:, mid:])]
+
+    def timed(fn):
+        fn()
+        start = time.perf_counter()
+        for _ in range(args.repeats):
+            fn()
+        return (time.perf_counter() - start) / args.repeats * 1e3
+
+    for name, interpolation in (("nearest", cv2.INTER_NEAREST), ("linear", cv2.INTER_LINEAR)):
+        start = time.perf_counter()
+        samplers = eye_samplers(retina, raw_image.shape, interpolation)
+        build = time.perf_counter() - start
+        error = max(np.abs(s(raw_image) - ref).max()
+                    for s, ref in zip(samplers, reference(interpolation)))
+        old = timed(lambda: reference(interpolation))
+        new = timed(lambda: [s(raw_image) for s in samplers])
+        print(f"{name:>8}: max |diff| {error:.2e}, resize path {old:.2f} ms, "
+              f"sampler {new:.2f} ms ({old / new:.1f}x), build {build:.2f} s, "
+              f"{samplers[0].num_terms} terms/eye")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Reduced JPEG decoding must keep the retina reading of a full decode."""
+
+import struct
+import sys
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pytest
+
+HERE = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(HERE))
+
+from jpeg_decode import decode_for_retina, jpeg_size, reduction_factor  # noqa: E402
+from retina_sampling import eye_samplers  # noqa: E402
+
+Retina = pytest.importorskip("flygym.vision.retina").Retina
+
+
+@pytest.fixture(scope="module")
+def retina():
+    return Retina()
+
+
+@pytest.fixture(scope="module")
+def jpeg():
+    # A smooth scene at a high-res camera size, wider than tall
+    y, x = np.mgrid[0:2000, 0:2400].astype(np.float32)
+    image = np.stack([127 + 120 * np.sin(x / 97 + y / 151),
+                      127 + 120 * np.cos(x / 211 - y / 83),
+                      (x + y) * 255 / 4400], axis=-1).astype(np.uint8)
+    return cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 95])[1].tobytes()
+
+
+def _with_orientation(data: bytes, orientation: int) -> bytes:
+    """`data` with an APP1 Exif segment holding only the orientation tag."""
+    tiff = (b"MM" + struct.pack(">HI", 42, 8) + struct.pack(">H", 1)
+            + struct.pack(">HHIHH", 0x0112, 3, 1, orientation, 0) + struct.pack(">I", 0))
+    body = b"Exif\0\0" + tiff
+    return data[:2] + b"\xff\xe1" + struct.pack(">H", len(body) + 2) + body + data[2:]
+
+
+def _reading(retina, frame):
+    return np.stack([s(frame) for s in eye_samplers(retina, frame.shape, bgr=True)])
+
+
+@pytest.mark.parametrize("orientation", [1, 6, 8])
+def test_jpeg_size_matches_decoded_shape(jpeg, orientation):
+    data = _with_orientation(jpeg, orientation)
+    full = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    assert jpeg_size(data) == full.shape[:2]
+
+
+def test_jpeg_size_rejects_other_formats():
+    png = cv2.imencode(".png", np.zeros((4, 4, 3), np.uint8))[1].tobytes()
+    assert jpeg_size(png) is None
+
+
+@pytest.mark.parametrize("orientation", [1, 6])
+def test_reduced_decode_matches_full_decode(retina, jpeg, orientation):
+    data = _with_orientation(jpeg, orientation)
+    full = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    reduced = decode_for_retina(data, retina)
+
+    factor = reduction_factor(full.shape[:2], retina)
+    assert factor > 1
+    assert reduced.shape == (-(-full.shape[0] // factor), -(-full.shape[1] // factor), 3)
+    assert reduced.shape[0] >= retina.nrows and reduced.shape[1] // 2 >= retina.ncols
+
+    diff = np.abs(_reading(retina, full) - _reading(retina, reduced))
+    assert diff.mean() < 1e-3
+    assert diff.max() < 5e-3
@@ -0,0 +1,87 @@
+"""Windowed replay and the memory-mapped dataset cache."""
+
+import os
+import pickle
+import sys
+from pathlib import Path
+
+import numpy as np
+
+HERE = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(HERE))
+
+from kinematic_replay import (BehaviorDataset, KinematicReplay,  # noqa: E402
+                              RecordedKinematics, load_dataset, load_recording)
+
+
+def _recording(num_samples=250, timestep=1e-3):
+    t = np.arange(num_samples) * timestep
+    angles = np.stack([np.sin(2 * np.pi * 3 * t), np.cos(2 * np.pi * 5 * t), t ** 2])
+    return angles.astype(np.float32), timestep
+
+
+def test_replay_matches_np_interp():
+    angles, timestep = _recording()
+    rows = np.array([2, 0])
+    source = RecordedKinematics(angles, rows, timestep, ("c", "a"))
+    replay = KinematicReplay(source, timestep=1e-4, window=64)
+
+    # Past the end of the recording, like np.interp
+    steps = np.arange(0, 2600, 7)
+    expected = np.stack([np.interp(steps * 1e-4, np.arange(angles.shape[1]) * timestep,
+                                   angles[row]) for row in rows], axis=1)
+    actual = np.stack([replay[step] for step in steps])
+    np.testing.assert_allclose(actual, expected, atol=1e-6)
+
+
+def test_replay_values_survive_window_moves():
+    angles, timestep = _recording()
+    source = RecordedKinematics(angles, np.arange(3), timestep, ("a", "b", "c"))
+    replay = KinematicReplay(source, timestep=1e-4, window=16)
+    first = replay[5]
+    expected = first.copy()
+    replay[100]
+    np.testing.assert_array_equal(first, expected)
+
+
+def _write_pickle(path: Path, scale: float = 1.0):
+    angles, timestep = _recording()
+    recording = {"joint_a": angles[0] * scale, "joint_b": list(angles[1] * scale),
+                 "meta": {"timestep": timestep, "source": "test"},
+                 "fly_id": 3, "notes": object()}
+    with open(path, "wb") as f:
+        pickle.dump(recording, f)
+    return recording
+
+
+def test_dataset_round_trip(tmp_path):
+    recording = _write_pickle(tmp_path / "walk.pkl")
+    dataset = load_dataset(tmp_path / "walk.pkl", tmp_path / "cache")
+
+    assert dataset.joints == ("joint_a", "joint_b")
+    assert dataset.meta == recording["meta"]
+    assert dataset.timestep == recording["meta"]["timestep"]
+    assert dataset.extra == {"fly_id": 3}        # not JSON serializable: dropped
+    assert isinstance(dataset.angles, np.memmap) and not dataset.angles.flags.writeable
+    np.testing.assert_allclose(dataset["joint_a"], recording["joint_a"], rtol=1e-6)
+    np.testing.assert_allclose(dataset["joint_b"], recording["joint_b"], rtol=1e-6)
+
+    # Reopened from disk, and selected in a different order
+    reopened = BehaviorDataset(dataset.directory)
+    np.testing.assert_array_equal(reopened.angles, dataset.angles)
+    source = load_recording(tmp_path / "walk.pkl", ["joint_b", "joint_a"], tmp_path / "cache")
+    np.testing.assert_array_equal(source.angles[source.rows], dataset.angles[::-1])
+
+
+def test_changed_pickle_is_converted_again(tmp_path):
+    path = tmp_path / "walk.pkl"
+    _write_pickle(path)
+    before = load_dataset(path, tmp_path / "cache")
+    assert load_dataset(path, tmp_path / "cache") is before
+
+    recording = _write_pickle(path, scale=2.0)
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    after = load_dataset(path, tmp_path / "cache")
+    assert after.directory != before.directory
+    np.testing.assert_allclose(after["joint_a"], recording["joint_a"], rtol=1e-6)
@@ -0,0 +1,69 @@
+"""QueueWorker hands items to its thread in order and surfaces failures."""
+
+import sys
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+import pytest
+
+HERE = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(HERE))
+
+from queue_worker import QueueWorker  # noqa: E402
+
+
+class Collector(QueueWorker):
+    failure_message = "Collector failed"
+
+    def __init__(self, max_queue=2, fail_on=None):
+        self.items, self.fail_on = [], fail_on
+        self.session_thread, self.closed_session = None, False
+        super().__init__(max_queue)
+
+    @contextmanager
+    def _session(self):
+        self.session_thread = threading.current_thread()
+        try:
+            yield self._handle
+        finally:
+            self.closed_session = True
+
+    def _handle(self, item):
+        if item == self.fail_on:
+            raise ValueError(item)
+        self.items.append(item)
+
+
+def test_items_are_handled_in_order_on_the_worker():
+    with Collector() as worker:
+        for item in range(50):
+            worker._submit(item)
+    assert worker.items == list(range(50))
+    assert worker.session_thread is not threading.current_thread()
+    assert worker.closed_session
+    with pytest.raises(ValueError):
+        worker._submit(0)
+
+
+def test_failure_reaches_the_producer():
+    worker = Collector(fail_on=3)
+    with pytest.raises(RuntimeError, match="Collector failed") as info:
+        for item in range(1000):      # a full queue must not block forever
+            worker._submit(item)
+        worker.close()
+    assert isinstance(info.value.__cause__, ValueError)
+    assert worker.items == [0, 1, 2]
+    assert worker.closed_session
+
+
+def test_exit_keeps_the_exception_from_the_block():
+    with pytest.raises(KeyError):
+        with Collector(fail_on=0) as worker:
+            worker._submit(0)
+            raise KeyError("inside")
+
+
+def test_base_class_is_abstract():
+    with pytest.raises(TypeError):
+        QueueWorker(1)
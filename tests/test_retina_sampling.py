@@ -0,0 +1,53 @@
+"""RetinaSampler must match resize + Retina.raw_image_to_hex_pxls."""
+
+import sys
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pytest
+
+HERE = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(HERE))
+
+from retina_sampling import RetinaSampler, eye_samplers  # noqa: E402
+
+Retina = pytest.importorskip("flygym.vision.retina").Retina
+
+
+@pytest.fixture(scope="module")
+def retina():
+    return Retina()
+
+
+@pytest.fixture(scope="module")
+def frame():
+    # Smooth gradients plus noise, so both interpolations see real structure
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:240, 0:360]
+    base = np.stack([x * 255 / 359, y * 255 / 239, (x + y) * 255 / 598], axis=-1)
+    noise = rng.integers(-40, 41, size=base.shape)
+    return np.clip(base + noise, 0, 255).astype(np.uint8)
+
+
+def _reference(retina, image, interpolation):
+    resized = cv2.resize(image, (retina.ncols, retina.nrows), interpolation=interpolation)
+    return retina.raw_image_to_hex_pxls(np.ascontiguousarray(resized))
+
+
+@pytest.mark.parametrize("interpolation, atol", [(cv2.INTER_NEAREST, 1e-5),
+                                                 (cv2.INTER_LINEAR, 2e-3)])
+def test_eye_samplers_match_resize_path(retina, frame, interpolation, atol):
+    mid = frame.shape[1] // 2
+    left, right = eye_samplers(retina, frame.shape, interpolation)
+    np.testing.assert_allclose(left(frame), _reference(retina, frame[:, :mid], interpolation),
+                               atol=atol)
+    np.testing.assert_allclose(right(frame), _reference(retina, frame[:, mid:], interpolation),
+                               atol=atol)
+
+
+def test_bgr_sampler_skips_colour_conversion(retina, frame):
+    sampler = RetinaSampler(retina, frame.shape, interpolation=cv2.INTER_NEAREST, bgr=True)
+    bgr = np.ascontiguousarray(frame[:, :, ::-1])
+    np.testing.assert_allclose(sampler(bgr), _reference(retina, frame, cv2.INTER_NEAREST),
+                               atol=1e-5)
@@ -0,0 +1,66 @@
+"""BrightnessOperator must match sampling the eyes and reducing the readings."""
+
+import sys
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pytest
+
+HERE = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(HERE))
+
+from retina_sampling import eye_samplers  # noqa: E402
+from vision_brightness import (BrightnessOperator, RetinaRegions,  # noqa: E402
+                               eye_brightness_features)
+
+Retina = pytest.importorskip("flygym.vision.retina").Retina
+
+
+@pytest.fixture(scope="module")
+def retina():
+    return Retina()
+
+
+@pytest.fixture(scope="module")
+def frame():
+    # Brighter on the left, so the two eyes differ
+    rng = np.random.default_rng(1)
+    y, x = np.mgrid[0:300, 0:480]
+    base = np.stack([255 - x * 200 / 479, y * 255 / 299, 255 - x * 120 / 479], axis=-1)
+    return np.clip(base + rng.integers(-30, 31, size=base.shape), 0, 255).astype(np.uint8)
+
+
+def _readings(retina, frame, interpolation):
+    return np.stack([s(frame) for s in eye_samplers(retina, frame.shape, interpolation,
+                                                    bgr=True)])
+
+
+@pytest.mark.parametrize("interpolation", [cv2.INTER_NEAREST, cv2.INTER_LINEAR])
+def test_operator_matches_sampled_sum(retina, frame, interpolation):
+    operator = BrightnessOperator(retina, frame.shape, eye_brightness_features(retina, channel=1),
+                                  interpolation, bgr=True)
+    expected = _readings(retina, frame, interpolation)[:, :, 1].sum(axis=1)
+    np.testing.assert_allclose(operator(frame), expected, rtol=1e-5)
+
+
+def test_operator_regions_and_step(retina, frame):
+    features = eye_brightness_features(retina, RetinaRegions.hemifields(retina), mean=True)
+    operator = BrightnessOperator(retina, frame.shape, features, cv2.INTER_NEAREST,
+                                  bgr=True, step=2)
+    readings = _readings(retina, np.ascontiguousarray(frame[::2, ::2]), cv2.INTER_NEAREST)
+    expected = [np.sum(features[name] * readings) for name in operator.names]
+
+    values, reading = operator.with_reading(frame)
+    np.testing.assert_allclose(operator(frame), expected, rtol=1e-5)
+    np.testing.assert_allclose(values, expected, rtol=1e-5)
+    np.testing.assert_allclose(reading, readings, atol=1e-6)
+
+
+def test_human_readable_sum_matches_rendering(retina, frame):
+    regions = RetinaRegions.hemifields(retina)
+    reading = _readings(retina, frame, cv2.INTER_NEAREST)[0]
+    image = retina.hex_pxls_to_human_readable(reading, color_8bit=True).max(axis=-1)
+    half = image.shape[1] // 2
+    expected = [image[:, :half].astype(np.int64).sum(), image[:, half:].astype(np.int64).sum()]
+    np.testing.assert_array_equal(regions.human_readable_sum(reading), expected)
@@ -0,0 +1,135 @@
+"""
+video_recorder.py
+
+Bounded-memory streaming video writer for simulation renders.
+
+The simulation scripts used to keep every rendered frame in memory
+(a Python list, or Camera._frames) and encode the whole video at the
+end, so memory grew with the length of the run. VideoRecorder encodes
+frames as they are produced: append() puts a frame on a bounded queue
+and a background thread feeds it to imageio's ffmpeg writer. When the
+encoder falls behind, append() blocks instead of buffering more, so at
+most `max_queue` frames are held no matter how long the episode is.
+The last frame is kept for PNG snapshots. The queue and worker thread
+come from queue_worker.QueueWorker.
+
+For FlyGym simulations, StreamingCamera replaces Camera and
+drain_camera() moves the frames it rendered into the recorder (after
+each sim.render()), replacing Camera.save_video(). Camera decides
+whether a frame is due from len(Camera._frames). StreamingCamera counts
+its frames itself, so drain_camera() can empty _frames and the
+decimation keeps working.
+
+Usage:
+    cam = StreamingCamera(attachment_point=fly.model.worldbody, camera_name="camera_left")
+    with VideoRecorder("outputs/run.mp4", fps=30) as recorder:
+        for _ in range(num_steps):
+            sim.step(action)
+            sim.render()
+            drain_camera(cam, recorder)
+        recorder.save_snapshot("outputs/run_last.png")
+"""
+
+from contextlib import contextmanager
+from pathlib import Path
+
+import imageio
+import numpy as np
+from flygym import Camera
+
+from queue_worker import QueueWorker
+
+class VideoRecorder(QueueWorker):
+    """
+    Streams (H, W, 3) uint8 frames to a video file on a background
+    thread.
+
+    Parameters:
+        path: Output video path (format from the suffix, e.g. .mp4).
+        fps: Frame rate of the video.
+        max_queue: Frames that may wait for the encoder before append()
+            blocks.
+        copy: Copy frames on append. Needed only if the caller reuses
+            the frame buffer (physics.render() and Camera return new
+            arrays).
+        writer_kwargs: Passed to imageio.get_writer (codec, quality, ...).
+    """
+    def __init__(self, path, fps: float = 30, max_queue: int = 8, copy: bool = False,
+                 **writer_kwargs):
+        self.path = Path(path)
+        self.fps = fps
+        self.copy = copy
+        self.frames_written = 0
+        self.last_frame = None
+        self._writer_kwargs = writer_kwargs
+        self.failure_message = f"Video encoding to {self.path} failed"
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        super().__init__(max_queue)
+
+    @contextmanager
+    def _session(self):
+        with imageio.get_writer(self.path, fps=self.fps, **self._writer_kwargs) as writer:
+            def write(frame):
+                writer.append_data(frame)
+                self.frames_written += 1
+            yield write
+
+    def append(self, frame: np.ndarray):
+        """Queues a frame, blocking while `max_queue` frames are pending."""
+        frame = np.array(frame, copy=True) if self.copy else np.asarray(frame)
+        self._submit(frame)
+        self.last_frame = frame
+
+    def save_snapshot(self, path):
+        """Writes the last appended frame as an image (e.g. PNG)."""
+        if self.last_frame is None:
+            raise ValueError("No frames have been recorded yet")
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        imageio.imwrite(path, self.last_frame)
+
+
+class StreamingCamera(Camera):
+    """
+    FlyGym Camera for drain_camera(). It keeps its own count of rendered
+    frames for the frame timing, so _frames only holds the frames not
+    drained yet, and it keeps the latest frame as `last_frame` (for
+    snapshots). Frames go to a VideoRecorder, so `output_path` is not
+    supported.
+    """
+    def __init__(self, *args, output_path=None, **kwargs):
+        if output_path is not None:
+            raise ValueError("StreamingCamera streams to a VideoRecorder; "
+                             "output_path is not supported")
+        super().__init__(*args, **kwargs)
+        self.frames_rendered = 0
+        self.last_frame = None
+
+    def render(self, physics, floor_height, curr_time, last_obs=None):
+        if curr_time < self.frames_rendered * self._eff_render_interval:
+            return None
+        image = super().render(physics, floor_height, curr_time, last_obs)
+        if image is not None:
+            self.frames_rendered += 1
+            self.last_frame = image
+        return image
+
+    def reset(self):
+        super().reset()
+        self.frames_rendered = 0
+
+
+def drain_camera(cam: StreamingCamera, recorder: VideoRecorder,
+                 stabilization_time: float = 0.02):
+    """
+    Moves the frames `cam` has rendered since the last call into
+    `recorder`, skipping those before `stabilization_time` like
+    Camera.save_video().
+    """
+    if not isinstance(cam, StreamingCamera):
+        raise TypeError("drain_camera needs a StreamingCamera: a plain Camera "
+                        "counts len(_frames) to decide when to render")
+    for frame, timestamp in zip(cam._frames, cam._timestamp_per_frame):
+        if timestamp >= stabilization_time:
+            recorder.append(frame)
+    cam._frames.clear()
+    cam._timestamp_per_frame.clear()
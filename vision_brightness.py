@@ -0,0 +1,303 @@
+"""
+vision_brightness.py
+
+Region brightness and steering straight from ommatidia readings.
+
+The vision scripts rasterize every (721, 2) reading with
+Retina.hex_pxls_to_human_readable and sum halves of that image just to
+get a left and a right brightness. Such a sum only depends on how many
+pixels of each ommatidium fall into the region, so per Retina geometry
+each region becomes one weight vector over the ommatidia (plus a
+constant for the background pixels), and a brightness is a dot product.
+Rendering is then only needed for plots.
+
+The retina itself is linear in the frame too (see retina_sampling), so
+for a fixed frame size BrightnessOperator folds sampling and the region
+weights into one weight per source pixel: a frame's brightness features
+are a single gather and a small dense reduction, and the (721, 2)
+readings are only computed when asked for.
+
+Usage:
+    halves = RetinaRegions.hemifields(retina)
+    left, right = halves.brightness(fly_vision)            # mean intensity
+    movement = movement_from_brightness(left, right)
+
+    operator = BrightnessOperator(retina, frame.shape, eye_brightness_features(retina))
+    left, right = operator(frame)                          # no retina pass
+
+Check and benchmark against the sampler path:
+    python vision_brightness.py --image test2.jpg
+"""
+
+import argparse
+import time
+from typing import Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+import scipy.sparse
+
+from retina_sampling import eye_samplers
+
+
+class RetinaRegions:
+    """
+    Ommatidium weights of named pixel regions of the retina image.
+
+    Parameters:
+        retina: flygym Retina (only its ommatidia_id_map is used).
+        masks: Region name -> boolean (nrows, ncols) mask over the image
+            produced by hex_pxls_to_human_readable.
+    """
+    def __init__(self, retina, masks: Dict[str, np.ndarray]):
+        id_map = np.asarray(retina.ommatidia_id_map, dtype=np.int64)
+        num_ommatidia = retina.num_ommatidia_per_eye
+        self.names = tuple(masks)
+        counts = np.stack([np.bincount(id_map[np.asarray(masks[name], dtype=bool)],
+                                       minlength=num_ommatidia + 1)
+                           for name in self.names])
+        # Pixels per ommatidium in each region; column 0 is the background
+        self.pixel_counts = counts[:, 1:]
+        self.weights = self.pixel_counts.astype(np.float64)
+        self.background_pixels = counts[:, 0]
+        self._mean_weights = self.weights / np.maximum(
+            self.weights.sum(axis=1, keepdims=True), 1)
+
+    @classmethod
+    def whole(cls, retina) -> "RetinaRegions":
+        """One region "all" covering the whole image."""
+        return cls(retina, {"all": np.ones(retina.ommatidia_id_map.shape, dtype=bool)})
+
+    @classmethod
+    def hemifields(cls, retina) -> "RetinaRegions":
+        """"left" and "right" halves of the image, split at ncols // 2."""
+        cols = np.arange(retina.ommatidia_id_map.shape[1])
+        left = np.broadcast_to(cols < retina.ommatidia_id_map.shape[1] // 2,
+                               retina.ommatidia_id_map.shape)
+        return cls(retina, {"left": left, "right": ~left})
+
+    @classmethod
+    def grid(cls, retina, n_rows: int, n_cols: int) -> "RetinaRegions":
+        """An n_rows x n_cols grid of regions named "r<i>c<j>"."""
+        height, width = retina.ommatidia_id_map.shape
+        row_bin = np.arange(height) * n_rows // height
+        col_bin = np.arange(width) * n_cols // width
+        return cls(retina, {f"r{i}c{j}": (row_bin[:, None] == i) & (col_bin[None, :] == j)
+                            for i in range(n_rows) for j in range(n_cols)})
+
+    def brightness(self, reading: np.ndarray, mean: bool = True) -> np.ndarray:
+        """
+        (..., R) brightness of each region from (..., N, 2) readings: the
+        pixel-weighted mean (or sum, if mean is False) of each
+        ommatidium's intensity.
+        """
+        weights = self._mean_weights if mean else self.weights
+        return np.asarray(reading).max(axis=-1) @ weights.T
+
+    def human_readable_sum(self, reading: np.ndarray) -> np.ndarray:
+        """
+        (..., R) sums equal to rendering `reading` with
+        hex_pxls_to_human_readable(color_8bit=True), taking .max(axis=-1)
+        and summing each region (background pixels count as 255).
+        """
+        levels = (np.asarray(reading) * 255).astype(np.uint8).max(axis=-1)
+        return levels.astype(np.int64) @ self.pixel_counts.T + 255 * self.background_pixels
+
+
+def movement_from_brightness(left: float, right: float) -> Tuple[int, int, int]:
+    """Turn toward the brighter side, forward if balanced."""
+    if left > right:
+        return (-1, 0, 0)  # Move left
+    if right > left:
+        return (1, 0, 0)   # Move right
+    return (0, 1, 0)       # Move forward if balanced
+
+
+def steering_from_brightness(left: float, right: float, threshold: float = 0.1,
+                             base_forward: float = 1.0, turning_scale: float = 5.0,
+                             max_turn: float = 2.0) -> Tuple[float, float, int]:
+    """
+    Proportional steering: turn away from the brighter side by
+    turning_scale times the normalized brightness difference (clipped to
+    max_turn), straight ahead while it stays under threshold.
+    """
+    avg_brightness = (left + right) / 2.0
+    diff_ratio = (left - right) / avg_brightness if avg_brightness > 0 else 0
+    if abs(diff_ratio) < threshold:
+        return (0, base_forward, 0)
+    turning = float(np.clip(-turning_scale * diff_ratio, -max_turn, max_turn))
+    return (turning, base_forward, 0)
+
+
+# -------------------- Frame -> brightness operator ----------------------
+def eye_brightness_features(retina, regions: Optional[RetinaRegions] = None,
+                            channel: Optional[int] = None,
+                            mean: bool = False) -> Dict[str, np.ndarray]:
+    """
+    Feature weights over the (2, N, 2) left/right eye readings: one
+    feature per eye ("left", "right") or, with `regions`, per eye and
+    region ("left_<region>", ...).
+
+    Parameters:
+        retina: flygym Retina.
+        regions: Regions of each eye image; the whole eye by default.
+        channel: Only read this reading channel (0 yellow, 1 pale), like
+            fly_vision[:, 1]; each ommatidium's own channel by default.
+        mean: Pixel-weighted mean instead of sum. Without `regions` and
+            with mean=False every ommatidium counts once, like
+            np.sum(fly_vision).
+    """
+    num_ommatidia = retina.num_ommatidia_per_eye
+    if regions is None:
+        region_weights = {"": np.ones(num_ommatidia)}
+        if mean:
+            region_weights[""] = RetinaRegions.whole(retina)._mean_weights[0]
+    else:
+        weights = regions._mean_weights if mean else regions.weights
+        region_weights = {f"_{name}": w for name, w in zip(regions.names, weights)}
+
+    features = {}
+    for eye, eye_name in enumerate(("left", "right")):
+        for suffix, weights in region_weights.items():
+            feature = np.zeros((2, num_ommatidia, 2))
+            if channel is None:
+                feature[eye, :, 0] = feature[eye, :, 1] = weights
+            else:
+                feature[eye, :, channel] = weights
+            features[eye_name + suffix] = feature
+    return features
+
+
+class BrightnessOperator:
+    """
+    Precomputed linear map from a raw (H, W, 3) frame to brightness
+    features of its left and right halves, with the retina sampling
+    (eye_samplers) folded in.
+
+    Parameters:
+        retina: flygym Retina.
+        src_shape: (H, W) or (H, W, 3) of the frames.
+        features: Name -> (2, N, 2) weights over the left/right readings,
+            e.g. from eye_brightness_features.
+        interpolation: cv2.INTER_NEAREST or cv2.INTER_LINEAR.
+        bgr: Frames are BGR instead of RGB.
+        step: Only read every step-th row and column, as if the frame
+            were downsampled with frame[::step, ::step] (without the copy).
+    """
+    def __init__(self, retina, src_shape, features: Dict[str, np.ndarray],
+                 interpolation: int = cv2.INTER_LINEAR, bgr: bool = False,
+                 step: int = 1):
+        height, width = src_shape[:2]
+        self.src_shape = (height, width)
+        self.names = tuple(features)
+        self.num_ommatidia = retina.num_ommatidia_per_eye
+        small_width = -(-width // step)
+        samplers = eye_samplers(retina, (-(-height // step), small_width),
+                                interpolation, bgr)
+
+        # Source elements of both eyes, as flat indices into the full frame
+        row, rest = np.divmod(np.concatenate([s.src_index for s in samplers]),
+                              small_width * 3)
+        col, chan = np.divmod(rest, 3)
+        full_index = (row * step * width + col * step) * 3 + chan
+        src_index, column = np.unique(full_index, return_inverse=True)
+        column = column.reshape(-1)
+        blocks, offset = [], 0
+        for sampler in samplers:
+            n_used = sampler.src_index.size
+            matrix = sampler.matrix.tocoo()
+            blocks.append(scipy.sparse.csr_matrix(
+                (matrix.data, (matrix.row, column[offset:offset + n_used][matrix.col])),
+                shape=(self.num_ommatidia, src_index.size)))
+            offset += n_used
+        # (2N, n_used): each eye's ommatidium intensity
+        matrix = scipy.sparse.vstack(blocks).tocsr()
+
+        # Feature weights on each ommatidium's own channel, (F, 2N)
+        pale = np.asarray(retina.pale_type_mask, dtype=np.int64)
+        stacked = np.stack([features[name] for name in self.names])
+        self._omm_weights = stacked[:, :, np.arange(self.num_ommatidia), pale].reshape(
+            len(self.names), -1).astype(np.float32)
+        weights = np.asarray((matrix.T @ self._omm_weights.T).T, dtype=np.float32)
+
+        # Features alone only read the elements with a nonzero weight
+        used = np.any(weights != 0, axis=0)
+        self.src_index = src_index[used]
+        self.weights = np.ascontiguousarray(weights[:, used])
+        self._reading_index = src_index
+        self._reading_matrix = matrix.astype(np.float32)
+        self._out_index = (np.arange(2 * self.num_ommatidia) * 2
+                           + np.tile(pale, 2))
+
+    def _check(self, frame):
+        if frame.shape[:2] != self.src_shape:
+            raise ValueError(f"Operator built for {self.src_shape}, got {frame.shape[:2]}")
+
+    def weight_image(self, name: str) -> np.ndarray:
+        """(H, W, 3) weight of every frame element in feature `name`."""
+        image = np.zeros(self.src_shape[0] * self.src_shape[1] * 3, dtype=np.float32)
+        image[self.src_index] = self.weights[self.names.index(name)]
+        return image.reshape(*self.src_shape, 3)
+
+    def __call__(self, frame: np.ndarray) -> np.ndarray:
+        """(F,) features of one frame."""
+        self._check(frame)
+        return self.weights @ frame.reshape(-1)[self.src_index].astype(np.float32)
+
+    def with_reading(self, frame: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """(F,) features and the (2, N, 2) left/right readings of one frame."""
+        self._check(frame)
+        intensities = self._reading_matrix @ frame.reshape(-1)[self._reading_index].astype(np.float32)
+        reading = np.zeros(4 * self.num_ommatidia, dtype=np.float32)
+        reading[self._out_index] = intensities
+        return (self._omm_weights @ intensities,
+                reading.reshape(2, self.num_ommatidia, 2))
+
+
+# -------------------- Check & Benchmark ----------------------
+def main():
+    from retina_cache import load_retina
+
+    parser = argparse.ArgumentParser(
+        description="Agreement and speed of BrightnessOperator vs eye samplers + sum.")
+    parser.add_argument("--image", default="test2.jpg")
+    parser.add_argument("--interpolation", choices=("linear", "nearest"), default="nearest")
+    parser.add_argument("--step", type=int, default=1)
+    parser.add_argument("--repeats", type=int, default=200)
+    args = parser.parse_args()
+
+    frame = cv2.imread(args.image)
+    if frame is None:
+        raise FileNotFoundError(f"Error: Image file '{args.image}' not found.")
+    retina = load_retina()
+    interpolation = cv2.INTER_LINEAR if args.interpolation == "linear" else cv2.INTER_NEAREST
+
+    start = time.perf_counter()
+    operator = BrightnessOperator(retina, frame.shape, eye_brightness_features(retina, channel=1),
+                                  interpolation, bgr=True, step=args.step)
+    build = time.perf_counter() - start
+    samplers = eye_samplers(retina, frame[::args.step, ::args.step].shape, interpolation, bgr=True)
+
+    def reference():
+        small = frame[::args.step, ::args.step]
+        return np.array([np.sum(s(small)[:, 1]) for s in samplers])
+
+    def timed(fn):
+        fn()
+        start = time.perf_counter()
+        for _ in range(args.repeats):
+            fn()
+        return (time.perf_counter() - start) / args.repeats * 1e3
+
+    expected = reference()
+    error = np.abs(operator(frame) - expected).max() / np.abs(expected).max()
+    old, new = timed(reference), timed(lambda: operator(frame))
+    both = timed(lambda: operator.with_reading(frame))
+    print(f"Left/right brightness {expected}, max relative diff {error:.1e}")
+    print(f"Samplers + sum {old:.3f} ms, operator {new:.3f} ms ({old / new:.1f}x, "
+          f"{operator.src_index.size} elements read), with readings {both:.3f} ms, "
+          f"build {build:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,10 +2,12 @@ import numpy as np
 import matplotlib.pyplot as plt
 import networkx as nx
 from pathlib import Path
-from flygym import Fly, Camera, SingleFlySimulation
+from flygym import Fly, SingleFlySimulation
 from flygym.examples.locomotion import PreprogrammedSteps, RuleBasedController
 from flygym.preprogrammed import all_leg_dofs
 from tqdm import trange
+from render_scheduler import RenderScheduler
+from video_recorder import StreamingCamera, VideoRecorder, drain_camera
 
 # ----- Setup Output Directory -----
 output_dir = Path("./outputs/rule_based_controller")
@@ -77,8 +79,8 @@ fly = Fly(
     enable_adhesion=True,
     draw_adhesion=True,
 )
-# Use the standard Camera with only supported arguments.
-cam = Camera(fly=fly, play_speed=0.1)
+# The standard Camera (only supported arguments), drained into the recorder
+cam = StreamingCamera(fly=fly, play_speed=0.1)
 sim = SingleFlySimulation(
     fly=fly,
     cameras=[cam],
@@ -88,23 +90,29 @@ obs, info = sim.reset()
 
 # ----- Main Simulation Loop -----
 num_steps = int(run_time / sim.timestep)
-for i in trange(num_steps):
-    controller.step()
-    joint_angles = []
-    adhesion_onoff = []
-    for leg, phase in zip(controller.legs, controller.leg_phases):
-        joint_angles_arr = preprogrammed_steps.get_joint_angles(leg, phase)
-        joint_angles.append(joint_angles_arr.flatten())
-        adhesion_onoff.append(preprogrammed_steps.get_adhesion_onoff(leg, phase))
-    action = {
-        "joints": np.concatenate(joint_angles),
-        "adhesion": np.array(adhesion_onoff),
-    }
-    obs, reward, terminated, truncated, info = sim.step(action)
-    sim.render()
-    if terminated or truncated:
-        obs, _ = sim.reset()
+# Frames are encoded while the simulation runs, so memory stays flat
+with VideoRecorder(output_dir / "rule_based_controller.mp4", fps=cam.fps) as recorder:
+    # Render only the steps that become video frames
+    scheduler = RenderScheduler.from_camera(cam)
+    for i in trange(num_steps):
+        controller.step()
+        joint_angles = []
+        adhesion_onoff = []
+        for leg, phase in zip(controller.legs, controller.leg_phases):
+            joint_angles_arr = preprogrammed_steps.get_joint_angles(leg, phase)
+            joint_angles.append(joint_angles_arr.flatten())
+            adhesion_onoff.append(preprogrammed_steps.get_adhesion_onoff(leg, phase))
+        action = {
+            "joints": np.concatenate(joint_angles),
+            "adhesion": np.array(adhesion_onoff),
+        }
+        obs, reward, terminated, truncated, info = sim.step(action)
+        scheduler.render(sim)
+        drain_camera(cam, recorder)
+        if terminated or truncated:
+            obs, _ = sim.reset()
+
 
 # ----- Save the Simulation Video -----
-cam.save_video(output_dir / "rule_based_controller.mp4")
+# (the recorder finished the file when the block exited)
 
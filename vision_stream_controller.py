@@ -0,0 +1,358 @@
+"""
+vision_stream_controller.py
+
+Long-running brightness -> movement controller for live frame streams.
+
+Frames come from a video file, an image folder or a local TCP socket
+standing in for a camera, and flow through an asyncio pipeline
+
+    source -> decode -> retina brightness -> movement
+
+Stages are connected by one-frame slots instead of queues: when a later
+stage falls behind, the frame waiting for it is replaced by the newer
+one (counted as dropped), so the controller always works on the freshest
+frame. Frames that are already older than the latency budget when
+processing starts are skipped as late. Decoding and the brightness
+operator (vision_brightness) run in worker threads, so the event loop
+keeps receiving frames meanwhile.
+
+Each movement is emitted with its capture and emit timestamps; at the
+end (or on Ctrl-C) p50/p99 end-to-end latency and frame counts are
+reported.
+
+Usage:
+    python vision_stream_controller.py --source footage.mp4
+    python vision_stream_controller.py --source ./raw_frames --fps 60 --output movements.jsonl
+    # camera stand-in: listen, then stream a video into the socket
+    python vision_stream_controller.py --source tcp://127.0.0.1:5555
+    python vision_stream_controller.py --send footage.mp4 --to 127.0.0.1:5555 --fps 30
+
+Socket frames are a 4-byte big-endian length followed by an encoded
+(e.g. JPEG) image.
+"""
+
+import argparse
+import asyncio
+import json
+import struct
+import sys
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, List, Optional
+
+import cv2
+import numpy as np
+
+from fly_vision_readJPG import is_video, list_frames
+from vision_brightness import (BrightnessOperator, eye_brightness_features,
+                               movement_from_brightness, steering_from_brightness)
+from vision_timing import timer
+
+_LENGTH = struct.Struct(">I")
+
+
+@dataclass
+class Frame:
+    index: int
+    capture_time: float      # time.monotonic() when the frame arrived
+    data: Any                # encoded bytes or a decoded BGR array
+
+
+# -------------------- Backpressure ----------------------
+class LatestSlot:
+    """
+    One-frame hand-off between two pipeline stages. put() never waits: an
+    item not yet taken is replaced and counted in `dropped`. put(None)
+    closes the slot; get() then returns the last item and None after it.
+    """
+    def __init__(self):
+        self._item = None
+        self._closed = False
+        self._ready = asyncio.Event()
+        self.received = 0
+        self.dropped = 0
+
+    def put(self, item):
+        if item is None:
+            self._closed = True
+        elif not self._closed:
+            self.received += 1
+            self.dropped += self._item is not None
+            self._item = item
+        self._ready.set()
+
+    async def get(self):
+        await self._ready.wait()
+        item, self._item = self._item, None
+        if not self._closed:
+            self._ready.clear()
+        return item
+
+
+# -------------------- Sources ----------------------
+async def _paced(frames, fps: float, out: LatestSlot):
+    """Puts frames into `out` at `fps` (as fast as read if fps <= 0)."""
+    period = 1.0 / fps if fps > 0 else 0.0
+    start = time.monotonic()
+    try:
+        index = 0
+        while True:
+            data = await asyncio.to_thread(next, frames, None)
+            if data is None:
+                break
+            if period:
+                await asyncio.sleep(max(start + index * period - time.monotonic(), 0))
+            out.put(Frame(index, time.monotonic(), data))
+            index += 1
+    finally:
+        out.put(None)
+
+
+def _video_frames(path: Path):
+    cap = cv2.VideoCapture(str(path))
+    try:
+        while True:
+            ok, frame = cap.read()
+            if not ok:
+                return
+            yield frame
+    finally:
+        cap.release()
+
+
+def _image_bytes(path: Path):
+    for image in list_frames(path):
+        yield image.read_bytes()
+
+
+async def file_source(path: Path, fps: Optional[float], out: LatestSlot):
+    """
+    Reads a video (decoded frames) or an image folder / single image
+    (encoded bytes) like a camera running at `fps`; a video's own rate by
+    default.
+    """
+    if is_video(path):
+        if fps is None:
+            cap = cv2.VideoCapture(str(path))
+            fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+            cap.release()
+        await _paced(_video_frames(path), fps, out)
+    else:
+        await _paced(_image_bytes(path), 30.0 if fps is None else fps, out)
+
+
+async def socket_source(host: str, port: int, out: LatestSlot):
+    """Serves one camera connection and passes on its encoded frames."""
+    connected = asyncio.get_running_loop().create_future()
+
+    async def handle(reader, writer):
+        index = 0
+        try:
+            while True:
+                (length,) = _LENGTH.unpack(await reader.readexactly(_LENGTH.size))
+                out.put(Frame(index, time.monotonic(), await reader.readexactly(length)))
+                index += 1
+        except asyncio.IncompleteReadError:
+            pass
+        finally:
+            writer.close()
+            if not connected.done():
+                connected.set_result(None)
+
+    server = await asyncio.start_server(handle, host, port)
+    print(f"Waiting for frames on {host}:{port}", file=sys.stderr)
+    try:
+        async with server:
+            await connected
+    finally:
+        out.put(None)
+
+
+async def send_frames(path: Path, host: str, port: int, fps: float, quality: int = 90):
+    """Camera stand-in: streams a video or image folder to a socket_source."""
+    if is_video(path):
+        frames = _video_frames(path)
+    else:
+        # Skip files OpenCV cannot read instead of failing in imencode
+        frames = (frame for frame in (cv2.imread(str(p)) for p in list_frames(path))
+                  if frame is not None)
+    _, writer = await asyncio.open_connection(host, port)
+    period = 1.0 / fps if fps > 0 else 0.0
+    start = time.monotonic()
+    try:
+        for index, frame in enumerate(frames):
+            data = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes()
+            if period:
+                await asyncio.sleep(max(start + index * period - time.monotonic(), 0))
+            writer.write(_LENGTH.pack(len(data)) + data)
+            await writer.drain()
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+
+# -------------------- Pipeline stages ----------------------
+@timer.timed("decode")
+def _decode(buf):
+    return cv2.imdecode(buf, cv2.IMREAD_COLOR)
+
+
+async def decode_stage(inp: LatestSlot, out: LatestSlot):
+    """Decodes encoded frames in a worker thread (decoded frames pass)."""
+    try:
+        while (frame := await inp.get()) is not None:
+            if isinstance(frame.data, (bytes, bytearray)):
+                buf = np.frombuffer(frame.data, dtype=np.uint8)
+                frame.data = await asyncio.to_thread(_decode, buf)
+                if frame.data is None:
+                    continue
+            out.put(frame)
+    finally:
+        out.put(None)
+
+
+@dataclass
+class ControllerStats:
+    latencies: List[float] = field(default_factory=list)
+    emitted: int = 0
+    warmup: int = 0
+    late: int = 0
+    over_budget: int = 0
+
+    def report(self, captured: int, dropped: int) -> str:
+        lines = [f"Frames: {captured} captured, {self.emitted} emitted, "
+                 f"{dropped} dropped (stale), {self.late} skipped (late), "
+                 f"{self.over_budget} emitted over budget, "
+                 f"{self.warmup} warm-up (not timed)"]
+        if self.latencies:
+            p50, p99 = np.percentile(np.array(self.latencies) * 1e3, [50, 99])
+            lines.append(f"Latency: p50 {p50:.2f} ms, p99 {p99:.2f} ms, "
+                         f"max {max(self.latencies) * 1e3:.2f} ms")
+        return "\n".join(lines)
+
+
+class BrightnessController:
+    """
+    Left/right mean eye brightness -> movement vector, with one
+    BrightnessOperator per frame shape (frames are BGR).
+    """
+    def __init__(self, retina, proportional: bool = True, interpolation=cv2.INTER_LINEAR):
+        self.retina = retina
+        self.proportional = proportional
+        self.interpolation = interpolation
+        self._features = eye_brightness_features(retina, mean=True)
+        self._operators = {}
+
+    def is_ready(self, shape) -> bool:
+        return shape in self._operators
+
+    def _operator(self, shape) -> BrightnessOperator:
+        if shape not in self._operators:
+            self._operators[shape] = BrightnessOperator(
+                self.retina, shape, self._features, self.interpolation, bgr=True)
+        return self._operators[shape]
+
+    def __call__(self, frame: np.ndarray):
+        with timer.span("operator_build" if not self.is_ready(frame.shape) else "brightness"):
+            left, right = (float(b) for b in self._operator(frame.shape)(frame))
+        if self.proportional:
+            return left, right, steering_from_brightness(left, right)
+        return left, right, movement_from_brightness(left, right)
+
+
+async def control_stage(inp: LatestSlot, controller: BrightnessController, budget: float,
+                        stats: ControllerStats, emit):
+    """Runs the controller on the freshest frames and emits movements."""
+    while (frame := await inp.get()) is not None:
+        # The first frame of a new shape builds its operator; it is emitted
+        # but kept out of the latency statistics
+        warmup = not controller.is_ready(frame.data.shape)
+        if not warmup and time.monotonic() - frame.capture_time > budget:
+            stats.late += 1
+            continue
+        left, right, movement = await asyncio.to_thread(controller, frame.data)
+        latency = time.monotonic() - frame.capture_time
+        timer.add("end_to_end", int(latency * 1e9))
+        stats.emitted += 1
+        if warmup:
+            stats.warmup += 1
+        else:
+            stats.latencies.append(latency)
+            stats.over_budget += latency > budget
+        emit({"frame": frame.index, "time": time.time(),
+              "latency_ms": round(latency * 1e3, 3),
+              "left": left, "right": right,
+              "movement": [float(m) for m in movement]})
+
+
+async def run_controller(source: str, controller: BrightnessController, budget: float,
+                         fps: Optional[float] = None, emit=print) -> ControllerStats:
+    """Runs the pipeline until the source ends (or is cancelled) and prints
+    the latency report."""
+    raw, decoded = LatestSlot(), LatestSlot()
+    if source.startswith("tcp://"):
+        host, port = source[len("tcp://"):].rsplit(":", 1)
+        produce = socket_source(host, int(port), raw)
+    else:
+        produce = file_source(Path(source), fps, raw)
+
+    stats = ControllerStats()
+    tasks = [asyncio.create_task(produce),
+             asyncio.create_task(decode_stage(raw, decoded)),
+             asyncio.create_task(control_stage(decoded, controller, budget, stats, emit))]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        print(stats.report(raw.received, raw.dropped + decoded.dropped), file=sys.stderr)
+    return stats
+
+
+# -------------------- Main ----------------------
+def main():
+    parser = argparse.ArgumentParser(
+        description="Streaming brightness -> movement controller with frame dropping.")
+    parser.add_argument("--source", default="test2.jpg",
+                        help="video file, image folder / image, or tcp://host:port")
+    parser.add_argument("--fps", type=float, default=None,
+                        help="source frame rate for files (0: as fast as possible; "
+                             "default: the video's rate, 30 for images)")
+    parser.add_argument("--budget-ms", type=float, default=50.0,
+                        help="end-to-end latency budget; older frames are skipped")
+    parser.add_argument("--steering", choices=("proportional", "sign"), default="proportional")
+    parser.add_argument("--output", type=Path, default=None,
+                        help="write movements as JSON lines here instead of stdout")
+    parser.add_argument("--send", type=Path, default=None,
+                        help="camera stand-in: stream this video / folder to --to")
+    parser.add_argument("--to", default="127.0.0.1:5555")
+    parser.add_argument("--timing", default=None,
+                        help="per-stage timing: .json / .csv path, or '-' to print")
+    args = parser.parse_args()
+
+    if args.send is not None:
+        host, port = args.to.rsplit(":", 1)
+        asyncio.run(send_frames(args.send, host, int(port), 30.0 if args.fps is None else args.fps))
+        return
+
+    from retina_cache import load_retina
+
+    if args.timing:
+        timer.enabled = True
+    controller = BrightnessController(load_retina(), args.steering == "proportional")
+    out = open(args.output, "w") if args.output else sys.stdout
+    try:
+        asyncio.run(run_controller(args.source, controller, args.budget_ms / 1e3, args.fps,
+                                   emit=lambda m: print(json.dumps(m), file=out)))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        if args.timing:
+            timer.export(args.timing)
+
+
+if __name__ == "__main__":
+    main()
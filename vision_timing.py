@@ -0,0 +1,194 @@
+"""
+vision_timing.py
+
+Per-stage timing for the vision pipeline.
+
+Stages are wrapped in spans (a context manager or a decorator) that
+record time.perf_counter_ns() durations per stage name, across any
+number of frames and threads. Summaries (count, total, mean, min, max,
+p50/p90/p99 and a log2-spaced histogram) can be printed or exported as
+JSON or CSV. A disabled timer hands out one shared no-op span, so the
+instrumentation can stay in the code.
+
+The module-level `timer` is configured from the VISION_TIMING
+environment variable: unset or empty disables it, "1" prints a summary
+at exit, and a path ending in .json or .csv writes one there at exit.
+
+Usage:
+    from vision_timing import timer
+
+    with timer.span("decode"):
+        frame = cv2.imread(path)
+
+    @timer.timed("retina")
+    def sample(frame): ...
+
+    VISION_TIMING=timing.json python fly_vision_JPG_Movement.py
+"""
+
+import atexit
+import csv
+import functools
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+# Histogram bucket i holds durations in [2**i, 2**(i + 1)) ns
+HISTOGRAM_BUCKETS = 40
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("_samples", "_start")
+
+    def __init__(self, samples):
+        self._samples = samples
+
+    def __enter__(self):
+        self._start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self._samples.append(time.perf_counter_ns() - self._start)
+        return False
+
+
+class StageTimer:
+    """
+    Collects span durations (ns) per stage name. Appends are thread-safe
+    under the GIL, so spans can be used from worker threads.
+    """
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._samples: Dict[str, List[int]] = {}
+
+    def span(self, name: str):
+        """Context manager timing one execution of stage `name`."""
+        if not self.enabled:
+            return _NULL_SPAN
+        samples = self._samples.get(name)
+        if samples is None:
+            samples = self._samples.setdefault(name, [])
+        return _Span(samples)
+
+    def timed(self, name: str = None):
+        """Decorator timing every call of a function as stage `name`
+        (its qualified name by default)."""
+        def decorate(fn):
+            stage = name or fn.__qualname__
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                with self.span(stage):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def add(self, name: str, duration_ns: int):
+        """Records a duration measured elsewhere."""
+        if self.enabled:
+            self._samples.setdefault(name, []).append(int(duration_ns))
+
+    def reset(self):
+        self._samples = {}
+
+    @property
+    def stages(self):
+        return list(self._samples)
+
+    # -------------------- Aggregation & export ----------------------
+    def summary(self) -> Dict[str, dict]:
+        """Per-stage statistics in milliseconds, in first-seen order."""
+        result = {}
+        for name, samples in list(self._samples.items()):
+            if not samples:
+                continue
+            ns = np.asarray(samples, dtype=np.int64)
+            p50, p90, p99 = np.percentile(ns, [50, 90, 99]) / 1e6
+            buckets = np.clip(np.log2(np.maximum(ns, 1)).astype(np.int64),
+                              0, HISTOGRAM_BUCKETS - 1)
+            result[name] = {
+                "count": int(ns.size),
+                "total_ms": float(ns.sum() / 1e6),
+                "mean_ms": float(ns.mean() / 1e6),
+                "min_ms": float(ns.min() / 1e6),
+                "p50_ms": float(p50),
+                "p90_ms": float(p90),
+                "p99_ms": float(p99),
+                "max_ms": float(ns.max() / 1e6),
+                "histogram_log2_ns": np.bincount(
+                    buckets, minlength=HISTOGRAM_BUCKETS).tolist(),
+            }
+        return result
+
+    def format_summary(self) -> str:
+        rows = self.summary()
+        if not rows:
+            return "No stages timed."
+        width = max(len(name) for name in rows)
+        total = sum(row["total_ms"] for row in rows.values())
+        lines = [f"{'stage':<{width}} {'count':>7} {'total ms':>10} {'share':>6} "
+                 f"{'mean ms':>9} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9}"]
+        for name, row in rows.items():
+            lines.append(f"{name:<{width}} {row['count']:>7} {row['total_ms']:>10.3f} "
+                         f"{row['total_ms'] / total:>6.1%} {row['mean_ms']:>9.3f} "
+                         f"{row['p50_ms']:>9.3f} {row['p99_ms']:>9.3f} {row['max_ms']:>9.3f}")
+        return "\n".join(lines)
+
+    def to_json(self, path):
+        with open(path, "w") as f:
+            json.dump({"histogram_bucket": "[2**i, 2**(i+1)) ns",
+                       "stages": self.summary()}, f, indent=2)
+
+    def to_csv(self, path):
+        """One row per stage; the histogram counts are columns h0..h39."""
+        rows = self.summary()
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            fields = ["count", "total_ms", "mean_ms", "min_ms", "p50_ms", "p90_ms",
+                      "p99_ms", "max_ms"]
+            writer.writerow(["stage", *fields,
+                             *(f"h{i}" for i in range(HISTOGRAM_BUCKETS))])
+            for name, row in rows.items():
+                writer.writerow([name, *(row[k] for k in fields), *row["histogram_log2_ns"]])
+
+    def export(self, target: str):
+        """Writes to a .json / .csv path, or prints the summary otherwise."""
+        suffix = Path(target).suffix.lower()
+        if suffix == ".json":
+            self.to_json(target)
+        elif suffix == ".csv":
+            self.to_csv(target)
+        else:
+            print(self.format_summary(), file=sys.stderr)
+
+
+def _timer_from_env() -> StageTimer:
+    target = os.environ.get("VISION_TIMING", "")
+    if target in ("", "0"):
+        return StageTimer(enabled=False)
+    shared = StageTimer()
+    atexit.register(shared.export, target)
+    return shared
+
+
+timer = _timer_from_env()